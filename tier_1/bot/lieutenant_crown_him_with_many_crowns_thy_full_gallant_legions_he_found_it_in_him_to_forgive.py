@@ -1,4 +1,6 @@
+import base64
 import sys
+import zlib
 import numpy as np
 
 from typing import Optional, NamedTuple
@@ -26,8 +28,24 @@ class State(NamedTuple):
     players: list[Player]
     agent: Player
 
+def decode_packed_map(line: str, H: int, W: int) -> np.ndarray:
+    """
+    The map when the judge packs it into one line (we ask for "packed"
+    after READY): the encoding and the base64 of the int8 cells.
+    """
+    encoding, data = line.split()
+    raw = base64.b64decode(data)
+    if encoding == 'zlib':
+        raw = zlib.decompress(raw)
+    return np.frombuffer(raw, dtype=np.int8).reshape(H, W).astype(int)
+
 def read_map() -> Circuit:
-    H, W, num_players = map(int, input().split())
+    # the capabilities the judge granted follow the numbers, judges that
+    # decline them send the rows
+    header = input().split()
+    H, W, num_players = map(int, header[:3])
+    if 'packed' in header[3:]:
+        return Circuit(decode_packed_map(input(), H, W), num_players)
     track = []
     for r_ind in range(H):
         row = list(map(int, input().split()))
@@ -139,7 +157,7 @@ def calculate_move(rng: np.random.Generator, state: State) -> tuple[int, int]:
             return (0, 0)
 
 def main():
-    print('READY', flush=True)
+    print('READY packed', flush=True)
     circuit = read_map()
     state: Optional[State] = State(circuit, [], None) # type: ignore
     rng = np.random.default_rng(seed=1)
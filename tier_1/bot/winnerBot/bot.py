@@ -5,9 +5,21 @@ from enemy import EnemyRacer
 from logger import get_logger
 import heapq
 import math
+import os
+import memory
 from multiprocessing import Pool
 from collections import deque
 
+# optional protocol features we ask the judge for after READY; we only rely on the ones it grants
+# (Track.GRANTED_CAPABILITIES), so that the bot still works with judges that decline them
+CAPABILITIES = ['series', 'packed']
+
+# snapshot the memory with tracemalloc every WINNERBOT_TRACEMALLOC turns (0 is
+# off), and save the report to WINNERBOT_TRACEMALLOC_FILE at the end; they are
+# environment variables since the bridge starts the bot without arguments.
+# Tracing slows the search down many times, give the judge a longer --timeout
+TRACEMALLOC_EVERY = int(os.environ.get('WINNERBOT_TRACEMALLOC', '0'))
+
 class Racer:
     track : Track
     ktm_exc : RaceCar
@@ -23,6 +35,7 @@ class Racer:
         self.enemies = []
         for i in range(0, self.track.PLAYERS_COUNT):
             self.enemies.append(EnemyRacer(i))
+        self.occupied = set()
         #self.logger = get_logger()
         self.way_behind = set()
         self.POSSIBLE_DIRECTIONS = [(i,j) for i in range(-1,2) for j in range(-1,2)]
@@ -84,9 +97,8 @@ class Racer:
         Returns:
             bool: True if the move is legal, false otherwise
         """
-        for enemy in self.enemies:
-            if enemy.x == pos[0] and enemy.y == pos[1]:
-                return False
+        if (pos[0], pos[1]) in self.occupied:
+            return False
         if not speed:
             speed = self.ktm_exc.get_speed()
         track = self.track.get_track()
@@ -281,12 +293,14 @@ class Racer:
                 return path_to_goal
                 
     
-    def race(self):
+    def race(self, memory_snapshots: memory.MemorySnapshots = None):
         last_plan = []
         failed = 0
         #timeout_seconds = 0.95
         #with Pool(processes=2) as pool:
         while self.ktm_exc.read_input():
+            if memory_snapshots is not None:
+                memory_snapshots.step()
             self.update_enemy_pos()
             '''
             res1 = pool.apply_async(self.a_star_variable_speeds, [])
@@ -333,17 +347,30 @@ class Racer:
 
     
     def update_enemy_pos(self):
-        """Updates all the enemies positions
+        """Updates all the enemies positions and the set of occupied cells
         """
         for enemy in self.enemies:
             enemy.read_input()
+        self.occupied = {(enemy.x, enemy.y) for enemy in self.enemies}
     
 def main():
-    my_glorious_racer = Racer()
-    my_glorious_racer.race()
+    memory_snapshots = None
+    if TRACEMALLOC_EVERY > 0:
+        memory_snapshots = memory.MemorySnapshots(TRACEMALLOC_EVERY)
+        memory_snapshots.start()
+    # the judge may run a series of races, we start over after each reset
+    while True:
+        my_glorious_racer = Racer()
+        my_glorious_racer.race(memory_snapshots)
+        if not my_glorious_racer.ktm_exc.next_race:
+            break
+    if memory_snapshots is not None:
+        memory_snapshots.stop()
+        memory_snapshots.dump(os.environ.get(
+            'WINNERBOT_TRACEMALLOC_FILE', f'winnerbot_memory.{os.getpid()}.txt'))
         
 if __name__=='__main__':
-    print('READY', flush=True)  
+    print('READY ' + ' '.join(CAPABILITIES), flush=True)  
     main()        
         
     
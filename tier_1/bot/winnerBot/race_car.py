@@ -4,17 +4,23 @@ class RaceCar:
     y_pos: int
     speed_vertical: int
     speed_horizontal: int
+    next_race: bool
     
     def __init__(self):
         self.x_pos = 0
         self.y_pos = 0
         self.speed_vertical = 0
         self.speed_horizontal = 0
+        self.next_race = False
     
     def read_input (self):
         judge_input = input()
         if judge_input == '~~~END~~~':
             return False
+        if judge_input == '~~~RESET~~~':
+            # next race of the series begins, the racer has to start over
+            self.next_race = True
+            return False
         self.x_pos, self.y_pos, self.speed_horizontal, self.speed_vertical = map(int, judge_input.split(' '))
         return True
         
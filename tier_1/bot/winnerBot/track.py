@@ -1,10 +1,26 @@
+import base64
+import zlib
 import numpy as np
+
+
+def decode_packed_track(line: str, height: int, width: int) -> np.ndarray:
+    """Decodes the packed track the judge sends instead of the rows when it grants the 'packed' capability:
+    the encoding ("int8" or "zlib") and the base64 of the row-major int8 cell values.
+    """
+    encoding, data = line.split()
+    raw = base64.b64decode(data)
+    if encoding == 'zlib':
+        raw = zlib.decompress(raw)
+    return np.frombuffer(raw, dtype=np.int8).reshape(height, width).astype(int)
+
+
 class Track:
     
     TRACK_WIDTH: int
     TRACK_HEIGHT: int
     PLAYERS_COUNT: int
     TRACK_MAXIMUM_DISTANCE: int
+    GRANTED_CAPABILITIES: set[str]
     map: np.ndarray
     goal_positions: np.ndarray
     start_position: tuple[int,int]
@@ -15,12 +31,18 @@ class Track:
         self.TRACK_MAXIMUM_DISTANCE = self.TRACK_HEIGHT * self.TRACK_WIDTH
     
     def __read_track(self) -> np.ndarray:
-        self.TRACK_HEIGHT, self.TRACK_WIDTH, self.PLAYERS_COUNT = map(int, input().split()) 
+        # the capabilities the judge granted follow the numbers (none from judges that decline them)
+        height, width, players, *granted = input().split()
+        self.TRACK_HEIGHT, self.TRACK_WIDTH, self.PLAYERS_COUNT = map(int, (height, width, players))
+        self.GRANTED_CAPABILITIES = set(granted)
+        if 'packed' in self.GRANTED_CAPABILITIES:
+            return decode_packed_track(input(), self.TRACK_HEIGHT, self.TRACK_WIDTH)
         raw_race_track = []
         for _ in range(self.TRACK_HEIGHT):
             row = list(map(int, input().split()))
             raw_race_track.append(row)
         return np.array(raw_race_track)    
+
         
     def __collect_goal_positions(self) -> np.ndarray:
         return np.argwhere(self.map == 100)
@@ -0,0 +1,155 @@
+"""
+Memory profiling with ``tracemalloc``: snapshots every few turns, and a
+report of the allocation sites that grew the most between them and of the
+peak traced memory. Used by the judge (``--profile tracemalloc``) and by
+winnerBot (its ``WINNERBOT_TRACEMALLOC`` environment variable).
+
+This file is shared by the judge and winnerBot, keep the copies identical.
+"""
+import threading
+import tracemalloc
+
+from typing import Optional
+
+#: default number of turns between the snapshots
+SNAPSHOT_EVERY = 100
+#: number of allocation sites listed per diff in the report
+TOP = 10
+
+# the allocations of the import machinery, of tracemalloc and of the report
+# itself are noise
+_FILTERS = [
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+# ``tracemalloc`` traces the whole process: it is started by the first
+# ``MemorySnapshots`` and stopped by the last one (unless it was started
+# before, e.g. by PYTHONTRACEMALLOC)
+_users = 0
+_started_tracing = False
+_lock = threading.Lock()
+
+def _start_tracing(frames: int) -> None:
+    global _users, _started_tracing  # pylint: disable=global-statement
+    with _lock:
+        if _users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _started_tracing = True
+        _users += 1
+
+def _stop_tracing() -> None:
+    global _users, _started_tracing  # pylint: disable=global-statement
+    with _lock:
+        _users -= 1
+        if _users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+def _mib(size: int) -> str:
+    return f'{size / 2**20:.1f} MiB'
+
+class MemorySnapshots:
+    """
+    Takes a snapshot every ``every`` turns between ``start`` and ``stop``,
+    and keeps the ``top`` allocation sites (with ``frames`` frames of
+    traceback) that changed the most since the previous snapshot and, at
+    ``stop``, since ``start``; and the peak traced memory in between. Only
+    the first and the last snapshots are kept in memory.
+
+    The allocations of all the threads are traced, and the peak is shared
+    with the other ``MemorySnapshots`` of the process.
+    """
+
+    def __init__(self,
+                 every: int = SNAPSHOT_EVERY,
+                 top: int = TOP,
+                 frames: int = 1):
+        self.every = every
+        self.top = top
+        self.frames = frames
+        #: peak traced memory (in bytes) over all the snapshots
+        self.peak = 0
+        #: the report lines of every diff
+        self.diffs: list[list[str]] = []
+        self._first: Optional[tracemalloc.Snapshot] = None
+        self._last: Optional[tracemalloc.Snapshot] = None
+        self._first_turn = 0
+        self._last_turn = 0
+        self._turn = 0
+
+    def start(self, turn: int = 0) -> None:
+        _start_tracing(self.frames)
+        tracemalloc.reset_peak()
+        self._first = self._last = self._take()
+        self._first_turn = self._last_turn = self._turn = turn
+
+    def turn(self, turn: int) -> None:
+        """
+        Tell the current turn, a snapshot is taken every ``every`` turns
+        """
+        self._turn = turn
+        if self._last is not None and turn - self._last_turn >= self.every:
+            self._snapshot(turn)
+
+    def step(self) -> None:
+        """
+        Count one more turn, for the callers that do not count the turns
+        """
+        self.turn(self._turn + 1)
+
+    def stop(self) -> None:
+        if self._first is None or self._last is None:
+            return
+        first, first_turn = self._first, self._first_turn
+        if self._turn != self._last_turn:
+            self._snapshot(self._turn)
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        self.diffs.append(
+            self._diff(f'Turns {first_turn} to {self._turn} (overall)',
+                       first, self._last))
+        self._first = self._last = None
+        _stop_tracing()
+
+    def _take(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+    def _snapshot(self, turn: int) -> None:
+        assert self._last is not None
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.peak = max(self.peak, peak)
+        snapshot = self._take()
+        self.diffs.append(
+            self._diff(
+                f'Turns {self._last_turn} to {turn}: {_mib(current)} '
+                f'traced, peak {_mib(peak)}', self._last, snapshot))
+        self._last, self._last_turn = snapshot, turn
+
+    def _diff(self, title: str, old: tracemalloc.Snapshot,
+              new: tracemalloc.Snapshot) -> list[str]:
+        key_type = 'traceback' if self.frames > 1 else 'lineno'
+        stats = new.compare_to(old, key_type)[:self.top]
+        lines = [title]
+        for stat in stats:
+            if key_type == 'traceback':
+                lines.append(f'    {stat.size_diff:+} B, {stat.count_diff:+} '
+                             'blocks, allocated at:')
+                lines += [f'        {frame}' for frame in stat.traceback]
+            else:
+                lines.append(f'    {stat}')
+        return lines
+
+    def report(self) -> str:
+        lines = [f'Peak traced memory: {_mib(self.peak)}']
+        for diff in self.diffs:
+            lines += diff
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        # no print: the stdout of the bots is their channel to the judge
+        with open(path, 'w') as f:
+            f.write(self.report())
@@ -1,5 +1,8 @@
+import base64
 import itertools
-from pprint import pprint
+import time
+import zlib
+from pprint import pformat
 import numpy as np
 import grid_race_env
 import judge
@@ -10,6 +13,9 @@ from typing import Optional, Callable
 class GridRaceEnv(judge.EnvironmentBase):
 
     INVALID_ACTION_PENALTY = 5
+    #: capability of bots that want the track packed in the initial
+    #: observation, see ``initial_observation``
+    PACKED_CAPABILITY = 'packed'
 
     def __init__(self,
                  num_players: int,
@@ -19,32 +25,72 @@ class GridRaceEnv(judge.EnvironmentBase):
         self.max_turns = max_turns
         self.circuit = circuit
         self._player_names = None
+        self._packed_players: set[int] = set()
         for _ in range(num_players):
             self.circuit.add_new_player()
+        to_int = np.vectorize(lambda c: c.value)
+        self._track_int = to_int(self.circuit.track)
+        # shared by the replays of all races, they are only serialised
+        self._replay_track = self._track_int.tolist()
+        self._packed_track = self._pack_track(self._track_int)
+        self._track_rows = '\n'.join(
+            ' '.join(map(str, r)) for r in self._replay_track)
+
+    @staticmethod
+    def _pack_track(track_int: np.ndarray) -> str:
+        """
+        The track as one line: the encoding ("int8" or "zlib") and the base64
+        of the row-major int8 cell values, zlib-compressed with the "zlib"
+        encoding. Compression is used only if it makes the line shorter.
+        """
+        raw = track_int.astype(np.int8).tobytes()
+        compressed = zlib.compress(raw)
+        if len(compressed) < len(raw):
+            return 'zlib ' + base64.b64encode(compressed).decode('ascii')
+        return 'int8 ' + base64.b64encode(raw).decode('ascii')
+
+    def set_capabilities(self, capabilities: list[frozenset[str]]) -> None:
+        self._packed_players = {
+            p for p, c in enumerate(capabilities)
+            if self.PACKED_CAPABILITY in c
+        }
 
     def reset(self, player_names: Optional[list[str]] = None) -> str:
         self._player_names = player_names
         self.circuit.reset_players()
+        self.circuit.counters = (self.metrics.counters
+                                 if self.metrics is not None else None)
         # score for not finishing is max turns + 1
         self.scores = [self.max_turns + 1] * self.num_players
         self.turns = 0
         self.penalties = [None for _ in range(self.num_players)]
         # extra player signalling end of turn
         self.players_iterator = itertools.cycle(range(self.num_players + 1))
-        to_int = np.vectorize(lambda c: c.value)
-        track_int = to_int(self.circuit.track)
         self.replay = replay.Replay(
             env_info=replay.EnvInfo(
-                track=track_int.tolist(),
+                track=self._replay_track,
                 num_players=self.num_players,
                 player_names=self._player_names),
             states=[],
             steps=[])
         self.replay.states.append(self._save_state())
         # Return observation
-        obs = '\n'.join([' '.join(str(a) for a in r) for r in track_int])
         return (f'{self.circuit.shape[0]} {self.circuit.shape[1]} '
-                f'{self.num_players}\n{obs}')
+                f'{self.num_players}\n{self._track_rows}')
+
+    def initial_observation(self, player: int, observation: str) -> str:
+        """
+        Players with the ``PACKED_CAPABILITY`` get a single line (see
+        ``_pack_track``) instead of the rows of the track. The capabilities
+        granted to ``player`` are listed after the numbers of the first line,
+        so that its bot knows which observations it gets (judges that do not
+        grant them send the numbers only).
+        """
+        if player not in self._packed_players:
+            return observation
+        return (f'{self.circuit.shape[0]} {self.circuit.shape[1]} '
+                f'{self.num_players} {self.PACKED_CAPABILITY}\n'
+                f'{self._packed_track}')
 
     @property
     def player_names(self):
@@ -54,8 +100,20 @@ class GridRaceEnv(judge.EnvironmentBase):
         """
         Saves a step, and immediately saves the resulting state as well.
         """
+        tick = time.perf_counter()
         self.replay.steps.append(step)
         self.replay.states.append(self._save_state())
+        if self.metrics is not None:
+            self.metrics.record('replay', step.player_ind,
+                                time.perf_counter() - tick)
+
+    def _reply_timing(self) -> dict[str, Optional[float]]:
+        """
+        The timing of the current player's reply, for its ``PlayerStep``
+        """
+        if self.reply_timing is None:
+            return {}
+        return self.reply_timing._asdict()
 
     def _save_state(self) -> replay.State:
         players = [
@@ -81,7 +139,8 @@ class GridRaceEnv(judge.EnvironmentBase):
                 if next_player == self.num_players:
                     self.turns += 1
                     if self.turns >= self.max_turns:
-                        print(f'Reached max turn limit ({self.turns}).')
+                        print(f'{self.log_prefix}Reached max turn limit '
+                              f'({self.turns}).')
                         return None
                     # skip the sentinel player indicating turn's end
                     continue
@@ -168,15 +227,16 @@ class GridRaceEnv(judge.EnvironmentBase):
         else:
             player_name = current_player
         if not disqualified:
-            print(f'Yoohoo! Player {player_name} sent something naughty! '
-                  'I will pretend it didn\'t happen, but they may be '
-                  'disqualified in the future.')
+            print(f'{self.log_prefix}Yoohoo! Player {player_name} sent '
+                  'something naughty! I will pretend it didn\'t happen, but '
+                  'they may be disqualified in the future.')
         self._save_step(
             replay.PlayerStep(
                 current_player,
                 status='Disqualified'
                 if disqualified else 'Invalid input or timeout.',
-                success=False))
+                success=False,
+                **self._reply_timing()))
 
     def step(self, current_player: int,
              player_input: judge.PlayerInput) -> None:
@@ -188,7 +248,11 @@ class GridRaceEnv(judge.EnvironmentBase):
         try:
             self.circuit.move_player(current_player, np.array([dx, dy]))
             player_step = replay.PlayerStep(
-                current_player, success=True, dx=dx, dy=dy)
+                current_player,
+                success=True,
+                dx=dx,
+                dy=dy,
+                **self._reply_timing())
         except grid_race_env.InvalidMove:
             # Penalty and set velocity to 0
             self.penalties[current_player] = self.INVALID_ACTION_PENALTY
@@ -196,7 +260,8 @@ class GridRaceEnv(judge.EnvironmentBase):
             player_step = replay.PlayerStep(
                 current_player,
                 success=False,
-                status=f'Invalid move: ({dx}, {dy}).')
+                status=f'Invalid move: ({dx}, {dy}).',
+                **self._reply_timing())
         if self.circuit.player_won(current_player):
             self.scores[current_player] = self.turns
         self._save_step(player_step)
@@ -211,21 +276,56 @@ class GridRaceEnv(judge.EnvironmentBase):
     def num_players(self):
         return self._num_players
 
-def run_judge():
-    app = judge.App('Grid Race Level 1')
-    options = app.options
-    circuit = grid_race_env.load_track_from_file(options['track_file'])
-    env = GridRaceEnv(options['num_players'], circuit, options['max_turns'])
-    scores = app.run_environment(env, print_replay_times=True)
+def create_environment(options: dict,
+                       circuit: grid_race_env.Circuit) -> GridRaceEnv:
+    return GridRaceEnv(options['num_players'], circuit, options['max_turns'])
+
+def report_results(app: judge.App,
+                   env: GridRaceEnv,
+                   scores: list[int | float],
+                   match_id: Optional[str] = None,
+                   prefix: str = '') -> None:
+    """
+    ``prefix`` the printed scores, e.g., with ``judge.log_prefix``
+    """
     if env.player_names:
-        print('Final scores:')
-        pprint(dict(zip(env.player_names, scores)), sort_dicts=False)
+        print(prefix + 'Final scores:\n' + '\n'.join(
+            prefix + line for line in pformat(
+                dict(zip(env.player_names, scores)),
+                sort_dicts=False).splitlines()))
     else:
-        print('Final scores:', scores)
+        print(f'{prefix}Final scores:', scores)
     if app.create_replay:
-        with app.replay_file() as f:
+        with app.replay_file(match_id) as f:
             replay.serialise(env.replay, f)
-    app.write_output(scores)
+    app.write_output(scores, match_id)
+
+def run_judge():
+    app = judge.App('Grid Race Level 1')
+    options = app.options
+    if app.serve:
+        circuit = grid_race_env.load_track_from_file(options['track_file'])
+        # Every match gets its own ``Circuit`` (players are mutable), but the
+        # loaded track is shared between them
+        def match_finished(match_id: str, runner: judge.EnvironmentRunner,
+                           scores: list[int | float]) -> None:
+            app.print_reply_times(runner, True)
+            report_results(app, runner.env, scores, match_id,
+                           judge.log_prefix(match_id))
+
+        app.serve_environments(
+            lambda: create_environment(options, type(circuit)()),
+            match_finished)
+        return
+    # Loading the track and the precomputations of the environment overlap
+    # with waiting for the players to connect
+    env = judge.prepare_in_background(lambda: create_environment(
+        options, grid_race_env.load_track_from_file(options['track_file'])))
+    app.run_environment(
+        env,
+        print_replay_times=True,
+        race_finished=lambda race_id, scores: report_results(
+            app, env.result(), scores, race_id))
 
 if __name__ == "__main__":
     run_judge()
@@ -0,0 +1,181 @@
+"""
+Plays every combination of the bots (``--players`` of them per match) with
+``run.py --bots``, ``--parallel`` matches at once. Every match is pinned to
+its own set of CPUs, disjoint from the others (see the ``--cpus`` options of
+the judge and of client_bridge.py), so that the bots of different matches do
+not compete for the cores, and the reply times (and the timeouts) do not
+depend on how many matches run at once.
+
+Run from the directory of the tier, e.g.:
+``python judge/tournament.py judge/sample_config.json bot/winnerBot/bot.py
+bot/other_bot.py --parallel 2``
+"""
+import os
+import sys
+import json
+import queue
+import shlex
+import argparse
+import itertools
+import subprocess
+import concurrent.futures
+
+from typing import NamedTuple, Optional
+
+RUN_JUDGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run.py')
+
+class Match(NamedTuple):
+    index: int
+    bots: tuple[str, ...]
+
+def allocate_cpus(cpus: list[int], parallel: int) -> list[list[int]]:
+    """
+    Split ``cpus`` into ``parallel`` disjoint sets of the same size
+    (neighbouring CPUs together, the CPUs left over are not used)
+    """
+    size = len(cpus) // parallel
+    if size == 0:
+        raise ValueError(f'Cannot run {parallel} matches on {len(cpus)} '
+                         'CPUs.')
+    cpus = sorted(cpus)
+    return [cpus[i * size:(i+1) * size] for i in range(parallel)]
+
+def bot_cpus(cpus: list[int], num_bots: int) -> Optional[list[list[int]]]:
+    """
+    The CPUs of each bot of a match running on ``cpus``: the first one is
+    left to the judge and the bridge, the others are shared out between the
+    bots. ``None`` if there are not enough CPUs, then everything shares them.
+    """
+    if len(cpus) < num_bots + 1:
+        return None
+    per_bot = (len(cpus) - 1) // num_bots
+    return [cpus[1 + i * per_bot:1 + (i+1) * per_bot] for i in range(num_bots)]
+
+def format_cpus(cpus: list[int]) -> str:
+    return ','.join(str(cpu) for cpu in cpus)
+
+def run_match(match: Match, cpus: list[int], args: argparse.Namespace) -> list:
+    """
+    Run the match on ``cpus``, return its scores
+    """
+    prefix = os.path.join(args.output_dir, f'match_{match.index}')
+    bridge_args = shlex.split(args.bridge_args)
+    cpus_of_bots = bot_cpus(cpus, len(match.bots))
+    for cpus_of_bot in cpus_of_bots or []:
+        bridge_args += ['--cpus', format_cpus(cpus_of_bot)]
+    # the judge and the bridge (which inherits the affinity of the judge)
+    # keep off the CPUs of the bots
+    judge_cpus = cpus if cpus_of_bots is None else cpus[:1]
+    command = [
+        sys.executable, RUN_JUDGE, args.config_file,
+        str(len(match.bots)), '--bots', ';'.join(match.bots),
+        '--output_file', f'{prefix}.json', '--metrics_file',
+        f'{prefix}.metrics.json', '--cpus', format_cpus(judge_cpus),
+        '--bridge_args', shlex.join(bridge_args), *shlex.split(args.judge_args)
+    ]
+    with open(f'{prefix}.log', 'w') as log:
+        subprocess.run(command,
+                       stdout=log,
+                       stderr=subprocess.STDOUT,
+                       check=True)
+    with open(f'{prefix}.json', 'r') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Play every combination of the bots, several matches at '
+        'once, each on its own CPUs.')
+    parser.add_argument('config_file',
+                        type=str,
+                        help='Path to the environment config file.')
+    parser.add_argument('bots', nargs='+', help='Bot executables.')
+    parser.add_argument('--players',
+                        type=int,
+                        default=2,
+                        help='Number of players per match. Default is 2.')
+    parser.add_argument(
+        '--parallel',
+        type=int,
+        default=1,
+        help='Number of matches to run at once. The available CPUs are split '
+        'between them evenly. Default is 1.')
+    parser.add_argument(
+        '--output_dir',
+        type=str,
+        default='tournament',
+        help='Directory to save the output, the metrics and the log of every '
+        'match, and the summary to. Default is tournament.')
+    parser.add_argument(
+        '--judge_args',
+        type=str,
+        default='',
+        help='More options of run.py, e.g. "--timeout_on_compute". '
+        'Optional.')
+    parser.add_argument(
+        '--bridge_args',
+        type=str,
+        default='',
+        help='Options of client_bridge.py, e.g. "--memory_limit 1024 '
+        '--nice 5". The CPUs of the bots are set by the tournament. '
+        'Optional.')
+    args = parser.parse_args()
+    if len(set(args.bots)) != len(args.bots):
+        parser.error('Every bot should be given once.')
+    matches = [
+        Match(i, bots) for i, bots in enumerate(
+            itertools.combinations(args.bots, args.players))
+    ]
+    if not matches:
+        parser.error(f'Not enough bots for {args.players} players.')
+    os.makedirs(args.output_dir, exist_ok=True)
+    free_cpus: queue.Queue[list[int]] = queue.Queue()
+    try:
+        cpu_sets = allocate_cpus(list(os.sched_getaffinity(0)), args.parallel)
+    except ValueError as e:
+        parser.error(str(e))
+    for cpus in cpu_sets:
+        free_cpus.put(cpus)
+
+    def play(match: Match) -> list:
+        cpus = free_cpus.get()
+        try:
+            scores = run_match(match, cpus, args)
+        finally:
+            free_cpus.put(cpus)
+        print(f'Match {match.index} on CPUs {format_cpus(cpus)}: '
+              f'{dict(zip(match.bots, scores))}')
+        return scores
+
+    results: dict[str, list] = {bot: [] for bot in args.bots}
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(args.parallel) as executor:
+        futures = {executor.submit(play, match): match for match in matches}
+        for future in concurrent.futures.as_completed(futures):
+            match = futures[future]
+            try:
+                scores = future.result()
+            except (subprocess.CalledProcessError, OSError, ValueError) as e:
+                print(f'Match {match.index} failed: {e}')
+                failed.append(match.index)
+                continue
+            for bot, score in zip(match.bots, scores):
+                results[bot].append(score)
+    standings = sorted(
+        ({
+            'bot': bot,
+            'matches': len(scores),
+            'mean_score': sum(scores) / len(scores) if scores else None
+        } for bot, scores in results.items()),
+        key=lambda s: (s['mean_score'] is None, s['mean_score']))
+    # the scores are the turns it took to finish, lower is better
+    print('Standings:')
+    for standing in standings:
+        print(f'{standing["bot"]}: {standing["mean_score"]} '
+              f'({standing["matches"]} matches)')
+    path = os.path.join(args.output_dir, 'summary.json')
+    print(f'Saving summary to {path}.')
+    with open(path, 'w') as f:
+        json.dump({'standings': standings, 'failed_matches': failed}, f)
+
+if __name__ == "__main__":
+    main()
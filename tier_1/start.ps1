@@ -19,18 +19,25 @@ if ($replay_flag -eq "--replay") {
     $replay_arg = "--replay_file ./last_replay"
 }
 
-Start-Process -FilePath "python" -ArgumentList "$($workdir)run.py", $config_file, $player_num, $replay_arg -NoNewWindow
-
-Start-Sleep -Seconds 3
+$ready_file = "$($workdir).judge_ready"
+Remove-Item $ready_file -ErrorAction SilentlyContinue
+$judge = Start-Process -FilePath "python" -ArgumentList "$($workdir)run.py", $config_file, $player_num, $replay_arg, "--ready_file", $ready_file -NoNewWindow -PassThru
+
+# Wait until the judge accepts connections
+while (-not (Test-Path $ready_file)) {
+    if ($judge.HasExited) {
+        Write-Host "The judge exited before accepting connections."
+        exit 1
+    }
+    Start-Sleep -Milliseconds 50
+}
+Remove-Item $ready_file
 Write-Host "starting players"
 
-Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/bot.py" -NoNewWindow
-Start-Sleep -Seconds 1
-Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/winnerBot/bot.py" -NoNewWindow
-Start-Sleep -Seconds 1
-Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/my_bot.py" -NoNewWindow
-Start-Sleep -Seconds 1
-Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/mybot2.0.py" -NoNewWindow
+Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/bot.py", "--player_name", "foreign_bot" -NoNewWindow
+Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/winnerBot/bot.py", "--player_name", "winnerBot" -NoNewWindow
+Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/my_bot.py", "--player_name", "my_bot" -NoNewWindow
+Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/foreign_competitors/mybot2.0.py", "--player_name", "mybot2.0" -NoNewWindow
 
 
 # Wait for judge process to complete
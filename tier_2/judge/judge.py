@@ -1,10 +1,24 @@
+import os
+import sys
 import socket
+import subprocess
 import argparse
+import shlex
 import time
 import json
 import contextlib
+import collections
+import threading
+import concurrent.futures
 import network
-from pprint import pprint
+import resources
+from metrics import Metrics, MetricsWriter
+import memory
+import profiling
+from profiling import Profiler, Profiling
+import tracing
+from tracing import Tracer
+from pprint import pformat
 import numpy as np
 
 from typing import Any, Optional, Callable, NamedTuple, Literal
@@ -14,22 +28,85 @@ PlayerInput = Any
 #: number of strikes before the player is disqualified (communications stop)
 PLAYER_MAX_STRIKES = 5
 
+#: bridge started by ``launch_bridges`` unless told otherwise
+DEFAULT_BRIDGE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'bot',
+    'client_bridge.py')
+
+#: printed (and flushed) once the judge accepts connections, see
+#: ``signal_ready``
+READY_MESSAGE = 'Judge is ready.'
+
+#: called with the match id, the runner and the scores when a match of
+#: ``MatchServer`` ends
+MatchFinishedCallback = Callable[[str, 'EnvironmentRunner', list[int | float]],
+                                 None]
+#: called with the race id and the scores when a race of ``App`` ends
+RaceFinishedCallback = Callable[[Optional[str], list[int | float]], None]
+
+class ReplyTiming(NamedTuple):
+    """
+    Timing (in seconds) of a player's reply: from the start of sending the
+    observation to the end of reading and parsing the reply (timeouts
+    included), and the compute time of the bot and the transport, the rest
+    of the reply time (``None`` unless the bridge sends the compute time)
+    """
+    reply_time: float
+    compute_time: Optional[float] = None
+    transport_time: Optional[float] = None
+
 class EnvironmentBase:
     """
     Concrete environments should subclass these, implementing ``reset``,
     ``next_player``, ``observation``, ``read_player_input`` and ``step``.
 
-    A note on observations: there is a reserved string: "~~~END~~~" (in its own
-    line), that is used to signal the end of the game. Environments must not
-    use this in observations.
+    A note on observations: there are reserved strings: "~~~END~~~" and
+    "~~~RESET~~~" (in their own line), that are used to signal the end of the
+    game and the start of the next race of a series. Environments must not use
+    these in observations.
+
+    In a series, ``reset`` is called again before every race; it should
+    restore the initial state of the environment.
     """
 
+    #: set by ``EnvironmentRunner`` before ``reset`` if the judge collects
+    #: metrics; the environment records the "replay" phase and may count its
+    #: hot paths in ``Metrics.counters``
+    metrics: Optional[Metrics] = None
+    #: set by ``EnvironmentRunner`` before ``step`` and
+    #: ``invalid_player_input``: the timing of the reply being applied
+    #: (``None`` if the player is disqualified), e.g. for the replay
+    reply_timing: Optional[ReplyTiming] = None
+    #: set by ``EnvironmentRunner`` before ``reset``: the prefix of the
+    #: output of the environment (see ``log_prefix``)
+    log_prefix = ''
+
     def __init__(self, num_players: int):
         self._num_players = num_players
 
     def reset(self, player_names: Optional[list[str]] = None) -> str:
         raise NotImplementedError()
 
+    def set_capabilities(self, capabilities: list[frozenset[str]]) -> None:
+        """
+        Called before ``reset`` with the optional protocol features each
+        player's bot announced (empty for players that are not connected).
+        Environments may switch to a different observation format for the
+        players that support it.
+
+        Default is to ignore them.
+        """
+
+    def initial_observation(self, player: int, observation: str) -> str:
+        """
+        The initial observation sent to ``player``, ``observation`` is what
+        ``reset`` returned. Environments may encode it differently for the
+        players that support it (see ``set_capabilities``).
+
+        Default is ``observation``.
+        """
+        return observation
+
     def next_player(self, current_player: Optional[int]) -> Optional[int]:
         """
         Calculate the index of the next player, return ``None`` if the game is
@@ -94,53 +171,209 @@ class EnvironmentBase:
         return self._num_players
 
 class ClientInfo(NamedTuple):
-    socket: socket.socket
+    connection: network.Connection
     address_host: str
     address_port: int
     player_name: Optional[str] = None
     strikes: int = 0
+    #: optional protocol features the bot announced (see ``client_bridge.py``)
+    capabilities: frozenset[str] = frozenset()
 
     @property
     def disqualified(self):
         return self.strikes >= PLAYER_MAX_STRIKES
 
+def signal_ready(ready_file: Optional[str], address: Optional[str]) -> None:
+    """
+    Tell whoever started the judge that it accepts connections now: print
+    ``READY_MESSAGE``, and create ``ready_file`` (if given) containing the
+    address to connect to. The file is renamed into place, so it never
+    appears half-written.
+    """
+    print(READY_MESSAGE, flush=True)
+    if ready_file:
+        tmp_file = ready_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write((address or f'localhost:{network.JUDGE_PORT}') + '\n')
+        os.replace(tmp_file, ready_file)
+
+def prepare_in_background(
+        prepare: Callable[[], EnvironmentBase]
+) -> concurrent.futures.Future[EnvironmentBase]:
+    """
+    Start ``prepare`` (e.g., loading the track and creating the environment)
+    in a background thread. The returned future can be given to
+    ``EnvironmentRunner`` in place of the environment, so that the
+    preparation overlaps with waiting for the players to connect.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix='prepare')
+    future = executor.submit(prepare)
+    # the thread exits once ``prepare`` is done
+    executor.shutdown(wait=False)
+    return future
+
+def accept_handshake(connection: network.Connection,
+                     frame_format: str) -> dict[str, Any]:
+    """
+    Receive the ``hello`` of a bridge and answer it with the frame format to
+    use (``frame_format`` if the bridge supports it, JSON otherwise). The
+    connection uses the chosen format from then on.
+
+    Returns the ``hello`` message.
+    """
+    hello = connection.recv_handshake()
+    hello_clock = tracing.clock()
+    chosen = network.choose_format(hello, frame_format)
+    # the bridges align the clocks of their traces with it, and send the
+    # compute time of the bots with their replies and their resource usage
+    connection.send_control('welcome',
+                            format=chosen,
+                            hello_clock=hello_clock,
+                            clock=tracing.clock(),
+                            timings=True,
+                            resources=True)
+    connection.binary = chosen == network.FORMAT_BINARY
+    return hello
+
+def log_prefix(match_id: Optional[str]) -> str:
+    """
+    Prefix of the output about the match ``match_id``, if it is one of
+    several
+    """
+    return '' if match_id is None else f'[{match_id}] '
+
 class PlaceholderClientInfo(NamedTuple):
     """
     A client that is not connected
     """
     player_name: Optional[str] = None
     disqualified: bool = True
+    capabilities: frozenset[str] = frozenset()
 
 class EnvironmentRunner:
 
     def __init__(self,
-                 environment: EnvironmentBase,
+                 environment: EnvironmentBase
+                 | concurrent.futures.Future[EnvironmentBase],
                  step_timeout: float,
                  connection_timeout: float,
                  client_addresses: Optional[list[str]] = None,
-                 player_names: Optional[list[str]] = None):
-        self.env = environment
+                 player_names: Optional[list[str]] = None,
+                 *,
+                 clients: Optional[list[ClientInfo
+                                        | PlaceholderClientInfo]] = None,
+                 address: Optional[str] = None,
+                 frame_format: str = network.FORMAT_BINARY,
+                 ready_file: Optional[str] = None,
+                 num_players: Optional[int] = None,
+                 metrics: Optional[Metrics] = None,
+                 profiler: Optional[Profiler] = None,
+                 tracer: Optional[Tracer] = None,
+                 timeout_on_compute: bool = False,
+                 match_id: Optional[str] = None):
+        """
+        If ``clients`` is given, they are used as they are (e.g., they have
+        been accepted by ``MatchServer``), otherwise the runner waits for the
+        players to connect on ``address`` (see ``network.create_server``),
+        signalling when it is ready to accept them (see ``signal_ready``).
+
+        ``environment`` may be a future (see ``prepare_in_background``), it
+        is waited for only after the players have connected. Give
+        ``num_players`` as well in that case, otherwise it is taken from the
+        environment, waiting for it right away.
+
+        The phases of the turns are timed in ``metrics``, if it is given. The
+        ``profiler`` is told the turns (counted from 0 in each race, one per
+        move of a player), to profile a window of them. The phases are recorded
+        on the timeline of ``tracer`` too, one track per player (see
+        ``dump_trace``).
+
+        The bridges send the time the bots took to compute their replies (see
+        ``network.encode_data``); the rest of the sending and the waiting is
+        the transport. With ``timeout_on_compute``, ``step_timeout`` applies
+        to the compute time when it is known, so that a slow network does not
+        strike the bots.
+
+        The output is prefixed with ``match_id``, if it is given (e.g., by
+        ``MatchServer``, which runs several matches at once).
+        """
+        self._environment = environment
+        if num_players is None:
+            num_players = self.env.num_players
+        self._num_players = num_players
         self.step_timeout = step_timeout
+        self.connection_timeout = connection_timeout
+        self.frame_format = frame_format
+        self.metrics = metrics
+        self.profiler = profiler
+        self.tracer = tracer
+        self.timeout_on_compute = timeout_on_compute
+        self.match_id = match_id
+        if clients is None:
+            clients = self._accept_clients(connection_timeout,
+                                           client_addresses, player_names,
+                                           address, ready_file)
+        self.clients = clients
+        self._client_reply_times: dict[int, list[float]] = {}
+        self._client_compute_times: dict[int, list[float]] = {}
+        self._client_transport_times: dict[int, list[float]] = {}
+        # compute time of the reply being read, if the bridge sent it
+        self._compute_time: Optional[float] = None
+        # the last resource usage the bridges reported
+        self._client_resources: dict[int, dict[str, Any]] = {}
+        # lines received in a ``lines`` frame, not yet read by the environment
+        self._pending_lines: dict[int, collections.deque[str]] = {}
+
+    def _print(self, *args: Any) -> None:
+        print(log_prefix(self.match_id) + ' '.join(str(a) for a in args))
+
+    @property
+    def env(self) -> EnvironmentBase:
+        """
+        The environment, waiting for it if it is still being prepared
+        """
+        if isinstance(self._environment, concurrent.futures.Future):
+            self._environment = self._environment.result()
+        return self._environment
+
+    def _accept_clients(
+        self, connection_timeout: float, client_addresses: Optional[list[str]],
+        player_names: Optional[list[str]], address: Optional[str],
+        ready_file: Optional[str]
+    ) -> list[ClientInfo | PlaceholderClientInfo]:
         if client_addresses is not None:
-            assert self.env.num_players == len(set(client_addresses)), (
+            assert self._num_players == len(set(client_addresses)), (
                 'Wrong number of clients for this environment or duplicate '
                 'client addresses.')
         # Wait for players to connect
-        server_socket = socket.create_server(('', network.JUDGE_PORT))
+        server_socket = network.create_server(address)
         server_socket.settimeout(connection_timeout)
-        server_socket.listen(self.env.num_players)
+        server_socket.listen(self._num_players)
         connected_clients: list[ClientInfo] = []
-        print('Waiting for players to connect...')
-        for _ in range(self.env.num_players):
+        self._print('Waiting for players to connect...')
+        signal_ready(ready_file, address)
+        while len(connected_clients) < self._num_players:
             try:
-                (clientsocket, address) = server_socket.accept()
-                client_info = ClientInfo(clientsocket, address[0], address[1])
+                (clientsocket, peer) = server_socket.accept()
+                client_info = ClientInfo(
+                    network.Connection(clientsocket),
+                    *network.peer_address(peer))
             except TimeoutError:
-                print('Warning: connection timed out. May not have '
-                      'enough players.')
+                self._print('Warning: connection timed out. May not have '
+                            'enough players.')
                 break
             clientsocket.settimeout(3 * self.step_timeout)
-            address, _port = address
+            peer = client_info.address_host
+            try:
+                hello = accept_handshake(client_info.connection,
+                                         self.frame_format)
+            except (TimeoutError, network.NetworkError) as e:
+                self._print(f'Dropping connection from {peer}: {e}')
+                clientsocket.close()
+                continue
+            client_info = client_info._replace(
+                capabilities=frozenset(hello.get('capabilities', [])))
             if client_addresses and player_names:
                 # find the name corresponding to the address
                 player_name = player_names[client_addresses.index(
@@ -150,10 +383,14 @@ class EnvironmentRunner:
                 # find the name next in order
                 player_name = player_names[len(connected_clients)]
                 client_info = client_info._replace(player_name=player_name)
+            elif hello.get('player_name'):
+                player_name = hello['player_name']
+                client_info = client_info._replace(player_name=player_name)
             else:
                 player_name = str(len(connected_clients))
             connected_clients.append(client_info)
-            print(f'Player {player_name} connected from {address}')
+            self._print(f'Player {player_name} connected from {peer}')
+        network.close_server(server_socket)
         if client_addresses is not None:
             addr_to_clients = {c.address_host: c for c in connected_clients}
             if len(addr_to_clients) != len(connected_clients):
@@ -169,7 +406,7 @@ class EnvironmentRunner:
                 if caddr in addr_to_clients:
                     clients.append(addr_to_clients[caddr])
                 else:
-                    print(f'No connections from {caddr}.')
+                    self._print(f'No connections from {caddr}.')
                     if player_names:
                         clients.append(
                             PlaceholderClientInfo(
@@ -178,43 +415,118 @@ class EnvironmentRunner:
                         clients.append(PlaceholderClientInfo())
         else:
             clients = connected_clients + [PlaceholderClientInfo()] * (
-                self.env.num_players - len(connected_clients))
-        self.clients = clients
-        server_socket.close()
-        self._client_reply_times: dict[int, list[float]] = {}
+                self._num_players - len(connected_clients))
+        return clients
 
-    def run(self) -> list[int | float]:
-        print('Started the run.')
+    def run(self, *, last_race: bool = True) -> list[int | float]:
+        """
+        Run one race. If it is not the ``last_race`` of a series, the clients
+        are reset instead of being sent the end signal, and the connections
+        can be reused by calling ``run`` again.
+        """
+        self._print('Started the run.')
+        # Disqualification only lasts for one race
+        self.clients = [
+            c._replace(strikes=0) if isinstance(c, ClientInfo) else c
+            for c in self.clients
+        ]
+        self.env.metrics = self.metrics
+        self.env.log_prefix = log_prefix(self.match_id)
         self._send_initial_observations()
         current_player: Optional[int] = None
+        turn = 0
+        # time spent waiting for the lines of the current player
+        wait_time = 0.
+
+        def read_line() -> str:
+            nonlocal wait_time
+            tick = time.perf_counter()
+            try:
+                return self._read_from_client(current_player)
+            finally:
+                tock = time.perf_counter()
+                wait_time += tock - tick
+                if self.tracer is not None:
+                    self.tracer.complete('wait', tick, tock, tid=current_player)
+
         while True:
             current_player = self.env.next_player(current_player)
             if current_player is None:
                 break
             assert 0 <= current_player < self.env.num_players
+            if self.profiler is not None:
+                self.profiler.turn_started(turn)
+            observation_tick = time.perf_counter()
             observation = self.env.observation(current_player)
             if not observation or observation[-1] != '\n':
                 observation += '\n'
+            observation_tock = time.perf_counter()
             self._send_observation(
                 current_player, observation, only_qualified=True)
             send_tick = time.perf_counter()
+            if self.metrics is not None:
+                self.metrics.record('observation', current_player,
+                                    observation_tock - observation_tick)
+                self.metrics.record('send', current_player,
+                                    send_tick - observation_tock)
+            if self.tracer is not None:
+                self.tracer.complete('observation',
+                                     observation_tick,
+                                     observation_tock,
+                                     tid=current_player,
+                                     args={'turn': turn})
+                self.tracer.complete('send',
+                                     observation_tock,
+                                     send_tick,
+                                     tid=current_player)
             if self.clients[current_player].disqualified:
                 player_input = None
+                self.env.reply_timing = None
             else:
+                wait_time = 0.
+                self._compute_time = None
                 try:
                     tick = time.perf_counter()
-                    player_input = self.env.read_player_input(
-                        lambda: self._read_from_client(current_player))
+                    player_input = self.env.read_player_input(read_line)
                     tock = time.perf_counter()
-                    if tock - tick > self.step_timeout:
+                    if self.metrics is not None:
+                        self.metrics.record('parse', current_player,
+                                            tock - tick - wait_time)
+                    if (self.timeout_on_compute
+                            and self._compute_time is not None):
+                        timed_out = self._compute_time > self.step_timeout
+                    else:
+                        timed_out = tock - tick > self.step_timeout
+                    if timed_out:
                         player_input = None
                 except TimeoutError:
                     player_input = None
                 except network.NetworkError:
                     player_input = None
                 tock = time.perf_counter()
+                # from the start of the send: the bot may start computing
+                # before ``sendall`` returns
+                reply_time = tock - observation_tock
                 self._client_reply_times.setdefault(current_player,
-                                                    []).append(tock - send_tick)
+                                                    []).append(reply_time)
+                if self.metrics is not None:
+                    # timeouts included
+                    self.metrics.record('wait', current_player, wait_time)
+                self.env.reply_timing = ReplyTiming(reply_time)
+                if self._compute_time is not None:
+                    transport_time = self._record_compute_time(
+                        current_player, self._compute_time, reply_time)
+                    self.env.reply_timing = self.env.reply_timing._replace(
+                        compute_time=self._compute_time,
+                        transport_time=transport_time)
+                if self.tracer is not None:
+                    # the waits for the lines and the parsing
+                    self.tracer.complete(
+                        'reply',
+                        send_tick,
+                        tock,
+                        tid=current_player,
+                        args={'valid': player_input is not None})
                 if player_input is None:
                     cur_client = self.clients[current_player]
                     assert isinstance(cur_client, ClientInfo)
@@ -222,15 +534,44 @@ class EnvironmentRunner:
                     self.clients[current_player] = (
                         cur_client._replace(strikes=cur_strikes + 1))
                     if cur_client.strikes == PLAYER_MAX_STRIKES:
-                        print(f'Player {self._player_name(current_player)} is '
-                              'disqualified.')
+                        self._print(
+                            f'Player {self._player_name(current_player)} is '
+                            'disqualified.')
+            step_tick = time.perf_counter()
             if player_input is None:
                 self.env.invalid_player_input(
                     current_player, self.clients[current_player].disqualified)
             else:
                 self.env.step(current_player, player_input)
-        self._signal_the_end()
-        return self.env.get_scores()
+            step_tock = time.perf_counter()
+            if self.metrics is not None:
+                self.metrics.record('step', current_player,
+                                    step_tock - step_tick)
+            if self.tracer is not None:
+                self.tracer.complete('step',
+                                     step_tick,
+                                     step_tock,
+                                     tid=current_player)
+            turn += 1
+        if self.profiler is not None:
+            self.profiler.race_finished()
+        scores = self.env.get_scores()
+        if last_race:
+            self._signal_the_end()
+        else:
+            self._signal_reset()
+        return scores
+
+    def run_series(self, num_races: int,
+                   race_finished: Callable[[int, list[int | float]], None]
+                   ) -> None:
+        """
+        Run ``num_races`` races over the same connections, calling
+        ``race_finished`` with the index and the scores of each race.
+        """
+        for race in range(num_races):
+            scores = self.run(last_race=race == num_races - 1)
+            race_finished(race, scores)
 
     def _player_name(self, player_ind: int) -> str:
         player_name = self.clients[player_ind].player_name
@@ -239,22 +580,77 @@ class EnvironmentRunner:
         else:
             return str(player_ind)
 
+    @property
+    def player_names(self) -> list[str]:
+        """
+        Names of the players, their indices if they have no names
+        """
+        return [self._player_name(p) for p in range(self._num_players)]
+
+    def dump_trace(self, path: str) -> None:
+        """
+        Save the timeline of ``tracer``, naming the tracks of the players
+        """
+        assert self.tracer is not None
+        for player, player_name in enumerate(self.player_names):
+            self.tracer.name_thread(player, f'player {player_name}')
+        self.tracer.dump(path)
+
     def _send_initial_observations(self) -> None:
+        self.env.set_capabilities([c.capabilities for c in self.clients])
         player_names = [c.player_name for c in self.clients]
         # mypy cannot resolve the `all` check
         initial_obs = self.env.reset(
             player_names if all(player_names) else None)  # type: ignore
-        if not initial_obs or initial_obs[-1] != '\n':
-            initial_obs += '\n'
-        print('Sending initial observation to all players.')
+        self._print('Sending initial observation to all players.')
         for p in range(self.env.num_players):
-            self._send_observation(p, initial_obs, only_qualified=True)
+            obs = self.env.initial_observation(p, initial_obs)
+            if not obs or obs[-1] != '\n':
+                obs += '\n'
+            self._send_observation(p, obs, only_qualified=True)
 
     def _signal_the_end(self) -> None:
-        print('Run ends, sending the end signal to everyone...')
+        self._print('Run ends, sending the end signal to everyone...')
         for p in range(self.env.num_players):
             self._send_observation(p, '~~~END~~~\n', only_qualified=False)
 
+    def _signal_reset(self) -> None:
+        """
+        Ask every bridge to reset its bot for the next race, and wait until
+        they are ready (or ``connection_timeout`` passes).
+        """
+        self._print('Race ends, resetting everyone for the next race...')
+        self._pending_lines.clear()
+        connected = [
+            p for p in range(self.env.num_players)
+            if getattr(self.clients[p], 'connection', None) is not None
+        ]
+        for p in connected:
+            try:
+                # Check for `connection` is done above
+                self.clients[p].connection.send_control(  # type: ignore
+                    'reset')
+            except network.NetworkError:
+                self._print(f'Failed to reset player {self._player_name(p)}.')
+        deadline = time.perf_counter() + self.connection_timeout
+        for p in connected:
+            connection: network.Connection = (
+                self.clients[p].connection)  # type: ignore
+            try:
+                while True:
+                    connection.settimeout(
+                        max(deadline - time.perf_counter(), 1e-3))
+                    msg = self._recv_msg(p, connection)
+                    # Late replies of the previous race are dropped here
+                    if (msg['type'] == 'control'
+                            and msg['command'] == 'ready'):
+                        break
+            except (TimeoutError, network.NetworkError):
+                self._print(f'Player {self._player_name(p)} is not ready for '
+                            'the next race.')
+            finally:
+                connection.settimeout(3 * self.step_timeout)
+
     def _send_observation(self,
                           current_player: int,
                           observation: str,
@@ -263,40 +659,363 @@ class EnvironmentRunner:
         cur_client = self.clients[current_player]
         if only_qualified and cur_client.disqualified:
             return
-        if getattr(cur_client, 'socket', None) is None:
+        if getattr(cur_client, 'connection', None) is None:
             # Not connected
             return
         try:
-            # Check for `socket` is done above
-            network.send_data(cur_client.socket, observation)  # type: ignore
+            # Check for `connection` is done above
+            cur_client.connection.send_data(observation)  # type: ignore
         except (TimeoutError, network.NetworkError):
-            print(
+            self._print(
                 f'Failed to send to player {self._player_name(current_player)}.'
             )
 
+    def _recv_msg(self, player_ind: int,
+                  connection: network.Connection) -> dict[str, Any]:
+        """
+        Receive the next message of the player, keeping the resource usage
+        reports on the way
+        """
+        while True:
+            msg = connection.recv_msg()
+            if msg['type'] != 'control' or msg['command'] != 'resources':
+                return msg
+            self._client_resources[player_ind] = {
+                k: v
+                for k, v in msg.items() if k not in ('type', 'command')
+            }
+
     def _read_from_client(self, player_ind: int) -> str:
         cur_client = self.clients[player_ind]
-        if getattr(cur_client, 'socket', None) is None:
+        if getattr(cur_client, 'connection', None) is None:
             raise network.NetworkError(
                 f'Player {self._player_name(player_ind)} not connected.')
-        # Check for `socket` is done above, mypy doesn't see it
-        msg = network.recv_msg(cur_client.socket)  # type: ignore
+        pending = self._pending_lines.setdefault(player_ind,
+                                                 collections.deque())
+        if pending:
+            return pending.popleft()
+        # Check for `connection` is done above, mypy doesn't see it
+        msg = self._recv_msg(player_ind,
+                             cur_client.connection)  # type: ignore
+        if 'compute_time' in msg and self._compute_time is None:
+            # the first frame of the reply
+            self._compute_time = msg['compute_time']
+        if msg['type'] == 'lines':
+            # The bridge packed several lines into one frame
+            pending.extend(msg['data'])
+            return pending.popleft()
         assert msg['type'] == 'data', 'Control messages aren\'t supported yet.'
         return msg['data']
 
-    @property
-    def client_reply_times(self) -> dict[int | str, list[float]]:
+    def _record_compute_time(self, player_ind: int, compute_time: float,
+                             reply_time: float) -> float:
+        """
+        Record the compute time of a reply, return its transport time
+        """
+        transport_time = reply_time - compute_time
+        self._client_compute_times.setdefault(player_ind,
+                                              []).append(compute_time)
+        self._client_transport_times.setdefault(player_ind,
+                                                []).append(transport_time)
+        if self.metrics is not None:
+            self.metrics.record('compute', player_ind, compute_time)
+            self.metrics.record('transport', player_ind, transport_time)
+        return transport_time
+
+    def _by_player_name(self, values: dict[int, Any]) -> dict[int | str, Any]:
         # yapf: disable
         return {
             # We check for None, but mypy fails to see it.
             self.clients[k].player_name # type: ignore
             if self.clients[k].player_name
             else k: v
-            for k, v in sorted(
-                self._client_reply_times.items(), key=lambda x: x[0])
+            for k, v in sorted(values.items(), key=lambda x: x[0])
         }
         # yapf: enable
 
+    @property
+    def client_reply_times(self) -> dict[int | str, list[float]]:
+        """
+        Time from the start of sending the observations to the end of
+        parsing the replies (see ``ReplyTiming``)
+        """
+        return self._by_player_name(self._client_reply_times)
+
+    @property
+    def client_compute_times(self) -> dict[int | str, list[float]]:
+        """
+        Time the bots took to compute their replies, measured by the bridges
+        (only the replies of the bridges that send it)
+        """
+        return self._by_player_name(self._client_compute_times)
+
+    @property
+    def client_transport_times(self) -> dict[int | str, list[float]]:
+        """
+        The reply times minus the compute times, not clipped: a negative
+        time means the bridge measured more than the judge waited
+        """
+        return self._by_player_name(self._client_transport_times)
+
+    @property
+    def client_resources(self) -> dict[int | str, dict[str, Any]]:
+        """
+        The last resource usage of the bots (CPU time in seconds, RSS and
+        peak RSS in bytes) reported by the bridges that measure it
+        """
+        return self._by_player_name(self._client_resources)
+
+def launch_bridges(
+    bot_exes: list[str],
+    bridge: str,
+    step_timeout: float,
+    connection_timeout: float,
+    player_names: Optional[list[str]] = None,
+    frame_format: str = network.FORMAT_BINARY,
+    trace_file: Optional[str] = None,
+    bridge_args: Optional[list[str]] = None
+) -> tuple[list[ClientInfo | PlaceholderClientInfo], list[subprocess.Popen]]:
+    """
+    Start a single bridge serving all the bots, each connected to the judge
+    through an inherited socket pair instead of the network, so there is no
+    port to bind and no connection to wait for. If ``trace_file`` is given,
+    the bridge saves its traces there (see its ``--trace_file`` option).
+    ``bridge_args`` are passed to the bridge as they are.
+
+    Returns the clients (in the order of ``bot_exes``) and the bridge
+    processes.
+    """
+    pairs = [socket.socketpair() for _ in bot_exes]
+    addresses: list[str] = []
+    for _, bridge_end in pairs:
+        addresses += [
+            '--judge_address', f'{network.FD_PREFIX}{bridge_end.fileno()}'
+        ]
+    if trace_file is not None:
+        addresses += ['--trace_file', trace_file]
+    command = [sys.executable, bridge, *bot_exes, *addresses]
+    command += bridge_args or []
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        command,
+        pass_fds=[bridge_end.fileno() for _, bridge_end in pairs])
+    for _, bridge_end in pairs:
+        bridge_end.close()
+    clients: list[ClientInfo | PlaceholderClientInfo] = []
+    deadline = time.perf_counter() + connection_timeout
+    for i, (judge_end, _) in enumerate(pairs):
+        player_name = player_names[i] if player_names else None
+        try:
+            judge_end.settimeout(max(deadline - time.perf_counter(), 1e-3))
+            connection = network.Connection(judge_end)
+            hello = accept_handshake(connection, frame_format)
+        except (TimeoutError, network.NetworkError) as e:
+            print(f'Bridge of {bot_exes[i]} did not connect: {e}')
+            judge_end.close()
+            clients.append(PlaceholderClientInfo(player_name))
+            continue
+        judge_end.settimeout(3 * step_timeout)
+        player_name = player_name or hello.get('player_name') or str(i)
+        clients.append(
+            ClientInfo(
+                connection,
+                'pipe',
+                i,
+                player_name,
+                capabilities=frozenset(hello.get('capabilities', []))))
+        print(f'Player {player_name} connected through a socket pair')
+    return clients, [process]
+
+class MatchServer:
+    """
+    Long-lived judge hosting many matches on a single port.
+
+    Every bridge names its match in the ``hello`` handshake (``match_id``).
+    The handshakes run in a pool of threads, so that slow clients do not
+    hold up the others. Connections with the same match id gather in a
+    lobby; the match starts in its own thread when the lobby is full, or
+    when ``connection_timeout`` has passed since the first connection of the
+    lobby (missing players are replaced by placeholders, as in
+    ``EnvironmentRunner``).
+
+    With ``num_races > 1`` every match is a series; ``match_finished`` is
+    called after each race with the match id suffixed by the race index.
+    """
+
+    #: how often (in seconds) the lobbies are checked for timeouts
+    POLL_INTERVAL = 0.5
+
+    class Lobby(NamedTuple):
+        created: float
+        clients: list[ClientInfo]
+
+    def __init__(self,
+                 make_environment: Callable[[], EnvironmentBase],
+                 num_players: int,
+                 step_timeout: float,
+                 connection_timeout: float,
+                 match_finished: MatchFinishedCallback,
+                 max_concurrent_matches: Optional[int] = None,
+                 num_races: int = 1,
+                 address: Optional[str] = None,
+                 frame_format: str = network.FORMAT_BINARY,
+                 ready_file: Optional[str] = None,
+                 metrics_writer: Optional[MetricsWriter] = None,
+                 profiling: Optional[Profiling] = None,
+                 trace_file: Optional[str] = None,
+                 timeout_on_compute: bool = False):
+        self._make_environment = make_environment
+        self._metrics_writer = metrics_writer
+        self._profiling = profiling
+        self._trace_file = trace_file
+        self._timeout_on_compute = timeout_on_compute
+        self._address = address
+        self._frame_format = frame_format
+        self._ready_file = ready_file
+        self._num_races = num_races
+        self._num_players = num_players
+        self.step_timeout = step_timeout
+        self.connection_timeout = connection_timeout
+        self._match_finished = match_finished
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrent_matches,
+            thread_name_prefix='match')
+        self._handshakes = concurrent.futures.ThreadPoolExecutor(
+            thread_name_prefix='handshake')
+        # filled by the handshake threads, emptied by the accepting thread
+        self._lobbies: dict[str, MatchServer.Lobby] = {}
+        self._lobbies_lock = threading.Lock()
+
+    def serve(self, max_matches: Optional[int] = None) -> None:
+        """
+        Accept connections until ``max_matches`` matches have been started
+        (forever if ``None``), then wait for the running matches to finish.
+        """
+        server_socket = network.create_server(self._address)
+        server_socket.settimeout(self.POLL_INTERVAL)
+        server_socket.listen()
+        print('Serving matches on '
+              f'{self._address or f"port {network.JUDGE_PORT}"}...')
+        signal_ready(self._ready_file, self._address)
+        started = 0
+        try:
+            while max_matches is None or started < max_matches:
+                try:
+                    clientsocket, peer = server_socket.accept()
+                except TimeoutError:
+                    pass
+                else:
+                    self._handshakes.submit(self._add_client, clientsocket,
+                                            network.peer_address(peer))
+                for match_id in self._ready_lobbies():
+                    self._start_match(match_id)
+                    started += 1
+        except KeyboardInterrupt:
+            print('Received keyboard interrupt, not accepting more matches.')
+        finally:
+            network.close_server(server_socket)
+            self._handshakes.shutdown(wait=False, cancel_futures=True)
+            self._executor.shutdown(wait=True)
+
+    def _add_client(self, clientsocket: socket.socket,
+                    address: tuple[str, int]) -> None:
+        clientsocket.settimeout(3 * self.step_timeout)
+        connection = network.Connection(clientsocket)
+        try:
+            hello = accept_handshake(connection, self._frame_format)
+        except (TimeoutError, network.NetworkError) as e:
+            print(f'Dropping connection from {address[0]}: {e}')
+            clientsocket.close()
+            return
+        match_id = hello.get('match_id')
+        if not isinstance(match_id, str) or not match_id:
+            print(f'Dropping connection from {address[0]}: no match id '
+                  '(see the --match_id option of client_bridge.py).')
+            connection.close()
+            return
+        with self._lobbies_lock:
+            lobby = self._lobbies.setdefault(
+                match_id, MatchServer.Lobby(time.perf_counter(), []))
+            player_name = hello.get('player_name') or str(len(lobby.clients))
+            lobby.clients.append(
+                ClientInfo(
+                    connection,
+                    address[0],
+                    address[1],
+                    player_name,
+                    capabilities=frozenset(hello.get('capabilities', []))))
+        print(f'[{match_id}] Player {player_name} connected from '
+              f'{address[0]}')
+
+    def _ready_lobbies(self) -> list[str]:
+        now = time.perf_counter()
+        with self._lobbies_lock:
+            return [
+                match_id for match_id, lobby in self._lobbies.items()
+                if len(lobby.clients) >= self._num_players
+                or now - lobby.created > self.connection_timeout
+            ]
+
+    def _start_match(self, match_id: str) -> None:
+        with self._lobbies_lock:
+            lobby = self._lobbies.pop(match_id)
+        clients: list[ClientInfo | PlaceholderClientInfo] = list(
+            lobby.clients[:self._num_players])
+        for extra in lobby.clients[self._num_players:]:
+            print(f'[{match_id}] Too many players, dropping '
+                  f'{extra.player_name}.')
+            extra.connection.close()
+        if len(clients) < self._num_players:
+            print(f'[{match_id}] Warning: connection timed out. May not have '
+                  'enough players.')
+            clients += [PlaceholderClientInfo()] * (self._num_players
+                                                    - len(clients))
+        print(f'[{match_id}] Starting match.')
+        self._executor.submit(self._run_match, match_id, clients)
+
+    def _run_match(
+            self, match_id: str,
+            clients: list[ClientInfo | PlaceholderClientInfo]) -> None:
+        profiler = (self._profiling.new()
+                    if self._profiling is not None else None)
+        try:
+            if profiler is not None:
+                profiler.start()
+            runner = EnvironmentRunner(
+                self._make_environment(),
+                self.step_timeout,
+                self.connection_timeout,
+                clients=clients,
+                metrics=(self._metrics_writer.new()
+                         if self._metrics_writer is not None else None),
+                profiler=profiler,
+                tracer=(Tracer('judge', match_id)
+                        if self._trace_file is not None else None),
+                timeout_on_compute=self._timeout_on_compute,
+                match_id=match_id)
+            if self._num_races == 1:
+                self._match_finished(match_id, runner, runner.run())
+            else:
+                runner.run_series(
+                    self._num_races, lambda race, scores: self.
+                    _match_finished(f'{match_id}.{race}', runner, scores))
+            if self._metrics_writer is not None:
+                assert runner.metrics is not None
+                self._metrics_writer.write(runner.metrics, runner.player_names,
+                                           match_id)
+            if self._trace_file is not None:
+                runner.dump_trace(f'{self._trace_file}.{match_id}')
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # One broken match must not bring down the others
+            print(f'[{match_id}] Match failed: {e!r}')
+        finally:
+            for c in clients:
+                if isinstance(c, ClientInfo):
+                    c.connection.close()
+            if profiler is not None:
+                assert self._profiling is not None
+                profiler.stop()
+                self._profiling.dump(profiler, match_id)
+
 class App:
     """
     Class mainly for parsing arguments and writing results where it is expected
@@ -307,9 +1026,42 @@ class App:
         print(environment_name)
         self._replay_file_path = arguments.replay_file
         self._player_timeout = arguments.timeout
+        self._timeout_on_compute = arguments.timeout_on_compute
         self._connection_timeout = arguments.connection_timeout
         config_file_path = arguments.config_file
         self._output_file_path = arguments.output_file
+        self._serve = arguments.serve
+        self._address = arguments.address
+        self._bridge = arguments.bridge
+        self._bridge_args = shlex.split(arguments.bridge_args)
+        if arguments.cpus:
+            # inherited by the threads, the bridges and the bots started
+            # from now on
+            os.sched_setaffinity(0, resources.parse_cpus(arguments.cpus))
+        self._frame_format = arguments.frame_format
+        self._ready_file = arguments.ready_file
+        self._num_races = arguments.series
+        if self._num_races <= 0:
+            raise ValueError(f'Invalid number of races: {self._num_races}')
+        self._max_matches = arguments.max_matches
+        if arguments.metrics_file or arguments.prometheus_file:
+            self._metrics_writer: Optional[MetricsWriter] = MetricsWriter(
+                arguments.metrics_file,
+                arguments.prometheus_file,
+                count_hot_paths=arguments.count_hot_paths)
+        else:
+            self._metrics_writer = None
+        if arguments.profile:
+            self._profiling: Optional[Profiling] = Profiling(
+                arguments.profile,
+                arguments.profile_file,
+                (profiling.parse_turns(arguments.profile_turns)
+                 if arguments.profile_turns else None),
+                arguments.profile_interval,
+                arguments.profile_snapshot_every)
+        else:
+            self._profiling = None
+        self._trace_file = arguments.trace_file
         with open(config_file_path, 'r') as f:
             self._options = json.load(f)
         if 'num_players' in self._options:
@@ -328,6 +1080,13 @@ class App:
                     'players.'
         else:
             self._client_addresses = None
+        if arguments.bots:
+            self._bots = arguments.bots.split(';')
+            assert (len(self._bots)
+                    == self._options['num_players']), \
+                    'Number of bots must equal the number of players.'
+        else:
+            self._bots = None
         if arguments.player_names:
             self._player_names = arguments.player_names.split(';')
             assert (len(self._player_names)
@@ -361,12 +1120,82 @@ class App:
             '--output_file',
             type=str,
             help='Path to save the output file to. Optional.')
+        parser.add_argument(
+            '--metrics_file',
+            type=str,
+            default=None,
+            help='Path to save a JSON report of the duration of the phases '
+            'of the turns (percentiles and maximum per player) to at the end '
+            'of the match. Optional.')
+        parser.add_argument(
+            '--prometheus_file',
+            type=str,
+            default=None,
+            help='Path to save the same report to in the Prometheus text '
+            'format (e.g., "judge.prom" in the directory of the textfile '
+            'collector). Optional.')
+        parser.add_argument(
+            '--count_hot_paths',
+            action='store_true',
+            help='Add counters of the hot paths of the environment (e.g., '
+            'line of sight checks) to the reports. They slow down the '
+            'judge slightly.')
+        parser.add_argument(
+            '--profile',
+            choices=profiling.PROFILERS,
+            default=None,
+            help='Profile the judge during the matches: "cprofile" saves '
+            'pstats (see the pstats module, snakeviz, etc.), "sample" samples '
+            'the stacks and saves them collapsed (one line per stack, for '
+            'flamegraph.pl or speedscope), with less overhead, "tracemalloc" '
+            'snapshots the memory every few turns and saves the allocation '
+            'sites that grew the most and the peak usage. Optional.')
+        parser.add_argument(
+            '--profile_file',
+            type=str,
+            default='judge_profile',
+            help='Path to save the profile to, the extension (".pstats", '
+            '".folded" or ".txt") is added. Default is judge_profile.')
+        parser.add_argument(
+            '--profile_turns',
+            type=str,
+            default=None,
+            help='Only profile the turns START <= turn < END of each race, '
+            'given as "START:END" (either may be omitted). A turn is the '
+            'move of one player. Default is to profile the whole match.')
+        parser.add_argument(
+            '--profile_interval',
+            type=float,
+            default=profiling.SAMPLE_INTERVAL,
+            help='Time (in seconds of CPU time) between the samples of '
+            f'--profile sample. Default is {profiling.SAMPLE_INTERVAL}.')
+        parser.add_argument(
+            '--profile_snapshot_every',
+            type=int,
+            default=memory.SNAPSHOT_EVERY,
+            help='Number of turns between the snapshots of --profile '
+            f'tracemalloc. Default is {memory.SNAPSHOT_EVERY}.')
+        parser.add_argument(
+            '--trace_file',
+            type=str,
+            default=None,
+            help='Path to save a timeline of the turns to, in the Chrome '
+            'trace event format. The bridges started for --bots save theirs '
+            'next to it (".bridge" is added); merge them with tracing.py. '
+            'Optional.')
         parser.add_argument(
             '--timeout',
             type=float,
             default=1.,
             help='Timeout (in seconds) for the player responses. '
             'Default is 1.0 second.')
+        parser.add_argument(
+            '--timeout_on_compute',
+            action='store_true',
+            help='Apply --timeout to the time the bots take to compute their '
+            'replies, as measured by the bridges, instead of the whole reply '
+            'time, so that the transport never costs the players a strike. '
+            'Replies of bridges that do not measure it are timed as usual.')
         parser.add_argument(
             '--connection_timeout',
             type=float,
@@ -383,52 +1212,274 @@ class App:
             type=str,
             help='List of player names, separated by ";"s. The number '
             'of names must equal the number of players.')
+        parser.add_argument(
+            '--address',
+            type=str,
+            default=None,
+            help='Address to listen on: "host:port" for TCP or '
+            '"unix:/path/to/socket" for a Unix domain socket. Default is TCP '
+            f'port {network.JUDGE_PORT} on all interfaces.')
+        parser.add_argument(
+            '--ready_file',
+            type=str,
+            default=None,
+            help='File to create (containing the address to connect to) once '
+            'the judge accepts connections, for start scripts to wait for. '
+            f'"{READY_MESSAGE}" is printed as well. Optional.')
+        parser.add_argument(
+            '--frame_format',
+            choices=[network.FORMAT_BINARY, network.FORMAT_JSON],
+            default=network.FORMAT_BINARY,
+            help='Frame format to use with the bridges that support it. JSON '
+            'is used with the others. Default is binary.')
+        parser.add_argument(
+            '--bots',
+            type=str,
+            default=None,
+            help='List of bot executables, separated by ";"s. The judge '
+            'starts a single bridge serving all of them, each connected '
+            'through a socket pair instead of the network. The number of bots '
+            'must equal the number of players.')
+        parser.add_argument(
+            '--bridge',
+            type=str,
+            default=DEFAULT_BRIDGE,
+            help='Path to client_bridge.py for --bots. Default is the bridge '
+            'in the bot directory next to the judge.')
+        parser.add_argument(
+            '--bridge_args',
+            type=str,
+            default='',
+            help='Options of the bridge started for --bots, e.g. '
+            '"--cpus 2 --cpus 3 --memory_limit 1024" (see client_bridge.py '
+            '--help). Optional.')
+        parser.add_argument(
+            '--cpus',
+            type=str,
+            default=None,
+            help='CPUs to run the judge on, e.g. "0-3,6". The bridge and the '
+            'bots started for --bots inherit them, unless --bridge_args '
+            'pins the bots elsewhere. Default is any CPU.')
+        parser.add_argument(
+            '--series',
+            type=int,
+            default=1,
+            help='Number of races to play back to back over the same '
+            'connections. Bots are reset between the races instead of being '
+            'restarted. Replay and output files get the race index as a '
+            'suffix if it is more than 1. Default is 1.')
+        parser.add_argument(
+            '--serve',
+            action='store_true',
+            help='Run as a long-lived server hosting many matches at once. '
+            'Connections are grouped into matches by the match id the '
+            'bridges send (see the --match_id option of client_bridge.py), '
+            'bridges without one are dropped. Replay and output files get the '
+            'match id as a suffix.')
+        parser.add_argument(
+            '--max_matches',
+            type=int,
+            default=None,
+            help='Number of matches to host before exiting in server mode. '
+            'Default is to serve forever.')
         return parser.parse_args()
 
     @contextlib.contextmanager
-    def replay_file(self):
+    def replay_file(self, match_id: Optional[str] = None):
         assert self._replay_file_path, 'No replay file path specified.'
-        print(f'Saving replays to {self._replay_file_path}.')
-        with open(self._replay_file_path, 'w') as f:
+        path = self._with_match_id(self._replay_file_path, match_id)
+        print(f'{self._log_prefix(match_id)}Saving replays to {path}.')
+        with open(path, 'w') as f:
             yield f
 
     @property
     def create_replay(self):
         return bool(self._replay_file_path)
 
-    def write_output(self, output):
+    def write_output(self, output, match_id: Optional[str] = None):
         if self._output_file_path:
-            print(f'Saving final scores to {self._output_file_path}.')
-            with open(self._output_file_path, 'w') as f:
+            path = self._with_match_id(self._output_file_path, match_id)
+            print(f'{self._log_prefix(match_id)}Saving final scores to '
+                  f'{path}.')
+            with open(path, 'w') as f:
                 json.dump(output, f)
 
+    def _log_prefix(self, match_id: Optional[str]) -> str:
+        # the race ids of a series of a single match are not prefixed
+        return log_prefix(match_id if self._serve else None)
+
+    def _new_metrics(self) -> Optional[Metrics]:
+        if self._metrics_writer is None:
+            return None
+        return self._metrics_writer.new()
+
+    def _new_tracer(self) -> Optional[Tracer]:
+        if self._trace_file is None:
+            return None
+        return Tracer('judge')
+
+    def _bridge_trace_file(self) -> Optional[str]:
+        if self._trace_file is None:
+            return None
+        return f'{self._trace_file}.bridge'
+
+    @staticmethod
+    def _with_match_id(path: str, match_id: Optional[str]) -> str:
+        return path if match_id is None else f'{path}.{match_id}'
+
     def run_environment(self,
-                        env: EnvironmentBase,
+                        env: EnvironmentBase
+                        | concurrent.futures.Future[EnvironmentBase],
                         *,
-                        print_replay_times: bool | Literal['full'] = False):
+                        print_replay_times: bool | Literal['full'] = False,
+                        race_finished: Optional[RaceFinishedCallback] = None):
         """
-        Run a match in the environment.
+        Run a match (or a series of matches, see ``--series``) in the
+        environment.
 
         Arguments
         ---------
-        env: EnvironmentBase
+        env: EnvironmentBase or future
+            A future (see ``prepare_in_background``) is waited for only after
+            the players have connected.
         print_replay_times: bool or 'full'
             If ``True``, prints mean of reply times (in seconds) for each
             agent. If "full", prints the full list of reply times for each
             agent.
+        race_finished: callable, optional
+            Called after each race with the race id (``None`` if there is
+            only one race, the race index otherwise, see ``replay_file``) and
+            the scores.
+
+        Returns
+        -------
+        The scores of the last race.
         """
-        runner = EnvironmentRunner(env, self._player_timeout,
-                                   self._connection_timeout,
-                                   self._client_addresses, self._player_names)
-        scores = runner.run()
+        bridges: list[subprocess.Popen] = []
+        profiler = (self._profiling.new()
+                    if self._profiling is not None else None)
+        if profiler is not None:
+            profiler.start()
+        if self._bots is not None:
+            clients, bridges = launch_bridges(self._bots, self._bridge,
+                                              self._player_timeout,
+                                              self._connection_timeout,
+                                              self._player_names,
+                                              self._frame_format,
+                                              self._bridge_trace_file(),
+                                              self._bridge_args)
+            runner = EnvironmentRunner(
+                env,
+                self._player_timeout,
+                self._connection_timeout,
+                clients=clients,
+                num_players=self._options['num_players'],
+                metrics=self._new_metrics(),
+                profiler=profiler,
+                tracer=self._new_tracer(),
+                timeout_on_compute=self._timeout_on_compute)
+        else:
+            runner = EnvironmentRunner(
+                env,
+                self._player_timeout,
+                self._connection_timeout,
+                self._client_addresses,
+                self._player_names,
+                address=self._address,
+                frame_format=self._frame_format,
+                ready_file=self._ready_file,
+                num_players=self._options['num_players'],
+                metrics=self._new_metrics(),
+                profiler=profiler,
+                tracer=self._new_tracer(),
+                timeout_on_compute=self._timeout_on_compute)
+        all_scores: list[list[int | float]] = []
+
+        def on_race_finished(race: int, scores: list[int | float]) -> None:
+            all_scores.append(scores)
+            if race_finished is not None:
+                race_finished(None if self._num_races == 1 else str(race),
+                              scores)
+
+        runner.run_series(self._num_races, on_race_finished)
+        if profiler is not None:
+            assert self._profiling is not None
+            profiler.stop()
+            self._profiling.dump(profiler)
+        if self._metrics_writer is not None:
+            assert runner.metrics is not None
+            self._metrics_writer.write(runner.metrics, runner.player_names)
+        if self._trace_file is not None:
+            runner.dump_trace(self._trace_file)
+        if bridges:
+            # the bridge exits once the judge hangs up
+            for c in runner.clients:
+                if isinstance(c, ClientInfo):
+                    c.connection.close()
+        for bridge in bridges:
+            try:
+                bridge.wait(timeout=self._connection_timeout)
+            except subprocess.TimeoutExpired:
+                bridge.terminate()
         if print_replay_times:
-            avg_replay_times = {
+            self.print_reply_times(runner, print_replay_times)
+        return all_scores[-1]
+
+    def serve_environments(self, make_environment: Callable[[],
+                                                            EnvironmentBase],
+                           match_finished: MatchFinishedCallback) -> None:
+        """
+        Host matches with ``MatchServer`` until ``--max_matches`` is reached.
+
+        Arguments
+        ---------
+        make_environment: callable
+            Creates a fresh environment for each match.
+        match_finished: callable
+            Called from the match's thread with the match id, the runner and
+            the scores.
+        """
+        server = MatchServer(
+            make_environment,
+            self._options['num_players'],
+            self._player_timeout,
+            self._connection_timeout,
+            match_finished,
+            num_races=self._num_races,
+            address=self._address,
+            frame_format=self._frame_format,
+            ready_file=self._ready_file,
+            metrics_writer=self._metrics_writer,
+            profiling=self._profiling,
+            trace_file=self._trace_file,
+            timeout_on_compute=self._timeout_on_compute)
+        server.serve(self._max_matches)
+
+    @staticmethod
+    def print_reply_times(runner: EnvironmentRunner,
+                          print_replay_times: bool | Literal['full']) -> None:
+        def table(title: str, values: dict[int | str, Any]) -> list[str]:
+            return [title] + pformat(values, sort_dicts=False).splitlines()
+
+        def times(values: dict[int | str, list[float]]) -> dict[int | str, Any]:
+            return {
                 k: np.mean(v) if print_replay_times != 'full' else v
-                for k, v in runner.client_reply_times.items()
+                for k, v in values.items()
             }
-            print('Client reply times:')
-            pprint(avg_replay_times, sort_dicts=False)
-        return scores
+
+        lines = table('Client reply times:', times(runner.client_reply_times))
+        # split by the bridges that send the compute times
+        for title, values in [
+            ('Client compute times:', runner.client_compute_times),
+            ('Client transport times:', runner.client_transport_times),
+        ]:
+            if values:
+                lines += table(title, times(values))
+        if runner.client_resources:
+            lines += table('Client resource usage:', runner.client_resources)
+        # in one piece, as the matches of a server print concurrently
+        prefix = log_prefix(runner.match_id)
+        print('\n'.join(prefix + line for line in lines))
 
     @property
     def options(self):
@@ -437,3 +1488,7 @@ class App:
     @property
     def player_timeout(self):
         return self._player_timeout
+
+    @property
+    def serve(self):
+        return self._serve
@@ -0,0 +1,184 @@
+"""
+Where the time of the judge goes: the duration of the phases of every turn
+per player, and optionally counters of the hot paths of the environment.
+
+A report is a JSON file, and a textfile in the Prometheus exposition format
+(for the textfile collector of the node exporter).
+"""
+import os
+import json
+import collections
+import numpy as np
+
+from typing import Any, Optional
+
+#: phases of a turn: building the observation, sending it, waiting for the
+#: reply, parsing it, and applying it (``step`` includes saving the replay,
+#: which is measured by the environment, see ``EnvironmentBase.metrics``).
+#: The send and the wait are split into the compute time of the bot and the
+#: transport, if the bridge sends the compute time.
+PHASES = [
+    'observation', 'send', 'wait', 'compute', 'transport', 'parse', 'step',
+    'replay'
+]
+QUANTILES = [0.5, 0.95, 0.99]
+#: prefix of the Prometheus metric names
+METRIC_PREFIX = 'judge'
+
+class Metrics:
+    """
+    Durations (in seconds) of the phases per player, and the hot path
+    counters (``None`` unless they are counted, so that the hot paths only
+    have to check that).
+    """
+
+    def __init__(self, *, count_hot_paths: bool = False):
+        self._durations: dict[str, dict[int, list[float]]] = {
+            phase: {} for phase in PHASES
+        }
+        self.counters: Optional[collections.Counter[str]] = (
+            collections.Counter() if count_hot_paths else None)
+
+    def record(self, phase: str, player: int, seconds: float) -> None:
+        self._durations[phase].setdefault(player, []).append(seconds)
+
+    def summary(self) -> dict[str, dict[int, dict[str, float]]]:
+        """
+        Count, total, quantiles (as "p50", "p95", ...) and maximum of the
+        durations of each phase per player
+        """
+        result: dict[str, dict[int, dict[str, float]]] = {}
+        for phase, players in self._durations.items():
+            result[phase] = {}
+            for player, durations in sorted(players.items()):
+                values = np.array(durations)
+                stats = {'count': len(values), 'total': float(values.sum())}
+                for q, value in zip(QUANTILES,
+                                    np.quantile(values, QUANTILES).tolist()):
+                    stats[f'p{round(q * 100)}'] = value
+                stats['max'] = float(values.max())
+                result[phase][player] = stats
+        return result
+
+    def report(self, player_names: list[str]) -> dict[str, Any]:
+        """
+        The JSON report: the summary of the phases by player name, and the
+        counters
+        """
+        player_names = _unique_names(player_names)
+        return {
+            'phases': {
+                phase: {player_names[p]: stats
+                        for p, stats in players.items()}
+                for phase, players in self.summary().items()
+            },
+            'counters': dict(self.counters or {}),
+        }
+
+    def prometheus(self,
+                   player_names: list[str],
+                   match_id: Optional[str] = None) -> str:
+        """
+        The report in the Prometheus text exposition format
+        """
+        player_names = _unique_names(player_names)
+        match_label = ('' if match_id is None else
+                       f',match="{_escape(match_id)}"')
+        name = f'{METRIC_PREFIX}_phase_seconds'
+        max_name = f'{METRIC_PREFIX}_phase_max_seconds'
+        lines = [
+            f'# HELP {name} Duration of the phases of the turns of the judge.',
+            f'# TYPE {name} summary'
+        ]
+        maxima = [
+            f'# HELP {max_name} Longest duration of the phases of the turns '
+            'of the judge.', f'# TYPE {max_name} gauge'
+        ]
+        for phase, players in self.summary().items():
+            for player, stats in players.items():
+                labels = (f'phase="{phase}",'
+                          f'player="{_escape(player_names[player])}"'
+                          f'{match_label}')
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} '
+                                 f'{stats[f"p{round(q * 100)}"]}')
+                lines.append(f'{name}_sum{{{labels}}} {stats["total"]}')
+                lines.append(f'{name}_count{{{labels}}} {stats["count"]}')
+                maxima.append(f'{max_name}{{{labels}}} {stats["max"]}')
+        lines += maxima
+        if self.counters is not None:
+            name = f'{METRIC_PREFIX}_hot_path_total'
+            lines += [
+                f'# HELP {name} Number of calls and iterations in the hot '
+                'paths of the environment.', f'# TYPE {name} counter'
+            ]
+            lines += [
+                f'{name}{{counter="{counter}"{match_label}}} {value}'
+                for counter, value in sorted(self.counters.items())
+            ]
+        return '\n'.join(lines) + '\n'
+
+def _unique_names(player_names: list[str]) -> list[str]:
+    """
+    The names of the players, with the index of the player appended to the
+    names that several players share (as "name#index"), so that they do not
+    collapse into one key of the report or one Prometheus series
+    """
+    counts = collections.Counter(player_names)
+    return [
+        f'{name}#{player}' if counts[name] > 1 else name
+        for player, name in enumerate(player_names)
+    ]
+
+def _escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsWriter:
+    """
+    Creates the ``Metrics`` of the matches, and writes their reports to
+    ``json_path`` and ``prometheus_path`` (either may be ``None``). The
+    match id is added to the paths of the reports of hosted matches, before
+    the extension for the Prometheus textfile (the textfile collector reads
+    "*.prom" files only).
+    """
+
+    def __init__(self,
+                 json_path: Optional[str],
+                 prometheus_path: Optional[str],
+                 *,
+                 count_hot_paths: bool = False):
+        self._json_path = json_path
+        self._prometheus_path = prometheus_path
+        self._count_hot_paths = count_hot_paths
+
+    def new(self) -> Metrics:
+        return Metrics(count_hot_paths=self._count_hot_paths)
+
+    def write(self,
+              metrics: Metrics,
+              player_names: list[str],
+              match_id: Optional[str] = None) -> None:
+        # as ``judge.log_prefix``
+        prefix = '' if match_id is None else f'[{match_id}] '
+        if self._json_path:
+            path = (self._json_path
+                    if match_id is None else f'{self._json_path}.{match_id}')
+            print(f'{prefix}Saving metrics to {path}.')
+            _write_atomically(
+                path, json.dumps(metrics.report(player_names), indent=2))
+        if self._prometheus_path:
+            root, ext = os.path.splitext(self._prometheus_path)
+            path = (self._prometheus_path
+                    if match_id is None else f'{root}.{match_id}{ext}')
+            print(f'{prefix}Saving Prometheus metrics to {path}.')
+            _write_atomically(path, metrics.prometheus(player_names, match_id))
+
+def _write_atomically(path: str, text: str) -> None:
+    """
+    Write ``text`` to a temporary file and rename it to ``path``, so that
+    readers (e.g., the textfile collector) never see a partial file
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
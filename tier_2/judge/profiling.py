@@ -0,0 +1,243 @@
+"""
+Profiling of the judge (see the ``--profile`` options of ``judge.App``):
+``cProfile`` (dumped as pstats), a signal based stack sampler (dumped as
+collapsed stacks, the input of flamegraph.pl, speedscope, etc.), or
+``tracemalloc`` snapshots every few turns (dumped as a text report, see
+``memory.py``), optionally only for a window of turns.
+"""
+import os
+import sys
+import signal
+import cProfile
+import threading
+import collections
+
+from types import FrameType
+from typing import Optional
+
+import memory
+
+PROFILERS = ['cprofile', 'sample', 'tracemalloc']
+#: default time (in seconds) between samples of the stack sampler
+SAMPLE_INTERVAL = 0.001
+
+class Profiler:
+    """
+    Profiles the thread that calls ``start`` until ``stop``. If ``turns``
+    is given, only turns ``turns[0]`` <= turn < ``turns[1]`` of each race
+    are profiled; the runner tells the turns with ``turn_started``.
+    """
+
+    #: extension of the dump
+    EXTENSION = ''
+
+    def __init__(self, turns: Optional[tuple[int, int]] = None):
+        self.turns = turns
+        self._running = False
+        self._enabled = False
+
+    def _set_enabled(self, enabled: bool) -> None:
+        if enabled != self._enabled:
+            if enabled:
+                self._enable()
+            else:
+                self._disable()
+            self._enabled = enabled
+
+    def start(self) -> None:
+        self._running = True
+        self._set_enabled(self.turns is None)
+
+    def turn_started(self, turn: int) -> None:
+        if self._running and self.turns is not None:
+            self._set_enabled(self.turns[0] <= turn < self.turns[1])
+
+    def race_finished(self) -> None:
+        """
+        Stop profiling the window until the next race
+        """
+        if self._running and self.turns is not None:
+            self._set_enabled(False)
+
+    def stop(self) -> None:
+        self._set_enabled(False)
+        self._running = False
+
+    def _enable(self) -> None:
+        raise NotImplementedError()
+
+    def _disable(self) -> None:
+        raise NotImplementedError()
+
+    def dump(self, path: str) -> None:
+        raise NotImplementedError()
+
+class CProfiler(Profiler):
+
+    EXTENSION = '.pstats'
+
+    def __init__(self, turns: Optional[tuple[int, int]] = None):
+        super().__init__(turns)
+        self._profile = cProfile.Profile()
+
+    def _enable(self) -> None:
+        self._profile.enable()
+
+    def _disable(self) -> None:
+        self._profile.disable()
+
+    def dump(self, path: str) -> None:
+        self._profile.dump_stats(path)
+
+# The samplers of the threads being profiled; one process-wide timer
+# samples all of them, since signal handlers can only be set in the main
+# thread, and only run there. It runs while there are samplers. The lock is
+# reentrant since the handler may interrupt the main thread holding it.
+_samplers: dict[int, 'StackSampler'] = {}
+_samplers_lock = threading.RLock()
+_sample_interval = SAMPLE_INTERVAL
+
+def install_sampler(interval: float = SAMPLE_INTERVAL) -> None:
+    """
+    Sample every ``interval`` seconds of CPU time while a ``StackSampler``
+    is enabled. Must be called from the main thread, before any
+    ``StackSampler`` is started.
+    """
+    global _sample_interval  # pylint: disable=global-statement
+    if not hasattr(signal, 'setitimer'):
+        raise RuntimeError('The stack sampler needs setitimer (POSIX).')
+    _sample_interval = interval
+    signal.signal(signal.SIGPROF, _sample)
+
+def _sample(signum: int, frame: Optional[FrameType]) -> None:
+    del signum
+    with _samplers_lock:
+        if not _samplers:
+            return
+        # the handler runs in the main thread, whose frame in
+        # ``_current_frames`` is the handler's own: it gets the interrupted
+        # ``frame`` instead
+        frames: dict[int, Optional[FrameType]] = dict(
+            sys._current_frames())  # pylint: disable=protected-access
+        frames[threading.get_ident()] = frame
+        for thread_id, sampler in list(_samplers.items()):
+            if frames.get(thread_id) is not None:
+                sampler.add(frames[thread_id])
+
+class StackSampler(Profiler):
+    """
+    Counts the stacks of the profiled thread, sampled by the timer of
+    ``install_sampler``
+    """
+
+    EXTENSION = '.folded'
+
+    def __init__(self, turns: Optional[tuple[int, int]] = None):
+        super().__init__(turns)
+        self._thread_id = threading.get_ident()
+        self.stacks: collections.Counter[str] = collections.Counter()
+
+    def _enable(self) -> None:
+        self._thread_id = threading.get_ident()
+        with _samplers_lock:
+            if not _samplers:
+                signal.setitimer(signal.ITIMER_PROF, _sample_interval,
+                                 _sample_interval)
+            _samplers[self._thread_id] = self
+
+    def _disable(self) -> None:
+        with _samplers_lock:
+            _samplers.pop(self._thread_id, None)
+            if not _samplers:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+
+    def add(self, frame: Optional[FrameType]) -> None:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} '
+                         f'({os.path.basename(code.co_filename)}:'
+                         f'{code.co_firstlineno})')
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(names))] += 1
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+class MemoryProfiler(Profiler):
+    """
+    Snapshots the traced memory every ``every`` turns while enabled, see
+    ``memory.MemorySnapshots``
+    """
+
+    EXTENSION = '.txt'
+
+    def __init__(self,
+                 turns: Optional[tuple[int, int]] = None,
+                 every: int = memory.SNAPSHOT_EVERY):
+        super().__init__(turns)
+        self.snapshots = memory.MemorySnapshots(every)
+        self._turn = 0
+
+    def turn_started(self, turn: int) -> None:
+        self._turn = turn
+        super().turn_started(turn)
+        if self._enabled:
+            self.snapshots.turn(turn)
+
+    def _enable(self) -> None:
+        self.snapshots.start(self._turn)
+
+    def _disable(self) -> None:
+        self.snapshots.stop()
+
+    def dump(self, path: str) -> None:
+        self.snapshots.dump(path)
+
+class Profiling:
+    """
+    Creates the profilers of the matches (``kind`` is one of ``PROFILERS``)
+    and dumps them to ``path`` (the match id and the extension of the dump
+    are appended).
+    """
+
+    def __init__(self,
+                 kind: str,
+                 path: str,
+                 turns: Optional[tuple[int, int]] = None,
+                 interval: float = SAMPLE_INTERVAL,
+                 snapshot_every: int = memory.SNAPSHOT_EVERY):
+        assert kind in PROFILERS, f'Unknown profiler: {kind}'
+        self._kind = kind
+        self._path = path
+        self._turns = turns
+        self._snapshot_every = snapshot_every
+        if kind == 'sample':
+            install_sampler(interval)
+
+    def new(self) -> Profiler:
+        if self._kind == 'cprofile':
+            return CProfiler(self._turns)
+        if self._kind == 'tracemalloc':
+            return MemoryProfiler(self._turns, self._snapshot_every)
+        return StackSampler(self._turns)
+
+    def dump(self, profiler: Profiler, match_id: Optional[str] = None) -> None:
+        path = self._path if match_id is None else f'{self._path}.{match_id}'
+        path += profiler.EXTENSION
+        # as ``judge.log_prefix``
+        prefix = '' if match_id is None else f'[{match_id}] '
+        print(f'{prefix}Saving profile to {path}.')
+        profiler.dump(path)
+
+def parse_turns(turns: str) -> tuple[int, int]:
+    """
+    Parse a turn window: "START:END", END is exclusive, either may be
+    omitted
+    """
+    start, sep, end = turns.partition(':')
+    if not sep:
+        raise ValueError(f'Turn window should be START:END, got {turns!r}')
+    return int(start or 0), int(end) if end else sys.maxsize
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+Timelines of the matches in the Chrome trace event format (open them in
+chrome://tracing or https://ui.perfetto.dev), written by the judge and by
+the bridges (see their ``--trace_file`` options).
+
+The bridges align their clock with the judge's through the handshake: the
+judge sends in its ``welcome`` the time it received the ``hello``
+(``hello_clock``) and the time it sent the ``welcome`` (``clock``), and the
+bridge estimates the offset from these and its own two times, as NTP does.
+Bridges on the same host as the judge (Unix sockets and loopback TCP) share
+its ``clock`` and keep an offset of 0.
+
+Merge the files of a match into one timeline with:
+``python tracing.py --output match.json judge.json bridge.json.0 ...``
+
+This file is shared by the judge and the bridge, keep the copies identical.
+"""
+import os
+import json
+import time
+import argparse
+
+from typing import Any, Optional
+
+#: the clock of the traces, in seconds
+clock = time.perf_counter
+
+class Tracer:
+    """
+    Collects the events of one process (``pid`` is the current process by
+    default) for one match, with the timestamps of ``clock``.
+    """
+
+    def __init__(self, process_name: str, match_id: Optional[str] = None):
+        self.pid = os.getpid()
+        self.match_id = match_id
+        #: to add to the timestamps to get the judge's clock (in seconds)
+        self.clock_offset = 0.
+        self._events: list[dict[str, Any]] = []
+        self.name_process(process_name)
+
+    def name_process(self, name: str, pid: Optional[int] = None) -> None:
+        self._events.append({
+            'ph': 'M',
+            'name': 'process_name',
+            'pid': self.pid if pid is None else pid,
+            'args': {
+                'name': name
+            }
+        })
+
+    def name_thread(self,
+                    tid: int,
+                    name: str,
+                    pid: Optional[int] = None) -> None:
+        self._events.append({
+            'ph': 'M',
+            'name': 'thread_name',
+            'pid': self.pid if pid is None else pid,
+            'tid': tid,
+            'args': {
+                'name': name
+            }
+        })
+
+    def complete(self,
+                 name: str,
+                 start: float,
+                 end: float,
+                 *,
+                 tid: int = 0,
+                 pid: Optional[int] = None,
+                 args: Optional[dict[str, Any]] = None) -> None:
+        """
+        Record an event lasting from ``start`` to ``end`` (see ``clock``)
+        """
+        event = {
+            'ph': 'X',
+            'name': name,
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid if pid is None else pid,
+            'tid': tid
+        }
+        if args:
+            event['args'] = args
+        self._events.append(event)
+
+    def sync_clock(self, sent: float, remote_received: float,
+                   remote_sent: float, received: float) -> None:
+        """
+        Align the clock with the judge's, from a message ``sent`` to the
+        judge, which got it at ``remote_received`` and answered it at
+        ``remote_sent`` (on its clock), the answer being ``received`` back.
+        The network delay is assumed to be the same both ways.
+        """
+        self.clock_offset = ((remote_received - sent) +
+                             (remote_sent - received)) / 2
+
+    def dump(self, path: str) -> None:
+        prefix = '' if self.match_id is None else f'[{self.match_id}] '
+        print(f'{prefix}Saving trace to {path}.')
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'traceEvents': self._events,
+                    'displayTimeUnit': 'ms',
+                    'otherData': {
+                        'match_id': self.match_id,
+                        'clock_offset': self.clock_offset
+                    }
+                }, f)
+
+def merge(paths: list[str]) -> dict[Optional[str], dict[str, Any]]:
+    """
+    Merge the traces in ``paths`` into one trace per match (by match id),
+    on the judge's clock
+    """
+    matches: dict[Optional[str], list[dict[str, Any]]] = {}
+    for path in paths:
+        with open(path, 'r') as f:
+            trace = json.load(f)
+        other_data = trace.get('otherData', {})
+        offset = other_data.get('clock_offset', 0.) * 1e6
+        events = matches.setdefault(other_data.get('match_id'), [])
+        for event in trace['traceEvents']:
+            if 'ts' in event:
+                event['ts'] += offset
+            events.append(event)
+    return {
+        match_id: {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms'
+        }
+        for match_id, events in matches.items()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge the traces of the judge and the bridges into one '
+        'timeline per match.')
+    parser.add_argument('traces', nargs='+', help='Trace files to merge.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        required=True,
+        help='Path to save the merged trace to. If the traces are of '
+        'several matches, the match id is added as a suffix.')
+    args = parser.parse_args()
+    merged = merge(args.traces)
+    for match_id, trace in merged.items():
+        path = (args.output
+                if len(merged) == 1 else f'{args.output}.{match_id}')
+        print(f'Saving merged trace to {path}.')
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+"""
+Batched Grid Race environments for learning agents, without the judge and
+the socket protocol.
+
+``VectorGridRaceEnv`` runs ``num_envs`` independent races of the same track
+with the rules of ``grid_race_env.Circuit`` and ``run.GridRaceEnv``, with
+NumPy operations over the whole batch. Every player of every race is
+controlled through ``step``; a call of ``step`` is one turn of every race.
+``SubprocVectorGridRaceEnv`` splits the batch between worker processes.
+
+Run from the judge directory to measure the throughput:
+``python vector_env.py ../maps/large1.png``.
+"""
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import time
+import numpy as np
+import grid_race_env
+
+from typing import Any, Optional, Sequence
+
+CellType = grid_race_env.CellType
+
+#: the nine accelerations, action ``a`` is ``ACTIONS[a]``, i.e.,
+#: ``(a // 3 - 1, a % 3 - 1)``
+ACTIONS = np.mgrid[-1:2, -1:2].reshape(2, -1).T
+#: value of the window cells outside the visibility radius (as in the
+#: observations of the judge)
+NOT_VISIBLE = 3
+#: penalty (skipped turns) for an invalid move, as in ``run.GridRaceEnv``
+INVALID_ACTION_PENALTY = 5
+
+# Oil and sand exist only in some tiers
+_OIL = getattr(CellType, 'OIL', None)
+_SAND = getattr(CellType, 'SAND', None)
+
+#: observations: name -> array, the first two axes are environment and player
+Observation = dict[str, np.ndarray]
+
+class VectorGridRaceEnv:
+    """
+    A batch of races on the same track.
+
+    Observations are a dict of arrays, indexed by environment and player:
+
+    - ``window``: ``(num_envs, num_players, 2r+1, 2r+1)`` int8, the cells
+      around the player (r is the visibility radius), ``NOT_VISIBLE``
+      outside of the radius and ``CellType.WALL`` outside of the track,
+    - ``position`` and ``velocity``: ``(num_envs, num_players, 2)``,
+    - ``enemies``: ``(num_envs, num_players, num_players - 1, 2)``, the
+      positions of the other players relative to the player, zero for the
+      ones outside of the visibility radius,
+    - ``enemies_visible``: ``(num_envs, num_players, num_players - 1)``
+      bool, whether the other players are within the visibility radius.
+
+    Rewards are -1 for every turn a player has not reached the goal, and an
+    extra -1 when the race runs out of turns; the sum of the rewards of a
+    race is minus the score the judge would give.
+
+    Arguments
+    ---------
+    track
+        The cell values (``CellType.value``) of the track.
+    start
+        The starting positions, player ``i`` starts from ``start[i]``.
+    seed
+        Seed of the random numbers of oil and sand, see also ``reset``.
+    """
+
+    def __init__(self,
+                 track: np.ndarray,
+                 start: np.ndarray,
+                 num_envs: int,
+                 num_players: int = 1,
+                 *,
+                 visibility_radius: int,
+                 max_turns: int = 500,
+                 seed: Optional[int] = 1):
+        if num_players > len(start):
+            raise ValueError(f'The track has only {len(start)} starting '
+                             f'positions for {num_players} players')
+        self.track = np.asarray(track, dtype=np.int8)
+        self.start = np.asarray(start)[:num_players]
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.visibility_radius = visibility_radius
+        self.max_turns = max_turns
+        self._traversable = self.track >= 0
+        self._goal = self.track == CellType.GOAL.value
+        r = visibility_radius
+        # walls around the track, so that windows never leave the array
+        self._padded_track = np.pad(
+            self.track, r, constant_values=CellType.WALL.value)
+        size = 2*r + 1
+        offsets = np.arange(size)
+        # window cell (i, j) of a player at (x, y) is padded cell (x+i, y+j)
+        self._window_offsets = (offsets[:, np.newaxis]
+                                * self._padded_track.shape[1]
+                                + offsets[np.newaxis, :]).ravel()
+        self._window_hidden = ((offsets[:, np.newaxis] - r)**2
+                               + (offsets[np.newaxis, :] - r)**2
+                               > r**2).ravel()
+        # the other players of each player
+        self._others = np.array(
+            [[q for q in range(num_players) if q != p]
+             for p in range(num_players)],
+            dtype=int).reshape(num_players, num_players - 1)
+        self._rng = np.random.default_rng(seed)
+        shape = (num_envs, num_players)
+        self._pos = np.zeros(shape + (2,), dtype=int)
+        self._vel = np.zeros(shape + (2,), dtype=int)
+        self._penalties = np.zeros(shape, dtype=int)
+        self._won = np.zeros(shape, dtype=bool)
+        self._scores = np.zeros(shape, dtype=int)
+        self._turns = np.zeros(num_envs, dtype=int)
+
+    @classmethod
+    def from_circuit(cls, circuit: grid_race_env.Circuit, num_envs: int,
+                     num_players: int = 1,
+                     **kwargs: Any) -> 'VectorGridRaceEnv':
+        to_int = np.vectorize(lambda c: c.value)
+        return cls(
+            to_int(circuit.track), circuit.start, num_envs, num_players,
+            **kwargs)
+
+    def reset(self, seeds: Optional[Sequence[int]] = None) -> Observation:
+        """
+        Start all the races over. ``seeds`` (one per environment) reseed the
+        random numbers, the same seeds give the same races.
+        """
+        if seeds is not None:
+            if len(seeds) != self.num_envs:
+                raise ValueError(f'Expected {self.num_envs} seeds, got '
+                                 f'{len(seeds)}')
+            self._rng = np.random.default_rng(list(seeds))
+        self._reset_envs(np.arange(self.num_envs))
+        return self._observe()
+
+    def _reset_envs(self, envs: np.ndarray) -> None:
+        self._pos[envs] = self.start
+        self._vel[envs] = 0
+        self._penalties[envs] = 0
+        self._won[envs] = False
+        self._scores[envs] = self.max_turns + 1
+        self._turns[envs] = 0
+
+    def step(
+        self, actions: np.ndarray
+    ) -> tuple[Observation, np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        """
+        Play a turn in every race: the players move one after the other in
+        the order of their indices, like in the judge.
+
+        ``actions`` are indices of ``ACTIONS``, of shape ``(num_envs,
+        num_players)``; the ones of players who are in penalty or who have
+        already finished are ignored.
+
+        Returns the observations, the rewards ``(num_envs, num_players)``,
+        the ``(num_envs,)`` done flags and an info dict with the
+        ``scores`` of the races (valid where done). Finished races are reset
+        right away, so their observations are the first ones of their next
+        races.
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, self.num_players)
+        deltas = ACTIONS[actions]
+        for player in range(self.num_players):
+            self._move(player, deltas[:, player])
+        rewards = np.where(self._won, 0., -1.)
+        self._turns += 1
+        timeout = self._turns >= self.max_turns
+        rewards[timeout[:, np.newaxis] & ~self._won] -= 1
+        dones = timeout | self._won.all(axis=1)
+        info = {'scores': self._scores.copy()}
+        done_envs = np.flatnonzero(dones)
+        if len(done_envs):
+            self._reset_envs(done_envs)
+        return self._observe(), rewards, dones, info
+
+    def _move(self, player: int, deltas: np.ndarray) -> None:
+        """
+        The turn of ``player`` in every race, see ``Circuit.move_player``
+        and ``GridRaceEnv.step``
+        """
+        racing = ~self._won[:, player]
+        waiting = racing & (self._penalties[:, player] > 0)
+        self._penalties[waiting, player] -= 1
+        envs = np.flatnonzero(racing & ~waiting)
+        if not len(envs):
+            return
+        pos = self._pos[envs, player]
+        vel = self._vel[envs, player]
+        delta = deltas[envs]
+        cells = self.track[pos[:, 0], pos[:, 1]]
+        moving = np.any(vel != 0, axis=1)
+        if _SAND is not None:
+            # a random one of the three accelerations resulting in the
+            # smallest speeds
+            sand = np.flatnonzero(moving & (cells == _SAND.value))
+            speeds = np.linalg.norm(
+                vel[sand, np.newaxis, :] + ACTIONS[np.newaxis, :, :], axis=2)
+            slowest = np.argsort(speeds, axis=1)[:, :3]
+            choice = self._rng.integers(0, 3, size=len(sand))
+            delta[sand] = ACTIONS[slowest[np.arange(len(sand)), choice]]
+        if _OIL is not None:
+            oil = np.flatnonzero(moving & (cells == _OIL.value))
+            delta[oil] = self._rng.integers(-1, 2, size=(len(oil), 2))
+        new_pos = pos + vel + delta
+        valid = self._valid_lines(pos, new_pos)
+        others = self._pos[envs][:, self._others[player]]
+        valid &= ~np.any(
+            np.all(others == new_pos[:, np.newaxis, :], axis=2), axis=1)
+        moved, stopped = envs[valid], envs[~valid]
+        self._pos[moved, player] = new_pos[valid]
+        self._vel[moved, player] = vel[valid] + delta[valid]
+        self._vel[stopped, player] = 0
+        self._penalties[stopped, player] = INVALID_ACTION_PENALTY
+        arrived = self._goal[new_pos[valid, 0], new_pos[valid, 1]]
+        self._won[moved[arrived], player] = True
+        self._scores[moved[arrived], player] = self._turns[moved[arrived]]
+
+    def _valid_lines(self, pos1: np.ndarray, pos2: np.ndarray) -> np.ndarray:
+        """
+        ``Circuit.valid_line`` for every row of ``pos1`` and ``pos2``
+        """
+        shape = np.array(self.track.shape)
+        valid = np.all((pos2 >= 0) & (pos2 < shape), axis=1)
+        diff = pos2 - pos1
+        # Go through the lines along the first, then along the second axis,
+        # like ``Circuit.valid_line``
+        for axis in (0, 1):
+            other = 1 - axis
+            rows = np.flatnonzero(valid & (diff[:, axis] != 0))
+            if not len(rows):
+                continue
+            length = np.abs(diff[rows, axis])
+            d = np.sign(diff[rows, axis])[:, np.newaxis]
+            slope = (diff[rows, other] / diff[rows, axis])[:, np.newaxis]
+            i = np.arange(length.max() + 1)[np.newaxis, :]
+            on_line = i <= length[:, np.newaxis]
+            # the steps beyond the end of shorter lines examine their ends
+            along = np.where(on_line, pos1[rows, axis, np.newaxis] + i*d,
+                             pos2[rows, axis, np.newaxis])
+            across = np.where(on_line,
+                              pos1[rows, other, np.newaxis] + i*slope*d,
+                              pos2[rows, other, np.newaxis])
+            ceil = np.clip(np.ceil(across).astype(int), 0, shape[other] - 1)
+            floor = np.clip(np.floor(across).astype(int), 0, shape[other] - 1)
+            if axis == 0:
+                blocked = (~self._traversable[along, ceil]
+                           & ~self._traversable[along, floor])
+            else:
+                blocked = (~self._traversable[ceil, along]
+                           & ~self._traversable[floor, along])
+            valid[rows[np.any(blocked, axis=1)]] = False
+        return valid
+
+    def _observe(self) -> Observation:
+        pos = self._pos
+        corners = pos[..., 0] * self._padded_track.shape[1] + pos[..., 1]
+        window = self._padded_track.ravel()[corners[..., np.newaxis]
+                                            + self._window_offsets]
+        window[..., self._window_hidden] = NOT_VISIBLE
+        size = 2*self.visibility_radius + 1
+        enemies = pos[:, self._others] - pos[:, :, np.newaxis, :]
+        visible = (np.sum(enemies**2, axis=-1) <= self.visibility_radius**2)
+        enemies[~visible] = 0
+        return {
+            'window': window.reshape(pos.shape[:2] + (size, size)),
+            'position': pos.copy(),
+            'velocity': self._vel.copy(),
+            'enemies': enemies,
+            'enemies_visible': visible,
+        }
+
+def _worker(connection: multiprocessing.connection.Connection,
+            env_args: tuple, env_kwargs: dict[str, Any]) -> None:
+    env = VectorGridRaceEnv(*env_args, **env_kwargs)
+    while True:
+        command, arg = connection.recv()
+        if command == 'reset':
+            connection.send(env.reset(arg))
+        elif command == 'step':
+            connection.send(env.step(arg))
+        elif command == 'close':
+            connection.close()
+            return
+
+class SubprocVectorGridRaceEnv:
+    """
+    ``VectorGridRaceEnv`` with the environments split between
+    ``num_workers`` processes, stepped in parallel. Same interface and
+    arguments, except for ``seed``: worker ``i`` is seeded with ``seed +
+    i``.
+
+    Call ``close`` (or use it as a context manager) to stop the workers.
+    """
+
+    def __init__(self,
+                 track: np.ndarray,
+                 start: np.ndarray,
+                 num_envs: int,
+                 num_players: int = 1,
+                 *,
+                 num_workers: int,
+                 seed: Optional[int] = 1,
+                 **kwargs: Any):
+        self.num_envs = num_envs
+        self.num_players = num_players
+        # environments [_bounds[i], _bounds[i + 1]) belong to worker i
+        self._bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self._connections = []
+        self._processes = []
+        for i in range(num_workers):
+            parent, child = multiprocessing.Pipe()
+            size = self._bounds[i + 1] - self._bounds[i]
+            worker_seed = None if seed is None else seed + i
+            process = multiprocessing.Process(
+                target=_worker,
+                args=(child, (track, start, size, num_players), {
+                    **kwargs, 'seed': worker_seed
+                }),
+                daemon=True)
+            process.start()
+            child.close()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    @classmethod
+    def from_circuit(cls, circuit: grid_race_env.Circuit, num_envs: int,
+                     num_players: int = 1,
+                     **kwargs: Any) -> 'SubprocVectorGridRaceEnv':
+        to_int = np.vectorize(lambda c: c.value)
+        return cls(
+            to_int(circuit.track), circuit.start, num_envs, num_players,
+            **kwargs)
+
+    def reset(self, seeds: Optional[Sequence[int]] = None) -> Observation:
+        for i, connection in enumerate(self._connections):
+            connection.send(('reset', None if seeds is None else
+                             seeds[self._bounds[i]:self._bounds[i + 1]]))
+        return self._concatenate(
+            [connection.recv() for connection in self._connections])
+
+    def step(
+        self, actions: np.ndarray
+    ) -> tuple[Observation, np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+        actions = np.asarray(actions).reshape(self.num_envs, self.num_players)
+        for i, connection in enumerate(self._connections):
+            connection.send(
+                ('step', actions[self._bounds[i]:self._bounds[i + 1]]))
+        results = [connection.recv() for connection in self._connections]
+        observations, rewards, dones, infos = zip(*results)
+        return (self._concatenate(observations), np.concatenate(rewards),
+                np.concatenate(dones), self._concatenate(infos))
+
+    @staticmethod
+    def _concatenate(
+            parts: Sequence[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        return {
+            key: np.concatenate([part[key] for part in parts])
+            for key in parts[0]
+        }
+
+    def close(self) -> None:
+        for connection in self._connections:
+            connection.send(('close', None))
+            connection.close()
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
+
+    def __enter__(self) -> 'SubprocVectorGridRaceEnv':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the throughput of the batched environments '
+        'with random actions.')
+    parser.add_argument('track_file', help='Map of the races.')
+    parser.add_argument(
+        '--envs',
+        type=int,
+        default=4096,
+        help='Number of environments. Default is 4096.')
+    parser.add_argument(
+        '--players',
+        type=int,
+        default=1,
+        help='Number of players of each race. Default is 1.')
+    parser.add_argument(
+        '--radius',
+        type=int,
+        default=8,
+        help='Visibility radius. Default is 8.')
+    parser.add_argument(
+        '--steps',
+        type=int,
+        default=200,
+        help='Number of steps of every environment. Default is 200.')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='Number of worker processes, 0 runs the environments in this '
+        'process. Default is 0.')
+    args = parser.parse_args()
+    circuit = grid_race_env.load_track_from_file(args.track_file)
+    kwargs = {'visibility_radius': args.radius}
+    if args.workers:
+        env = SubprocVectorGridRaceEnv.from_circuit(
+            circuit, args.envs, args.players, num_workers=args.workers,
+            **kwargs)
+    else:
+        env = VectorGridRaceEnv.from_circuit(circuit, args.envs, args.players,
+                                             **kwargs)
+    rng = np.random.default_rng(0)
+    actions = rng.integers(0, len(ACTIONS),
+                           size=(args.steps, args.envs, args.players))
+    env.reset(list(range(args.envs)))
+    races = 0
+    tick = time.perf_counter()
+    for step_actions in actions:
+        _, _, dones, _ = env.step(step_actions)
+        races += np.count_nonzero(dones)
+    tock = time.perf_counter()
+    if args.workers:
+        env.close()
+    print(f'{args.envs * args.steps / (tock-tick):,.0f} environment steps/s '
+          f'({races} races finished)')
+
+if __name__ == "__main__":
+    main()
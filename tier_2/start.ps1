@@ -19,14 +19,23 @@ if ($replay_flag -eq "--replay") {
     $replay_arg = "--replay_file ./last_replay"
 }
 
-Start-Process -FilePath "python" -ArgumentList "$($workdir)run.py", $config_file, $player_num, $replay_arg -NoNewWindow
-
-Start-Sleep -Seconds 3
+$ready_file = "$($workdir).judge_ready"
+Remove-Item $ready_file -ErrorAction SilentlyContinue
+$judge = Start-Process -FilePath "python" -ArgumentList "$($workdir)run.py", $config_file, $player_num, $replay_arg, "--ready_file", $ready_file -NoNewWindow -PassThru
+
+# Wait until the judge accepts connections
+while (-not (Test-Path $ready_file)) {
+    if ($judge.HasExited) {
+        Write-Host "The judge exited before accepting connections."
+        exit 1
+    }
+    Start-Sleep -Milliseconds 50
+}
+Remove-Item $ready_file
 Write-Host "starting players"
 
-Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/winnerBot/bot.py" -NoNewWindow
-#Start-Sleep -Seconds 1
-#Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/lieutenant_crown_him_with_many_crowns_thy_full_gallant_legions_he_found_it_in_him_to_forgive.py" -NoNewWindow
+Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/winnerBot/bot.py", "--player_name", "winnerBot" -NoNewWindow
+#Start-Process -FilePath "python" -ArgumentList "$($bots_dir)client_bridge.py", "bot/lieutenant_crown_him_with_many_crowns_thy_full_gallant_legions_he_found_it_in_him_to_forgive.py", "--player_name", "lieutenant" -NoNewWindow
 
 
 # Wait for judge process to complete
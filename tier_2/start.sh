@@ -19,15 +19,25 @@ echo "starting judge with $player_num players..."
 if [[ "$replay_flag" == "--replay" ]]; then
   replay_arg="--replay_file ./last_replay"
 fi
-python3 $workdir"run.py" $config_file $player_num $replay_arg &
-
-sleep 3
+ready_file=$workdir".judge_ready"
+rm -f $ready_file
+python3 $workdir"run.py" $config_file $player_num $replay_arg --ready_file $ready_file &
+judge_pid=$!
+
+# wait until the judge accepts connections
+while [[ ! -f $ready_file ]]; do
+  if ! kill -0 $judge_pid 2>/dev/null; then
+    echo "The judge exited before accepting connections."
+    exit 1
+  fi
+  sleep 0.05
+done
+rm -f $ready_file
 echo "starting players"
 
 
-python3 $bots_dir"client_bridge.py" "bot/winnerBot/bot.py" &
-sleep 1
-python3 $bots_dir"client_bridge.py" "bot/lieutenant_crown_him_with_many_crowns_thy_full_gallant_legions_he_found_it_in_him_to_forgive.py" &
+python3 $bots_dir"client_bridge.py" "bot/winnerBot/bot.py" --player_name winnerBot &
+python3 $bots_dir"client_bridge.py" "bot/lieutenant_crown_him_with_many_crowns_thy_full_gallant_legions_he_found_it_in_him_to_forgive.py" --player_name lieutenant &
 
 
 
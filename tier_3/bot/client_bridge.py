@@ -1,92 +1,237 @@
 #!/usr/bin/env python
 import os
+import socket
+import collections
 import subprocess
 import asyncio
 import datetime
 import threading
-import socket
 import argparse
+import json
 import sys
 import textwrap
+import time
 from typing import Optional
 import network
+import resources
+import tracing
+import zygote
 
 LOGGING = True
+#: kinds of lines written to the communication log at each level
+LOG_LEVELS = {
+    'off': frozenset(),
+    'control': frozenset(['control']),
+    'io': frozenset(['control', 'stdin', 'stdout']),
+    'all': frozenset(['control', 'stdin', 'stdout', 'stderr']),
+}
+DEFAULT_LOG_LEVEL = 'all' if LOGGING else 'off'
 BOT_READY_SIGNAL = 'READY'
+# Bots may list capabilities after the ready signal, e.g. "READY series"
+BOT_CAPABILITY_SERIES = 'series'
+BOT_RESET_SIGNAL = '~~~RESET~~~\n'
+BOT_END_SIGNAL = '~~~END~~~\n'
+#: time (in seconds) between the samples of the resource usage of the bots
+DEFAULT_RESOURCE_INTERVAL = 1.
 
 class Logger:
+    """
+    Communication log, written by a background thread.
+
+    The ``write_*`` methods only append the line and a timestamp to a
+    bounded buffer; the thread formats them and writes them in batches, with
+    one flush per batch. If the buffer is full, the oldest lines are dropped
+    (and their number is logged).
+
+    Only the lines of the kinds included in ``level`` are logged, see
+    ``LOG_LEVELS``.
+    """
+
+    #: maximum number of lines waiting to be written
+    BUFFER_SIZE = 1 << 14
+    #: time (in seconds) to collect lines before writing them
+    FLUSH_INTERVAL = 0.1
 
-    def __init__(self, fname: str):
+    def __init__(self, fname: str, level: str = 'all'):
         self.f = open(fname, 'w')  # pylint: disable=consider-using-with
-        self.lock = threading.Lock()
+        self._kinds = LOG_LEVELS[level]
+        self._buffer: collections.deque[tuple[float, str, str]] = (
+            collections.deque(maxlen=self.BUFFER_SIZE))
+        self._dropped = 0
+        self._closed = False
+        self._wakeup = threading.Condition()
+        self._thread = threading.Thread(target=self._write_batches,
+                                        name='logger',
+                                        daemon=True)
+        self._thread.start()
 
-    def write_stdout(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stdout  :: '
-                f'{msg}\n')
+    def _write(self, kind: str, msg: str) -> None:
+        if kind not in self._kinds:
+            return
+        with self._wakeup:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+            was_empty = not self._buffer
+            self._buffer.append((time.time(), kind, msg))
+            if was_empty:
+                self._wakeup.notify()
+
+    def _write_batches(self) -> None:
+        while True:
+            with self._wakeup:
+                self._wakeup.wait_for(lambda: self._buffer or self._closed)
+            if not self._closed:
+                # let the lines of the turn arrive
+                time.sleep(self.FLUSH_INTERVAL)
+            with self._wakeup:
+                batch = list(self._buffer)
+                self._buffer.clear()
+                dropped, self._dropped = self._dropped, 0
+                closed = self._closed
+            lines = []
+            if dropped:
+                lines.append(f'{self._timestamp(time.time())} - control :: '
+                             f'{dropped} lines were dropped from the log.\n')
+            lines += [
+                f'{self._timestamp(t)} - {kind:<7} :: {msg}\n'
+                for t, kind, msg in batch
+            ]
+            self.f.writelines(lines)
             self.f.flush()
+            if closed:
+                return
+
+    @staticmethod
+    def _timestamp(t: float) -> str:
+        return datetime.datetime.fromtimestamp(t).time().isoformat()
+
+    def write_stdout(self, msg: str):
+        self._write('stdout', msg)
 
     def write_stderr(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stderr  :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._write('stderr', msg)
 
     def write_stdin(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - stdin   :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._write('stdin', msg)
 
     def write_control(self, msg: str):
-        with self.lock:
-            self.f.write(
-                f'{datetime.datetime.now().time().isoformat()} - control :: '
-                f'{msg}\n')
-            self.f.flush()
+        self._write('control', msg)
 
     def close(self):
-        with self.lock:
-            self.f.close()
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        self.f.close()
 
 class SubmissionManager():
-    socket: socket.socket
+    connection: network.StreamConnection
     # Pylint doesn't find `Process`
-    submission_process: asyncio.subprocess.Process  # pylint: disable=no-member
+    submission_process: (
+        asyncio.subprocess.Process  # pylint: disable=no-member
+        | zygote.ZygoteProcess)
     logger: Optional[Logger]
+    tracer: Optional[tracing.Tracer]
+
+    #: maximum number of bytes read from the bot's stdout or stderr at once
+    STDOUT_CHUNK_SIZE = 1 << 16
+    #: first and maximum delay (in seconds) between connection attempts
+    CONNECT_RETRY_DELAY = 0.01
+    CONNECT_MAX_RETRY_DELAY = 0.5
+    #: time (in seconds) to wait for the rest of the bot's stderr at exit
+    CLOSE_TIMEOUT = 1
+
+    def __init__(self,
+                 judge_address: str,
+                 exe_cmd: list[str],
+                 init_timeout: float,
+                 match_id: Optional[str] = None,
+                 player_name: Optional[str] = None,
+                 connect_timeout: float = 10,
+                 bot_index: Optional[int] = None,
+                 zygote_address: Optional[str] = None,
+                 log_level: str = DEFAULT_LOG_LEVEL,
+                 trace_file: Optional[str] = None,
+                 resource_interval: float = DEFAULT_RESOURCE_INTERVAL,
+                 resource_file: Optional[str] = None,
+                 limits: resources.Limits = resources.Limits()) -> None:
+        """
+        ``bot_index`` tells bots apart in the names of the log files when a
+        bridge runs several of them, see ``run_managers``.
+
+        Python bots are forked by the zygote at ``zygote_address`` if it is
+        given (see ``zygote.py``), other bots are always started as new
+        processes.
 
-    def __init__(self, judge_address: str, exe_cmd: list[str],
-                 init_timeout: float) -> None:
-        if LOGGING:
+        There is no communication log if ``log_level`` is "off", see
+        ``LOG_LEVELS``.
+
+        If ``trace_file`` is given, the timeline of the forwarding and of the
+        bot's compute time is saved there at exit (see ``tracing.py``).
+
+        The CPU time and the memory of the bot are sampled every
+        ``resource_interval`` seconds (never if it is 0) and before it ends,
+        reported to the judge if it takes them, and saved to
+        ``resource_file`` at exit, if it is given (see ``resources.py``).
+        Every process of the bot is started with the given ``limits``.
+        """
+        suffix = '' if bot_index is None else f'.{bot_index}'
+        if log_level != 'off':
             self.logger = Logger(
                 'communication.'
                 f'{datetime.datetime.now().strftime("%Y%m%d_%H%M%S.%f")[:-3]}'
-                '.log')
+                f'{suffix}.log', log_level)
         else:
             self.logger = None
+        self._name = player_name or os.path.basename(exe_cmd[-1]) + suffix
+        # the bots of one bridge get a track each in its process
+        self._track = bot_index or 0
+        if trace_file is not None:
+            self.tracer = tracing.Tracer('bridge', match_id)
+            self.tracer.name_thread(self._track, self._name)
+            self._trace_file: Optional[str] = trace_file + suffix
+        else:
+            self.tracer = None
+            self._trace_file = None
+        # when the hello was sent, to align the clocks on the welcome, unless
+        # the judge is on the same host (and so on the same clock)
+        self._hello_time = 0.
+        self._sync_clock = True
+        # when the bot was given its input, until it replies
+        self._input_time: Optional[float] = None
+        # whether the judge takes the compute time of the replies
+        self._send_timings = False
+        self.usage = resources.UsageTracker()
+        self._resource_interval = resource_interval
+        self._resource_file = (None if resource_file is None else
+                               resource_file + suffix)
+        # whether the judge takes the resource usage
+        self._send_resources = False
+        self._resource_task: Optional[asyncio.Task] = None
+        self._limits = limits
         self._judge_address = judge_address
         self._exe_cmd = exe_cmd
         self._init_timeout = init_timeout
+        self._connect_timeout = connect_timeout
+        self._zygote_address = zygote_address
+        self._match_id = match_id
+        self._player_name = player_name
+        self._bot_capabilities: set[str] = set()
+        self._task_group: Optional[asyncio.TaskGroup] = None
+        self._stdout_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
 
     async def start(self):
-        # Start submitted program
-        if self.logger is not None:
-            self.logger.write_control('Starting bot process.')
-        self.submission_process = await asyncio.create_subprocess_exec(
-            *self._exe_cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+        await self.start_bot()
         try:
             await self.bot_initialisation()
+            if self._resource_interval > 0:
+                self._resource_task = asyncio.create_task(
+                    self.sample_resources())
             async with asyncio.TaskGroup() as tg:
-                tg.create_task(self.read_stdout())
+                self._task_group = tg
+                self.start_bot_readers()
                 tg.create_task(self.listen_to_server())
-                if self.logger is not None:
-                    tg.create_task(self.read_stderr())
         except RuntimeError as e:
             if self.logger is not None:
                 self.logger.write_control(f'Exiting: {e}')
@@ -94,10 +239,79 @@ class SubmissionManager():
         finally:
             await self.close()
 
+    async def start_bot(self) -> None:
+        # Start submitted program
+        if self.logger is not None:
+            self.logger.write_control('Starting bot process.')
+        bot_path = self._exe_cmd[-1]
+        if self._zygote_address is not None and bot_path.endswith('.py'):
+            self.submission_process = await zygote.ZygoteProcess.spawn(
+                self._zygote_address, bot_path, self._limits)
+        else:
+            self.submission_process = await asyncio.create_subprocess_exec(
+                *resources.limited_command(self._exe_cmd, self._limits),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+        if self.tracer is not None:
+            self.tracer.name_process(f'bot {self._name}',
+                                     self.submission_process.pid)
+        # from the start and even if it is not logged, so that the bot never
+        # blocks on a full pipe
+        assert self.submission_process.stderr is not None
+        self._stderr_task = asyncio.create_task(
+            self.read_stderr(self.submission_process.stderr))
+
+    def start_bot_readers(self) -> None:
+        """
+        Start forwarding the output of the (current) bot process
+        """
+        assert self._task_group is not None
+        self._stdout_task = self._task_group.create_task(self.read_stdout())
+
     async def bot_initialisation(self) -> None:
         """
         Wait until the bot initialises then connect to server
         """
+        await self.wait_for_bot_ready()
+        if self.logger is not None:
+            self.logger.write_control(
+                'Bot has initialised, connecting to server.')
+        # Connect to judge
+        # JSON until the judge chooses otherwise in its ``welcome``
+        sock = await self.connect_to_judge()
+        self._sync_clock = not network.is_local(sock)
+        self.connection = await network.open_stream_connection(sock)
+        self._hello_time = tracing.clock()
+        self.connection.send_control(
+            'hello',
+            match_id=self._match_id,
+            player_name=self._player_name,
+            formats=network.SUPPORTED_FORMATS,
+            capabilities=sorted(self._bot_capabilities))
+        await self.connection.drain()
+
+    async def connect_to_judge(self) -> socket.socket:
+        """
+        Connect to the judge, retrying with exponential backoff while it is
+        not listening yet, for at most ``connect_timeout`` seconds
+        """
+        deadline = time.monotonic() + self._connect_timeout
+        delay = self.CONNECT_RETRY_DELAY
+        while True:
+            try:
+                return network.connect(self._judge_address)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # no listening socket, or no Unix socket file yet
+                if time.monotonic() + delay > deadline:
+                    raise
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, self.CONNECT_MAX_RETRY_DELAY)
+
+    async def wait_for_bot_ready(self) -> None:
+        """
+        Wait for the ready signal of the bot and store its capabilities
+        """
         assert self.submission_process.stdout is not None
         try:
             line: str = (await asyncio.wait_for(
@@ -106,69 +320,222 @@ class SubmissionManager():
         except TimeoutError as e:
             raise RuntimeError('Bot initialisation timeout') from e
         if not line:
+            await self.check_limits_applied()
             raise RuntimeError('Bot did not initialise.')
         line = line.removesuffix('\n')  # see ``read_stdout``
-        if line != BOT_READY_SIGNAL:
+        signal, *capabilities = line.split(' ')
+        if signal != BOT_READY_SIGNAL:
             print(f'Warning: first line from bot is not {BOT_READY_SIGNAL}:\n'
                   f'{textwrap.shorten(line, 80)}')
+            capabilities = []
+        self._bot_capabilities = set(capabilities)
+
+    async def check_limits_applied(self) -> None:
+        """
+        Raise if the bot, which closed its stdout, exits because its limits
+        could not be set (the reason is in its stderr)
+        """
+        if self._limits == resources.Limits():
+            return
+        try:
+            returncode = await asyncio.wait_for(
+                self.submission_process.wait(), timeout=self._init_timeout)
+        except TimeoutError:
+            return
+        if returncode == resources.LIMITS_FAILED:
+            raise RuntimeError('Failed to limit the bot.')
+
+    async def reset_bot(self) -> None:
+        """
+        Prepare the bot for the next race of a series.
+
+        Bots announcing the ``series`` capability get the reset signal and
+        keep running, others get the end signal and are restarted.
+        """
+        assert self.submission_process.stdin is not None
+        self.sample_usage()
+        if BOT_CAPABILITY_SERIES in self._bot_capabilities:
+            if self.logger is not None:
+                self.logger.write_control('Resetting bot.')
+            self.submission_process.stdin.write(
+                BOT_RESET_SIGNAL.encode('utf8'))
+            await self.submission_process.stdin.drain()
+            return
         if self.logger is not None:
-            self.logger.write_control(
-                'Bot has initialised, connecting to server.')
-        # Connect to judge
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.connect((self._judge_address, network.JUDGE_PORT))
+            self.logger.write_control('Restarting bot.')
+        try:
+            self.submission_process.stdin.write(BOT_END_SIGNAL.encode('utf8'))
+            await self.submission_process.stdin.drain()
+            await asyncio.wait_for(
+                self.submission_process.wait(), timeout=self._init_timeout)
+        except (TimeoutError, ConnectionResetError):
+            if self.submission_process.returncode is None:
+                self.submission_process.terminate()
+                await self.submission_process.wait()
+        if self._stdout_task is not None:
+            # Every line of the old process has to be forwarded before the
+            # new one starts
+            await self._stdout_task
+        await self.start_bot()
+        await self.wait_for_bot_ready()
+        self.start_bot_readers()
 
     async def read_stdout(self):
         assert self.submission_process.stdout is not None
+        partial_line = b''
+        lines: list[str] = []
         try:
             while True:
-                # ``readline`` will return the ending newline, this is good
-                # when the line is empty (i.e., it will return a string with
-                # the newline character, and it will not quit the loop). At
-                # EOF, however, it will return an empty string.
-                line: str = (
-                    await
-                    self.submission_process.stdout.readline()).decode('utf8')
-                if not line:
-                    break
-                line = line.removesuffix('\n')
+                # Read whatever is available, so that lines printed together
+                # are forwarded together. At EOF, ``read`` returns an empty
+                # bytes object; an unterminated last line is still forwarded.
+                chunk = await self.submission_process.stdout.read(
+                    self.STDOUT_CHUNK_SIZE)
+                read_time = tracing.clock()
+                if not chunk:
+                    if not partial_line:
+                        break
+                    chunk = b'\n'
+                *complete, partial_line = (partial_line + chunk).split(b'\n')
+                if not complete:
+                    continue
+                lines = [line.decode('utf8') for line in complete]
                 if self.logger is not None:
-                    self.logger.write_stdout(line)
-                network.send_data(self.socket, line)
+                    for line in lines:
+                        self.logger.write_stdout(line)
+                # from the input to the first line of the reply
+                compute_time = None
+                if self._input_time is not None:
+                    compute_time = read_time - self._input_time
+                    if self.tracer is not None:
+                        self.tracer.complete('compute',
+                                             self._input_time,
+                                             read_time,
+                                             pid=self.submission_process.pid)
+                    self._input_time = None
+                if not self._send_timings:
+                    compute_time = None
+                if len(lines) == 1:
+                    self.connection.send_data(lines[0], compute_time)
+                else:
+                    self.connection.send_lines(lines, compute_time)
+                await self.connection.drain()
+                if self.tracer is not None:
+                    self.tracer.complete('reply',
+                                         read_time,
+                                         tracing.clock(),
+                                         tid=self._track,
+                                         args={'lines': len(lines)})
         except network.NetworkError:
             if self.logger is not None:
+                last_lines = '\n'.join(lines)
                 self.logger.write_control(
-                    f'Failed to send last line to server:\n{line}')
+                    f'Failed to send last line to server:\n{last_lines}')
 
-    async def read_stderr(self):
-        # stderr goes only to logging, this thread shouldn't have been
-        # started otherwise
-        assert LOGGING
-        assert self.logger is not None
-        assert self.submission_process.stderr is not None
+    async def read_stderr(self, stderr: asyncio.StreamReader):
+        # stderr goes only to logging
+        partial_line = b''
         while True:
-            line: str = (
-                await self.submission_process.stderr.readline()).decode('utf8')
-            if not line:
+            chunk = await stderr.read(self.STDOUT_CHUNK_SIZE)
+            if not chunk:
                 break
-            line = line.removesuffix('\n')
-            self.logger.write_stderr(line)
+            if self.logger is None:
+                continue
+            *complete, partial_line = (partial_line + chunk).split(b'\n')
+            for line in complete:
+                self.logger.write_stderr(line.decode('utf8', 'replace'))
+        if self.logger is not None and partial_line:
+            self.logger.write_stderr(partial_line.decode('utf8', 'replace'))
 
-    async def listen_to_server(self):
+    async def write_stdin(self, data: list[str]) -> None:
+        """
+        Forward data messages to the bot with a single write
+        """
         assert self.submission_process.stdin is not None
+        if not data:
+            return
+        if self.logger is not None:
+            for d in data:
+                self.logger.write_stdin(d[:-1])
+        if data[-1] == BOT_END_SIGNAL:
+            # the last chance, the bot exits
+            self.sample_usage()
+        self.submission_process.stdin.write(''.join(data).encode('utf8'))
+        self._input_time = tracing.clock()
+        await self.submission_process.stdin.drain()
 
-        def wait_for_message():
-            return network.recv_msg(self.socket)
+    def sample_usage(self) -> None:
+        submission_process = getattr(self, 'submission_process', None)
+        if (submission_process is not None
+                and submission_process.returncode is None):
+            self.usage.sample(submission_process.pid)
 
+    async def sample_resources(self) -> None:
+        """
+        Sample the resource usage of the bot periodically, and report it to
+        the judge if it takes it
+        """
+        while True:
+            await asyncio.sleep(self._resource_interval)
+            self.sample_usage()
+            if self._send_resources:
+                try:
+                    self.connection.send_control('resources',
+                                                 **self.usage.report())
+                    await self.connection.drain()
+                except network.NetworkError:
+                    return
+
+    async def listen_to_server(self):
         try:
             while True:
-                msg = await asyncio.to_thread(wait_for_message)
-                assert msg['type'] == 'data', \
-                        f'{msg["type"]} messages aren\'t supported yet.'
-                if self.logger is not None:
-                    self.logger.write_stdin(msg['data'][:-1])
-                self.submission_process.stdin.write(msg['data'].encode('utf8'))
-                await self.submission_process.stdin.drain()
+                # Messages that arrived together are forwarded together
+                data: list[str] = []
+                msgs = await self.connection.recv_msgs()
+                received = tracing.clock()
+                for msg in msgs:
+                    if msg['type'] == 'data':
+                        data.append(msg['data'])
+                        continue
+                    assert msg['type'] == 'control', \
+                            f'{msg["type"]} messages aren\'t supported yet.'
+                    # the data before a control message goes first
+                    await self.write_stdin(data)
+                    data = []
+                    if msg['command'] == 'welcome':
+                        self.connection.binary = (
+                            msg['format'] == network.FORMAT_BINARY)
+                        self._send_timings = bool(msg.get('timings'))
+                        self._send_resources = bool(msg.get('resources'))
+                        if (self.tracer is not None and self._sync_clock
+                                and 'hello_clock' in msg):
+                            self.tracer.sync_clock(self._hello_time,
+                                                   msg['hello_clock'],
+                                                   msg['clock'], received)
+                        continue
+                    assert msg['command'] == 'reset', \
+                        f'{msg["command"]} messages aren\'t supported yet.'
+                    reset_time = tracing.clock()
+                    await self.reset_bot()
+                    if self._send_resources:
+                        # the usage of the race
+                        self.connection.send_control('resources',
+                                                     **self.usage.report())
+                    self.connection.send_control('ready')
+                    await self.connection.drain()
+                    if self.tracer is not None:
+                        self.tracer.complete('reset',
+                                             reset_time,
+                                             tracing.clock(),
+                                             tid=self._track)
+                if data:
+                    await self.write_stdin(data)
+                    if self.tracer is not None:
+                        self.tracer.complete('forward',
+                                             received,
+                                             tracing.clock(),
+                                             tid=self._track,
+                                             args={'lines': len(data)})
         except network.NetworkError:
             if self.logger is not None:
                 self.logger.write_control(
@@ -176,14 +543,45 @@ class SubmissionManager():
         except ConnectionResetError:
             print('Error: can\'t write to client. Maybe it terminated?')
 
+    def write_resource_file(self, path: str) -> None:
+        print(f'Saving resource usage to {path}.')
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'bot': self._exe_cmd[-1],
+                    'player_name': self._player_name,
+                    **self.usage.report()
+                }, f)
+
     async def close(self) -> None:
+        if self._resource_task is not None:
+            self._resource_task.cancel()
+        self.sample_usage()
         submission_process = getattr(self, 'submission_process', None)
         if (submission_process is not None
                 and submission_process.returncode is None):
             submission_process.terminate()
             await submission_process.wait()
+        if self._stderr_task is not None:
+            # the last lines of the bot are still logged
+            _, pending = await asyncio.wait([self._stderr_task],
+                                            timeout=self.CLOSE_TIMEOUT)
+            for task in pending:
+                task.cancel()
+        connection = getattr(self, 'connection', None)
+        if connection is not None:
+            await connection.close()
+        if self.usage.samples:
+            if self.logger is not None:
+                self.logger.write_control(
+                    f'Resource usage: {self.usage.report()}')
+            if self._resource_file is not None:
+                self.write_resource_file(self._resource_file)
         if self.logger is not None:
             self.logger.close()
+        if self.tracer is not None:
+            assert self._trace_file is not None
+            self.tracer.dump(self._trace_file)
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -192,20 +590,126 @@ def parse_args() -> argparse.Namespace:
         'the network.')
     parser.add_argument(
         'bot_exe',
+        nargs='+',
         help='Path to the bot executable (must have executable or read '
-        'permissions).')
+        'permissions). Several bots can be given, they are all served by '
+        'this process, each with its own connection to the judge.')
     parser.add_argument(
         '--judge_address',
         type=str,
-        default='localhost',
-        help='Address of the judge system. Default is localhost.')
+        action='append',
+        default=None,
+        help='Address of the judge system: "host" or "host:port" for TCP, '
+        '"unix:/path/to/socket" for a Unix domain socket, or "fd:N" for a '
+        'socket inherited from the judge. Give it once for all the bots, or '
+        'once for each of them. Default is localhost.')
+    parser.add_argument(
+        '--connect_timeout',
+        type=float,
+        default=10,
+        help='How long (in seconds) to keep retrying while the judge is not '
+        'accepting connections yet. Default is 10 seconds.')
     parser.add_argument(
         '--init_timeout',
         type=float,
         default=5,
         help='Timeout (in seconds) for bot initialisation. Default is 5 '
         'seconds.')
-    return parser.parse_args()
+    parser.add_argument(
+        '--match_id',
+        type=str,
+        default=None,
+        help='Match to join when the judge hosts several matches '
+        '(run.py --serve), which requires it. Ignored by single-match '
+        'judges.')
+    parser.add_argument(
+        '--player_name',
+        type=str,
+        action='append',
+        default=None,
+        help='Name of the player, used if the judge was not given player '
+        'names. Give it once for each bot.')
+    parser.add_argument(
+        '--log_level',
+        choices=list(LOG_LEVELS),
+        default=DEFAULT_LOG_LEVEL,
+        help='What goes to the communication log: nothing ("off"), the '
+        'messages of the bridge ("control"), the input and the output of the '
+        'bot as well ("io"), or its standard error too ("all"). Default is '
+        f'{DEFAULT_LOG_LEVEL}.')
+    parser.add_argument(
+        '--zygote',
+        type=str,
+        default=None,
+        help='Address of a running zygote.py ("unix:/path/to/socket") to '
+        'fork Python bots from, instead of starting a new interpreter for '
+        'each of them. Default is to start new interpreters.')
+    parser.add_argument(
+        '--trace_file',
+        type=str,
+        default=None,
+        help='Path to save a timeline of the forwarding and of the compute '
+        'time of the bot to, in the Chrome trace event format (see '
+        'tracing.py). The bot index is added as a suffix when there are '
+        'several bots. Optional.')
+    parser.add_argument(
+        '--resource_interval',
+        type=float,
+        default=DEFAULT_RESOURCE_INTERVAL,
+        help='Time (in seconds) between the samples of the CPU time and the '
+        'memory of the bot, reported to the judge. They are sampled before '
+        'the bot ends too, 0 samples only then. Default is '
+        f'{DEFAULT_RESOURCE_INTERVAL} second.')
+    parser.add_argument(
+        '--resource_file',
+        type=str,
+        default=None,
+        help='Path to save the resource usage of the bot to at exit (JSON). '
+        'The bot index is added as a suffix when there are several bots. '
+        'Optional.')
+    parser.add_argument(
+        '--cpus',
+        type=resources.parse_cpus,
+        action='append',
+        default=None,
+        help='CPUs to run the bot on, e.g. "2" or "0-3,6". Give it once for '
+        'all the bots, or once for each of them. Default is any CPU.')
+    parser.add_argument(
+        '--nice',
+        type=int,
+        default=None,
+        help='Niceness of the bots (see nice(1)). Optional.')
+    parser.add_argument(
+        '--cpu_time_limit',
+        type=int,
+        default=None,
+        help='CPU time (in seconds) a bot process may use before it is '
+        'killed (RLIMIT_CPU). Optional.')
+    parser.add_argument(
+        '--memory_limit',
+        type=float,
+        default=None,
+        help='Address space (in MiB) a bot process may use (RLIMIT_AS), '
+        'larger allocations fail. Optional.')
+    args = parser.parse_args()
+    if args.judge_address is None:
+        args.judge_address = ['localhost']
+    if len(args.judge_address) == 1:
+        args.judge_address *= len(args.bot_exe)
+    if len(args.judge_address) != len(args.bot_exe):
+        parser.error('--judge_address should be given once, or once for '
+                     'each bot.')
+    if args.player_name is None:
+        args.player_name = [None] * len(args.bot_exe)
+    if len(args.player_name) != len(args.bot_exe):
+        parser.error('--player_name should be given once for each bot.')
+    if args.cpus is None:
+        args.cpus = [None]
+    if len(args.cpus) == 1:
+        args.cpus *= len(args.bot_exe)
+    if len(args.cpus) != len(args.bot_exe):
+        parser.error('--cpus should be given once, or once for each bot.')
+    return args
 
 def get_execute_command(fname: str) -> list[str]:
     """
@@ -222,16 +726,50 @@ def get_execute_command(fname: str) -> list[str]:
     print('Error: unknown filetype. Exiting.', file=sys.stderr)
     return []
 
+async def run_managers(managers: list[SubmissionManager],
+                       bot_exes: list[str]) -> None:
+    """
+    Run the bots side by side in one event loop. A bot that fails does not
+    stop the others.
+    """
+    results = await asyncio.gather(*(m.start() for m in managers),
+                                   return_exceptions=True)
+    for bot_exe, result in zip(bot_exes, results):
+        if isinstance(result, Exception):
+            print(f'Error: bridge of {bot_exe} failed: {result!r}')
+
 def main():
     args = parse_args()
-    cmd = get_execute_command(args.bot_exe)
-    if not cmd:
+    cmds = [get_execute_command(bot_exe) for bot_exe in args.bot_exe]
+    if not all(cmds):
         return
+    several = len(cmds) > 1
+    managers = [
+        SubmissionManager(judge_address,
+                          cmd,
+                          args.init_timeout,
+                          args.match_id,
+                          player_name,
+                          args.connect_timeout,
+                          bot_index=i if several else None,
+                          zygote_address=args.zygote,
+                          log_level=args.log_level,
+                          trace_file=args.trace_file,
+                          resource_interval=args.resource_interval,
+                          resource_file=args.resource_file,
+                          limits=resources.Limits(
+                              cpus,
+                              args.nice,
+                              args.cpu_time_limit,
+                              None if args.memory_limit is None else
+                              int(args.memory_limit * (1 << 20))))
+        for i, (judge_address, cmd, player_name, cpus) in enumerate(
+            zip(args.judge_address, cmds, args.player_name, args.cpus))
+    ]
     try:
-        manager = SubmissionManager(args.judge_address, cmd, args.init_timeout)
-        asyncio.run(manager.start())
+        asyncio.run(run_managers(managers, args.bot_exe))
     except KeyboardInterrupt:
-        manager.close()
+        # ``start`` closes the managers when it is cancelled
         print('Received keyboard interrupt. Bye.')
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
+import os
+import stat
+import asyncio
 import socket
 import json
 import struct
+import ipaddress
 
-from typing import Any
+from typing import Any, Optional
 
 # won't use text based IO, because:
 # "The socket must be in blocking mode; it can have a timeout, but the file
@@ -13,14 +17,207 @@ Jsonable = Any  # anything JSON can dump
 
 JUDGE_PORT = 10000
 
+# Transports, chosen by the address string:
+# - "host" or "host:port": TCP (default port is ``JUDGE_PORT``),
+# - "unix:/path/to/socket": Unix domain stream socket,
+# - "fd:N": an already connected socket inherited as file descriptor N, e.g.,
+#   one end of a ``socket.socketpair`` when the judge launches the bridges.
+UNIX_PREFIX = 'unix:'
+FD_PREFIX = 'fd:'
+
 class NetworkError(Exception):
     pass
 
-def send_msg(sock: socket.SocketType, msg: Jsonable) -> None:
+def _tcp_address(address: str) -> tuple[str, int]:
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        return address, JUDGE_PORT
+    return host, int(port)
+
+def connect(address: str) -> socket.socket:
+    """
+    Connect to the judge at ``address`` (see the transports above)
+    """
+    if address.startswith(UNIX_PREFIX):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address.removeprefix(UNIX_PREFIX))
+        return sock
+    if address.startswith(FD_PREFIX):
+        return socket.socket(fileno=int(address.removeprefix(FD_PREFIX)))
+    return socket.create_connection(_tcp_address(address))
+
+def create_server(address: Optional[str] = None) -> socket.socket:
+    """
+    Create a listening socket. ``None`` means TCP on all interfaces and
+    ``JUDGE_PORT``.
+
+    A stale Unix socket file is removed before binding; other files are
+    never removed, binding fails on them.
+    """
+    if address is None:
+        return socket.create_server(('', JUDGE_PORT))
+    if address.startswith(UNIX_PREFIX):
+        path = address.removeprefix(UNIX_PREFIX)
+        _unlink_socket(path)
+        return socket.create_server(path, family=socket.AF_UNIX)
+    if address.startswith(FD_PREFIX):
+        raise ValueError(f'Cannot listen on an inherited socket: {address}')
+    return socket.create_server(_tcp_address(address))
+
+def close_server(server_socket: socket.socket) -> None:
+    """
+    Close a socket from ``create_server``, removing its Unix socket file
+    """
+    path = (server_socket.getsockname()
+            if server_socket.family == socket.AF_UNIX else None)
+    server_socket.close()
+    if path:
+        _unlink_socket(path)
+
+def _unlink_socket(path: str) -> None:
+    """
+    Remove the Unix socket file at ``path``, if there is one. Raises
+    ``FileExistsError`` if it is another kind of file.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise FileExistsError(f'Not a Unix socket, not removing it: {path}')
+    os.unlink(path)
+
+def is_local(sock: socket.socket) -> bool:
+    """
+    Whether the peer of the connected ``sock`` is on the same host: Unix
+    sockets (and so inherited socket pairs) and loopback TCP
+    """
+    if sock.family == socket.AF_UNIX:
+        return True
+    return ipaddress.ip_address(sock.getpeername()[0]).is_loopback
+
+def peer_address(address: Any) -> tuple[str, int]:
+    """
+    Host and port of an accepted connection; Unix sockets have neither.
+    """
+    if isinstance(address, tuple):
+        return address[0], address[1]
+    return address or 'unix', 0
+
+# Framing: every frame is a 4 byte big-endian length and the payload. The
+# payload is either a JSON object (starting with "{"), or, once the binary
+# format has been negotiated in the handshake, a type byte and a raw body:
+FRAME_DATA = 1  # body: UTF-8 text
+FRAME_LINES = 2  # body: several UTF-8 lines joined by "\n"
+FRAME_CONTROL = 3  # body: JSON object of the control message
+# The replies of the bots, with the time (in seconds) the bot took to
+# compute them, measured by the bridge, see ``encode_data``:
+FRAME_TIMED_DATA = 4  # body: the time (a big-endian double), then as DATA
+FRAME_TIMED_LINES = 5  # body: the time, then as LINES
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+#: formats the bridge offers in its ``hello``, in order of preference
+SUPPORTED_FORMATS = [FORMAT_BINARY, FORMAT_JSON]
+
+_HEADER = struct.Struct('>i')
+_BINARY_HEADER = struct.Struct('>iB')
+_COMPUTE_TIME = struct.Struct('>d')
+
+def encode_msg(msg: Jsonable) -> bytes:
+    """
+    A JSON frame, length included
+    """
     msg = json.dumps(msg, ensure_ascii=True).encode('ascii')
-    msg_len = len(msg)
-    msg_len = struct.pack('>i', msg_len)
-    sock.sendall(msg_len + msg)
+    return _HEADER.pack(len(msg)) + msg
+
+def encode_frame(frame_type: int, body: bytes) -> bytes:
+    """
+    A binary frame (see ``FRAME_*``), length included
+    """
+    return _BINARY_HEADER.pack(len(body) + 1, frame_type) + body
+
+def encode_data(data: str,
+                *,
+                binary: bool = False,
+                compute_time: Optional[float] = None) -> bytes:
+    """
+    A data frame. The ``compute_time`` of a reply is only sent to judges
+    that announced ``timings`` in their ``welcome``; it is decoded as the
+    ``compute_time`` key of the message.
+    """
+    if binary:
+        if compute_time is None:
+            return encode_frame(FRAME_DATA, data.encode('utf8'))
+        return encode_frame(FRAME_TIMED_DATA,
+                            _COMPUTE_TIME.pack(compute_time) +
+                            data.encode('utf8'))
+    msg: dict[str, Jsonable] = {'type': 'data', 'data': data}
+    if compute_time is not None:
+        msg['compute_time'] = compute_time
+    return encode_msg(msg)
+
+def encode_lines(lines: list[str],
+                 *,
+                 binary: bool = False,
+                 compute_time: Optional[float] = None) -> bytes:
+    """
+    See ``encode_data``
+    """
+    if binary:
+        body = '\n'.join(lines).encode('utf8')
+        if compute_time is None:
+            return encode_frame(FRAME_LINES, body)
+        return encode_frame(FRAME_TIMED_LINES,
+                            _COMPUTE_TIME.pack(compute_time) + body)
+    msg: dict[str, Jsonable] = {'type': 'lines', 'data': lines}
+    if compute_time is not None:
+        msg['compute_time'] = compute_time
+    return encode_msg(msg)
+
+def encode_control(command: str,
+                   *,
+                   binary: bool = False,
+                   **kwargs: Jsonable) -> bytes:
+    msg = {'type': 'control', 'command': command, **kwargs}
+    if binary:
+        return encode_frame(FRAME_CONTROL,
+                            json.dumps(msg, ensure_ascii=True).encode('ascii'))
+    return encode_msg(msg)
+
+def send_msg(sock: socket.SocketType, msg: Jsonable) -> None:
+    sock.sendall(encode_msg(msg))
+
+def send_frame(sock: socket.SocketType, frame_type: int, body: bytes) -> None:
+    """
+    Send a binary frame, see ``FRAME_*``
+    """
+    sock.sendall(encode_frame(frame_type, body))
+
+def decode_payload(payload: bytes | bytearray | memoryview) -> Jsonable:
+    """
+    Decode the payload of a frame (without the length) of either format
+    """
+    view = memoryview(payload)
+    if view[0] == ord('{'):
+        return json.loads(view.tobytes())
+    frame_type = view[0]
+    if frame_type == FRAME_DATA:
+        return {'type': 'data', 'data': str(view[1:], 'utf8')}
+    if frame_type == FRAME_LINES:
+        return {'type': 'lines', 'data': str(view[1:], 'utf8').split('\n')}
+    if frame_type == FRAME_CONTROL:
+        return json.loads(view[1:].tobytes())
+    if frame_type in (FRAME_TIMED_DATA, FRAME_TIMED_LINES):
+        compute_time, = _COMPUTE_TIME.unpack_from(view, 1)
+        body = str(view[1 + _COMPUTE_TIME.size:], 'utf8')
+        if frame_type == FRAME_TIMED_DATA:
+            return {'type': 'data', 'data': body, 'compute_time': compute_time}
+        return {
+            'type': 'lines',
+            'data': body.split('\n'),
+            'compute_time': compute_time
+        }
+    raise NetworkError(f'Unknown frame type: {frame_type}')
 
 def recv_msg(sock: socket.SocketType) -> Jsonable:
 
@@ -39,14 +236,237 @@ def recv_msg(sock: socket.SocketType) -> Jsonable:
             raise NetworkError(f'Connection reset: {e}') from e
 
     msg_len = read_until(4)
-    msg_len, = struct.unpack('>i', msg_len)
+    msg_len, = _HEADER.unpack(msg_len)
     msg = read_until(msg_len)
-    return json.loads(msg)
+    return decode_payload(msg)
 
-def send_data(sock: socket.SocketType, data: str) -> None:
+def send_data(sock: socket.SocketType,
+              data: str,
+              *,
+              binary: bool = False) -> None:
     try:
-        send_msg(sock, {'type': 'data', 'data': data})
+        sock.sendall(encode_data(data, binary=binary))
     except (BrokenPipeError, OSError) as e:
         raise NetworkError('Failed to send data') from e
 
-# May want to send control messages as well, such as request for shutdown/kill
+def send_lines(sock: socket.SocketType,
+               lines: list[str],
+               *,
+               binary: bool = False) -> None:
+    """
+    Send several lines (without their newlines) in one frame. The receiver
+    gets a message of type ``lines``.
+    """
+    try:
+        sock.sendall(encode_lines(lines, binary=binary))
+    except (BrokenPipeError, OSError) as e:
+        raise NetworkError('Failed to send data') from e
+
+def send_control(sock: socket.SocketType,
+                 command: str,
+                 *,
+                 binary: bool = False,
+                 **kwargs: Jsonable) -> None:
+    """
+    Send a control message, e.g., the ``hello`` handshake of the bridge.
+
+    Extra keyword arguments become fields of the message.
+    """
+    try:
+        sock.sendall(encode_control(command, binary=binary, **kwargs))
+    except (BrokenPipeError, OSError) as e:
+        raise NetworkError(f'Failed to send {command} message') from e
+
+def recv_handshake(sock: socket.SocketType) -> dict[str, Jsonable]:
+    """
+    Receive the ``hello`` message the bridge sends right after connecting.
+    """
+    msg = recv_msg(sock)
+    if msg.get('type') != 'control' or msg.get('command') != 'hello':
+        raise NetworkError(f'Expected a handshake, got: {msg}')
+    return msg
+
+class Connection:
+    """
+    A framed connection that owns a reusable receive buffer.
+
+    Frames are read with ``recv_into`` straight into the buffer (as many
+    bytes as the socket has, so several small frames may arrive with one
+    call) and decoded from ``memoryview`` slices of it, without joining
+    chunks. A timeout in the middle of a frame loses nothing: the partial
+    frame stays in the buffer for the next call.
+
+    ``binary`` tells the format of the outgoing frames; incoming frames of
+    both formats are understood.
+    """
+
+    INITIAL_BUFFER_SIZE = 1 << 16
+
+    def __init__(self, sock: socket.socket, *, binary: bool = False):
+        self.socket = sock
+        self.binary = binary
+        self._buffer = bytearray(self.INITIAL_BUFFER_SIZE)
+        # received, but not yet decoded data is ``_buffer[_start:_end]``
+        self._start = 0
+        self._end = 0
+
+    def settimeout(self, timeout: Optional[float]) -> None:
+        self.socket.settimeout(timeout)
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def _fill(self, size: int) -> None:
+        """
+        Receive until at least ``size`` bytes are buffered
+        """
+        if self._start + size > len(self._buffer):
+            # Move the partial frame to the front, and grow if it's needed
+            pending = self._end - self._start
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, pending
+            if size > len(self._buffer):
+                self._buffer.extend(bytes(size - len(self._buffer)))
+        try:
+            while self._end - self._start < size:
+                with memoryview(self._buffer) as view:
+                    received = self.socket.recv_into(view[self._end:])
+                if received == 0:
+                    raise NetworkError('Socket is broken.')
+                self._end += received
+        except ConnectionResetError as e:
+            raise NetworkError(f'Connection reset: {e}') from e
+
+    def recv_msg(self) -> Jsonable:
+        self._fill(_HEADER.size)
+        msg_len, = _HEADER.unpack_from(self._buffer, self._start)
+        self._fill(_HEADER.size + msg_len)
+        begin = self._start + _HEADER.size
+        with memoryview(self._buffer) as view:
+            msg = decode_payload(view[begin:begin + msg_len])
+        self._start = begin + msg_len
+        if self._start == self._end:
+            self._start = self._end = 0
+        return msg
+
+    def recv_handshake(self) -> dict[str, Jsonable]:
+        """
+        See the function ``recv_handshake``
+        """
+        msg = self.recv_msg()
+        if msg.get('type') != 'control' or msg.get('command') != 'hello':
+            raise NetworkError(f'Expected a handshake, got: {msg}')
+        return msg
+
+    def send_data(self, data: str) -> None:
+        send_data(self.socket, data, binary=self.binary)
+
+    def send_lines(self, lines: list[str]) -> None:
+        send_lines(self.socket, lines, binary=self.binary)
+
+    def send_control(self, command: str, **kwargs: Jsonable) -> None:
+        send_control(self.socket, command, binary=self.binary, **kwargs)
+
+class StreamConnection:
+    """
+    The asyncio counterpart of ``Connection``, over the streams of
+    ``open_stream_connection``.
+
+    Reading never blocks the event loop, and whatever has arrived is
+    decoded at once, see ``recv_msgs``. Sending only appends the frame to
+    the transport's buffer; ``drain`` waits until the buffer is below its
+    limit.
+    """
+
+    READ_SIZE = 1 << 16
+
+    def __init__(self,
+                 reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter,
+                 *,
+                 binary: bool = False):
+        self.reader = reader
+        self.writer = writer
+        self.binary = binary
+        # received, but not yet decoded data
+        self._buffer = bytearray()
+
+    def _decode_frames(self) -> list[Jsonable]:
+        msgs = []
+        start = 0
+        with memoryview(self._buffer) as view:
+            while len(view) - start >= _HEADER.size:
+                msg_len, = _HEADER.unpack_from(view, start)
+                begin = start + _HEADER.size
+                if len(view) - begin < msg_len:
+                    break
+                msgs.append(decode_payload(view[begin:begin + msg_len]))
+                start = begin + msg_len
+        del self._buffer[:start]
+        return msgs
+
+    async def recv_msgs(self) -> list[Jsonable]:
+        """
+        Wait for a message, and return every message that has been received
+        completely (at least one)
+        """
+        msgs: list[Jsonable] = []
+        while not msgs:
+            try:
+                chunk = await self.reader.read(self.READ_SIZE)
+            except ConnectionResetError as e:
+                raise NetworkError(f'Connection reset: {e}') from e
+            if not chunk:
+                raise NetworkError('Socket is broken.')
+            self._buffer += chunk
+            msgs = self._decode_frames()
+        return msgs
+
+    def _write(self, frame: bytes) -> None:
+        if self.writer.is_closing():
+            raise NetworkError('Connection is closed.')
+        self.writer.write(frame)
+
+    def send_data(self,
+                  data: str,
+                  compute_time: Optional[float] = None) -> None:
+        self._write(
+            encode_data(data, binary=self.binary, compute_time=compute_time))
+
+    def send_lines(self,
+                   lines: list[str],
+                   compute_time: Optional[float] = None) -> None:
+        self._write(
+            encode_lines(lines, binary=self.binary, compute_time=compute_time))
+
+    def send_control(self, command: str, **kwargs: Jsonable) -> None:
+        self._write(encode_control(command, binary=self.binary, **kwargs))
+
+    async def drain(self) -> None:
+        try:
+            await self.writer.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise NetworkError('Failed to send data') from e
+
+    async def close(self) -> None:
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+async def open_stream_connection(sock: socket.socket) -> StreamConnection:
+    """
+    Wrap a connected socket (see ``connect``) in a ``StreamConnection``
+    """
+    reader, writer = await asyncio.open_connection(sock=sock)
+    return StreamConnection(reader, writer)
+
+def choose_format(hello: dict[str, Jsonable], preferred: str) -> str:
+    """
+    The format to use with a client: ``preferred`` if the client offered it
+    in its ``hello``, JSON otherwise (JSON is always understood).
+    """
+    if preferred in hello.get('formats', []):
+        return preferred
+    return FORMAT_JSON
@@ -5,6 +5,18 @@ from enemy import EnemyRacer
 from logger import get_logger
 import heapq
 import math
+import os
+import memory
+
+# optional protocol features we ask the judge for after READY; we only rely on the ones it grants
+# (Track.GRANTED_CAPABILITIES), so that the bot still works with judges that decline them
+CAPABILITIES = ['series', 'delta', 'visible_players']
+
+# snapshot the memory with tracemalloc every WINNERBOT_TRACEMALLOC turns (0 is
+# off), and save the report to WINNERBOT_TRACEMALLOC_FILE at the end; they are
+# environment variables since the bridge starts the bot without arguments.
+# Tracing slows the search down many times, give the judge a longer --timeout
+TRACEMALLOC_EVERY = int(os.environ.get('WINNERBOT_TRACEMALLOC', '0'))
 
 class Racer:
     track : Track
@@ -22,6 +34,7 @@ class Racer:
         self.enemies = []
         for i in range(0, self.track.PLAYERS_COUNT):
             self.enemies.append(EnemyRacer(i))
+        self.occupied = set()
         self.logger = get_logger()
         self.POSSIBLE_DIRECTIONS = [(i,j) for i in range(-1,2) for j in range(-1,2)]
         self.MAXIMUM_SPEED = min(self.track.VISIBILITY_RADIUS//2,3)
@@ -29,10 +42,18 @@ class Racer:
 
         
     def update_enemy_pos(self):
-        """Updates all the enemies positions
+        """Updates the enemies positions (only the visible ones with the 'visible_players' capability) and the set of occupied cells
         """
+        if 'visible_players' in self.track.GRANTED_CAPABILITIES:
+            self.occupied = set()
+            for _ in range(int(input())):
+                ind, x, y = map(int, input().split())
+                self.enemies[ind].x, self.enemies[ind].y = x, y
+                self.occupied.add((x, y))
+            return
         for enemy in self.enemies:
             enemy.read_input()
+        self.occupied = {(enemy.x, enemy.y) for enemy in self.enemies}
         
         
     def heuristic(self, start , goal) -> float:
@@ -72,10 +93,7 @@ class Racer:
         return (start[0] + desired_velocity[0] + current_speed[0], start[1] + desired_velocity[1] + current_speed[1])    
     
     def is_enemy_on_pos(self, pos : tuple[int, int]):
-        for enemy in self.enemies:
-            if enemy.x == pos[0] and enemy.y == pos[1]:
-                return True
-        return False
+        return (pos[0], pos[1]) in self.occupied
     
     
     
@@ -311,7 +329,7 @@ class Racer:
             self.track.get_cell_value(valid_pos_after_dest) != 3 \
             and self.track.valid_line(np.array(dest),np.array(valid_pos_after_dest))
     
-    def race(self):
+    def race(self, memory_snapshots: memory.MemorySnapshots = None):
         """Manages the race according the rules of the judge. This function contains the main loop of the agent.
         """
         goals = []
@@ -319,10 +337,15 @@ class Racer:
         prev_plan = []
         prev_plan_step = 0
         while self.ktm_exc.read_input():
+            if memory_snapshots is not None:
+                memory_snapshots.step()
             
             self.update_enemy_pos()
             current_pos = self.ktm_exc.get_pos()
-            self.track.read_track(current_pos)
+            if 'delta' in self.track.GRANTED_CAPABILITIES:
+                self.track.read_track_delta()
+            else:
+                self.track.read_track(current_pos)
                         
             self.logger("Calculating subgoals")
             goals = self.get_subgoals(current_pos) 
@@ -363,11 +386,23 @@ class Racer:
             
     
 def main():
-    my_glorious_racer = Racer()
-    my_glorious_racer.race()
+    memory_snapshots = None
+    if TRACEMALLOC_EVERY > 0:
+        memory_snapshots = memory.MemorySnapshots(TRACEMALLOC_EVERY)
+        memory_snapshots.start()
+    # the judge may run a series of races, we start over after each reset
+    while True:
+        my_glorious_racer = Racer()
+        my_glorious_racer.race(memory_snapshots)
+        if not my_glorious_racer.ktm_exc.next_race:
+            break
+    if memory_snapshots is not None:
+        memory_snapshots.stop()
+        memory_snapshots.dump(os.environ.get(
+            'WINNERBOT_TRACEMALLOC_FILE', f'winnerbot_memory.{os.getpid()}.txt'))
         
 if __name__=='__main__':
-    print('READY', flush=True)  
+    print('READY ' + ' '.join(CAPABILITIES), flush=True)  
     main()        
         
     
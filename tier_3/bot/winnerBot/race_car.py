@@ -6,6 +6,7 @@ class RaceCar:
     y_pos: int
     speed_vertical: int
     speed_horizontal: int
+    next_race: bool
     position_history: deque[tuple[int,int]]
     
     def __init__(self):
@@ -14,11 +15,16 @@ class RaceCar:
         self.speed_vertical = 0
         self.speed_horizontal = 0
         self.position_history = deque()
+        self.next_race = False
     
     def read_input (self):
         judge_input = input()
         if judge_input == '~~~END~~~':
             return False
+        if judge_input == '~~~RESET~~~':
+            # next race of the series begins, the racer has to start over
+            self.next_race = True
+            return False
         self.x_pos, self.y_pos, self.speed_horizontal, self.speed_vertical = map(int, judge_input.split(' '))
         self.save_position()
         return True
@@ -11,6 +11,7 @@ class Track:
     PLAYERS_COUNT: int
     TRACK_MAXIMUM_DISTANCE: int
     VISIBILITY_RADIUS: int
+    GRANTED_CAPABILITIES: set[str]
     map: np.ndarray
     start_position: tuple[int,int]
     OIL_CELL_VALUE: int = 91
@@ -24,7 +25,10 @@ class Track:
         self.mylogger = get_logger()
     
     def __read_initial_props(self):
-        self.TRACK_HEIGHT, self.TRACK_WIDTH, self.PLAYERS_COUNT, self.VISIBILITY_RADIUS = map(int, input().split())  
+        # the capabilities the judge granted follow the numbers (none from judges that decline them)
+        height, width, players, radius, *granted = input().split()
+        self.TRACK_HEIGHT, self.TRACK_WIDTH, self.PLAYERS_COUNT, self.VISIBILITY_RADIUS = map(int, (height, width, players, radius))
+        self.GRANTED_CAPABILITIES = set(granted)
     
     def read_track(self, playerPos : tuple[int, int]) -> np.ndarray:
         for i in range(2 * self.VISIBILITY_RADIUS + 1):
@@ -56,6 +60,14 @@ class Track:
                 self.mylogger("")
        
           
+    def read_track_delta(self) -> None:
+        """Reads the newly visible cells when the judge sends delta observations:
+        the number of runs, then one line per run, "x y v1 v2 ..." with the values of the cells from (x, y) in row x.
+        """
+        for _ in range(int(input())):
+            x, y, *values = map(int, input().split())
+            self.map[x, y:y + len(values)] = values
+          
     def get_track(self):
         return self.map
     
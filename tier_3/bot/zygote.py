@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+A fork server for Python bots. It runs the top level of the bots once (so
+NumPy and the bot's own modules are imported), then forks a child for every
+bot the bridge asks for (see the ``--zygote`` option of client_bridge.py).
+The child runs the bot as ``__main__`` with its standard streams connected
+to the bridge, without paying for the interpreter start and the imports.
+
+Start it before the bridges, e.g.:
+``python zygote.py --address unix:/tmp/grid_race_zygote winnerBot/bot.py``
+
+POSIX only: it needs ``fork`` and passing file descriptors over a Unix
+socket.
+"""
+import os
+import io
+import sys
+import json
+import signal
+import socket
+import types
+import struct
+import asyncio
+import argparse
+import traceback
+import network
+import resources
+
+from typing import Optional
+
+#: maximum size of a request (JSON, ends with a newline)
+MAX_REQUEST_SIZE = 1 << 16
+_PID_OR_STATUS = struct.Struct('>i')
+
+#: compiled code and modification time of the preloaded bots, by path
+_preloaded: dict[str, tuple[float, types.CodeType]] = {}
+
+def _bot_code(bot_path: str) -> types.CodeType:
+    """
+    The compiled bot, compiled again only if it has changed since it was
+    preloaded
+    """
+    mtime = os.stat(bot_path).st_mtime
+    if bot_path in _preloaded and _preloaded[bot_path][0] == mtime:
+        return _preloaded[bot_path][1]
+    with open(bot_path, 'rb') as f:
+        return compile(f.read(), bot_path, 'exec')
+
+def _run_bot(bot_path: str, name: str) -> None:
+    """
+    Run the bot as a script, with ``__name__`` set to ``name``
+    """
+    bot_dir = os.path.dirname(bot_path)
+    if bot_dir not in sys.path:
+        sys.path.insert(0, bot_dir)
+    module = types.ModuleType(name)
+    module.__file__ = bot_path
+    if name == '__main__':
+        sys.modules['__main__'] = module
+    exec(_bot_code(bot_path), module.__dict__)  # pylint: disable=exec-used
+
+def preload(bot_path: str) -> None:
+    """
+    Run the top level of the bot without its ``__main__`` part, importing
+    its modules, and keep its compiled code
+    """
+    bot_path = os.path.abspath(bot_path)
+    _preloaded[bot_path] = (os.stat(bot_path).st_mtime, _bot_code(bot_path))
+    _run_bot(bot_path, '__zygote__')
+
+def _run_child(conn: socket.socket, bot_path: str, cwd: str,
+               stdio: list[int], limits: resources.Limits) -> None:
+    """
+    Body of a forked child: become the bot with ``limits`` set, then report
+    its exit status to the bridge
+    """
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for fd, target in zip(stdio, (0, 1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    # like ``python -u``
+    sys.stdin = io.TextIOWrapper(io.FileIO(0, 'r', closefd=False))
+    sys.stdout = io.TextIOWrapper(io.FileIO(1, 'w', closefd=False),
+                                  write_through=True)
+    sys.stderr = io.TextIOWrapper(io.FileIO(2, 'w', closefd=False),
+                                  write_through=True)
+    if 'numpy' in sys.modules:
+        # the global generator was seeded once, in the zygote
+        sys.modules['numpy'].random.seed()
+    os.chdir(cwd)
+    sys.argv = [bot_path]
+    conn.sendall(_PID_OR_STATUS.pack(os.getpid()))
+    status = 0
+    try:
+        resources.apply_limits(os.getpid(), limits)
+    except OSError as e:
+        print(f'Failed to limit the bot: {e}', file=sys.stderr)
+        status = resources.LIMITS_FAILED
+    try:
+        if status == 0:
+            _run_bot(bot_path, '__main__')
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            status = e.code
+        elif e.code is not None:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException:  # pylint: disable=broad-exception-caught
+        traceback.print_exc()
+        status = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendall(_PID_OR_STATUS.pack(status))
+    finally:
+        os._exit(status)  # pylint: disable=protected-access
+
+def serve(address: str) -> None:
+    """
+    Fork a bot for every request on ``address`` (see ``ZygoteProcess`` for
+    the protocol)
+    """
+    server_socket = network.create_server(address)
+    # children are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f'Zygote is listening on {address}', flush=True)
+    try:
+        while True:
+            conn, _ = server_socket.accept()
+            try:
+                msg, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST_SIZE, 3)
+                request = json.loads(msg)
+                bot_path, cwd = request['bot'], request['cwd']
+                limits = resources.Limits.from_json(request.get('limits', {}))
+                if len(fds) != 3:
+                    raise ValueError(f'Expected 3 descriptors, got {len(fds)}')
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f'Dropping request: {e!r}')
+                conn.close()
+                continue
+            if os.fork() == 0:
+                try:
+                    server_socket.close()
+                    _run_child(conn, bot_path, cwd, fds, limits)
+                except BaseException:  # pylint: disable=broad-exception-caught
+                    traceback.print_exc()
+                finally:
+                    os._exit(1)  # pylint: disable=protected-access
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+    finally:
+        network.close_server(server_socket)
+
+class ZygoteProcess:
+    """
+    A bot forked by the zygote, with the parts of the interface of
+    ``asyncio.subprocess.Process`` that the bridge uses.
+
+    The bridge connects to the zygote and sends the request (the path of the
+    bot, the working directory and its limits) with the descriptors of the
+    bot's stdin, stdout and stderr: one end of two socket pairs, the first
+    one serves both stdin and stdout. The child sends its pid, and its exit
+    status when the bot is done; if the connection closes without the exit
+    status, the bot has been killed (``returncode`` is -1 then).
+    """
+
+    stdin: asyncio.StreamWriter
+    stdout: asyncio.StreamReader
+    stderr: asyncio.StreamReader
+
+    def __init__(self) -> None:
+        self.pid = 0
+        self.returncode: Optional[int] = None
+        self._control: Optional[asyncio.StreamReader] = None
+        # unused, but closing them (e.g., when they are garbage collected)
+        # would close the connections
+        self._writers: list[asyncio.StreamWriter] = []
+
+    @classmethod
+    async def spawn(
+        cls,
+        address: str,
+        bot_path: str,
+        limits: resources.Limits = resources.Limits()
+    ) -> 'ZygoteProcess':
+        process = cls()
+        stdio, bot_stdio = socket.socketpair()
+        stderr, bot_stderr = socket.socketpair()
+        conn = network.connect(address)
+        try:
+            request = json.dumps({
+                'bot': os.path.abspath(bot_path),
+                'cwd': os.getcwd(),
+                'limits': limits.to_json()
+            }) + '\n'
+            socket.send_fds(conn, [request.encode('utf8')],
+                            [bot_stdio.fileno(), bot_stdio.fileno(),
+                             bot_stderr.fileno()])
+        finally:
+            bot_stdio.close()
+            bot_stderr.close()
+        process._control, control_writer = await asyncio.open_connection(
+            sock=conn)
+        process.stdout, process.stdin = await asyncio.open_connection(
+            sock=stdio)
+        process.stderr, stderr_writer = await asyncio.open_connection(
+            sock=stderr)
+        process._writers = [control_writer, stderr_writer]
+        try:
+            pid = await process._control.readexactly(_PID_OR_STATUS.size)
+        except asyncio.IncompleteReadError as e:
+            raise RuntimeError('The zygote did not start the bot') from e
+        process.pid, = _PID_OR_STATUS.unpack(pid)
+        return process
+
+    async def wait(self) -> int:
+        if self.returncode is None:
+            assert self._control is not None
+            try:
+                status = await self._control.readexactly(_PID_OR_STATUS.size)
+                self.returncode, = _PID_OR_STATUS.unpack(status)
+            except asyncio.IncompleteReadError:
+                # killed by a signal, we don't know which one
+                self.returncode = -1
+        return self.returncode
+
+    def terminate(self) -> None:
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fork server that starts Python bots for '
+        'client_bridge.py without the interpreter start and the imports.')
+    parser.add_argument(
+        'bots',
+        nargs='*',
+        help='Bots to preload: their top level (e.g., their imports) runs '
+        'once here. Other Python bots can be started too, they only save '
+        'the interpreter start.')
+    parser.add_argument(
+        '--address',
+        type=str,
+        required=True,
+        help='Unix socket to listen on, "unix:/path/to/socket". Give the '
+        'same to client_bridge.py --zygote.')
+    parser.add_argument(
+        '--preload',
+        type=str,
+        nargs='*',
+        default=['numpy'],
+        help='Modules to import before the bots. Default is numpy.')
+    args = parser.parse_args()
+    if not args.address.startswith(network.UNIX_PREFIX):
+        parser.error('The zygote listens on a Unix socket only.')
+    for module in args.preload:
+        __import__(module)
+    for bot in args.bots:
+        preload(bot)
+    if 'numpy' in sys.modules:
+        # the first seeding is slow, the children reseed (see ``_run_child``)
+        sys.modules['numpy'].random.seed()
+    try:
+        serve(args.address)
+    except KeyboardInterrupt:
+        print('Received keyboard interrupt. Bye.')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Microbenchmarks of the hot paths of the judge on every map: line of sight
+checks (``Circuit.valid_line``), moves (``Circuit._move_player_directly``,
+from road, sand and oil cells), observations (``GridRaceEnv.observation``,
+per visibility radius), loading the tracks, saving and loading long
+replays, and the frames over a socketpair: round trips with
+``network.Connection``, and its receive path (reusable buffer, ``recv_into``
+and ``memoryview`` slicing) against ``network.recv_msg`` (chunk list and join
+for every frame). No network, no bots.
+
+The results (per operation timings, in microseconds) are saved as JSON, one
+record per benchmark, map and parameters, to compare the runs of different
+versions.
+
+Run from the directory of the tier: ``python judge/benchmark.py``.
+"""
+import os
+import sys
+import glob
+import json
+import socket
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import numpy as np
+import grid_race_env
+import network
+import replay
+import run
+
+from typing import Any, Callable, Optional
+
+BENCHMARKS = [
+    'load_track', 'valid_line', 'move_player', 'observation', 'replay',
+    'network'
+]
+#: shipped maps
+MAPS = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                 'maps', '*.png'))
+
+Record = dict[str, Any]
+
+def stats(durations: list[float]) -> Record:
+    """
+    Summary of the durations (in seconds) of the operations, in
+    microseconds
+    """
+    values = np.array(durations) * 1e6
+    return {
+        'count': len(values),
+        'mean_us': float(values.mean()),
+        'median_us': float(np.median(values)),
+        'p95_us': float(np.quantile(values, 0.95)),
+        'min_us': float(values.min()),
+    }
+
+def timed(call: Callable[[], Any]) -> float:
+    tick = time.perf_counter()
+    call()
+    return time.perf_counter() - tick
+
+def cells_of(circuit: grid_race_env.Circuit,
+             *cell_types: grid_race_env.CellType) -> np.ndarray:
+    """
+    Positions of the cells of the given types, shape (number of cells, 2)
+    """
+    return np.argwhere(np.isin(circuit.track, cell_types))
+
+def road_cells(circuit: grid_race_env.Circuit) -> np.ndarray:
+    return cells_of(circuit, grid_race_env.CellType.EMPTY,
+                    grid_race_env.CellType.START)
+
+def bench_load_track(path: str, args: argparse.Namespace) -> list[Record]:
+    durations = [
+        timed(lambda: grid_race_env.load_track_from_file(path))
+        for _ in range(args.repeat)
+    ]
+    return [stats(durations)]
+
+def bench_valid_line(circuit: grid_race_env.Circuit,
+                     rng: np.random.Generator,
+                     args: argparse.Namespace) -> list[Record]:
+    """
+    Segments from random road cells, at most ``args.segment_length`` long
+    along both axes (they may leave the track)
+    """
+    starts = road_cells(circuit)
+    starts = starts[rng.integers(len(starts), size=args.ops)]
+    ends = starts + rng.integers(
+        -args.segment_length, args.segment_length + 1, size=starts.shape)
+    durations = []
+    valid = 0
+    for start, end in zip(starts, ends):
+        tick = time.perf_counter()
+        valid += circuit.valid_line(start, end)
+        durations.append(time.perf_counter() - tick)
+    return [{
+        'segment_length': args.segment_length,
+        'valid_fraction': valid / args.ops,
+        **stats(durations)
+    }]
+
+def bench_move_player(circuit: grid_race_env.Circuit,
+                      rng: np.random.Generator,
+                      args: argparse.Namespace) -> list[Record]:
+    """
+    Moves of one player with random non-zero velocities (sand and oil only
+    act on moving players) and random accelerations, from each kind of cell
+    the track has (sand and oil only in the tiers having them)
+    """
+    circuit.add_new_player()
+    player = circuit.players[0]
+    kinds = {'road': road_cells(circuit)}
+    for name in ['sand', 'oil']:
+        cell_type = getattr(grid_race_env.CellType, name.upper(), None)
+        if cell_type is not None:
+            kinds[name] = cells_of(circuit, cell_type)
+    velocities = np.array([(vx, vy)
+                           for vx in range(-3, 4)
+                           for vy in range(-3, 4)
+                           if vx or vy])
+    records = []
+    for kind, cells in kinds.items():
+        if len(cells) == 0:
+            continue
+        durations = []
+        invalid = 0
+        for _ in range(args.ops):
+            # pylint: disable=protected-access
+            circuit._place_player(player, cells[rng.integers(len(cells))])
+            player.vel[()] = velocities[rng.integers(len(velocities))]
+            delta = rng.integers(-1, 2, size=2)
+            tick = time.perf_counter()
+            try:
+                circuit._move_player_directly(0, delta)
+            except grid_race_env.InvalidMove:
+                invalid += 1
+            durations.append(time.perf_counter() - tick)
+        records.append({
+            'cell': kind,
+            'invalid_fraction': invalid / args.ops,
+            **stats(durations)
+        })
+    return records
+
+def bench_observation(circuit_type: type[grid_race_env.Circuit],
+                      rng: np.random.Generator,
+                      args: argparse.Namespace) -> list[Record]:
+    """
+    Observations of the players at random road cells, per visibility radius
+    (once in the tiers without fog)
+    """
+    records = []
+    for radius in args.radii:
+        circuit = circuit_type()
+        num_players = min(args.players, circuit.max_num_players)
+        env = run.create_environment(
+            {
+                'num_players': num_players,
+                'visibility_radius': radius,
+                'max_turns': 1000
+            }, circuit)
+        env.reset()
+        has_radius = hasattr(env, 'visibility_radius')
+        cells = road_cells(circuit)
+        durations = []
+        for i in range(args.ops):
+            player = i % num_players
+            pos = cells[rng.integers(len(cells))]
+            if circuit.get_player(pos) is None:
+                # pylint: disable=protected-access
+                circuit._place_player(circuit.players[player], pos)
+            durations.append(timed(lambda: env.observation(player)))
+        records.append({
+            'radius': radius if has_radius else None,
+            'players': num_players,
+            **stats(durations)
+        })
+        if not has_radius:
+            break
+    return records
+
+def synthetic_replay(circuit: grid_race_env.Circuit,
+                     rng: np.random.Generator,
+                     args: argparse.Namespace) -> replay.Replay:
+    """
+    A replay of ``args.replay_steps`` random steps of ``args.players``
+    players on the track of ``circuit``
+    """
+    num_players = min(args.players, circuit.max_num_players)
+    track = np.vectorize(lambda c: c.value)(circuit.track).tolist()
+    cells = road_cells(circuit).tolist()
+
+    def state(turn: int) -> replay.State:
+        players = [
+            replay.PlayerState(*cells[rng.integers(len(cells))],
+                               *rng.integers(-3, 4, size=2).tolist())
+            for _ in range(num_players)
+        ]
+        return replay.State(turn=turn, players=players)
+
+    env_info = replay.EnvInfo(
+        track=track,
+        num_players=num_players,
+        player_names=[f'player{i}' for i in range(num_players)])
+    history = replay.Replay(env_info=env_info, states=[state(0)])
+    for i in range(args.replay_steps):
+        dx, dy = rng.integers(-1, 2, size=2).tolist()
+        history.steps.append(
+            replay.PlayerStep(i % num_players,
+                              success=True,
+                              dx=dx,
+                              dy=dy,
+                              reply_time=float(rng.random())))
+        history.states.append(state(i // num_players))
+    return history
+
+def bench_replay(circuit: grid_race_env.Circuit, rng: np.random.Generator,
+                 args: argparse.Namespace) -> list[Record]:
+    history = synthetic_replay(circuit, rng, args)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replay.json')
+        serialise = [
+            timed(lambda: replay.serialise(history, path))
+            for _ in range(args.repeat)
+        ]
+        size = os.path.getsize(path)
+        deserialise = [
+            timed(lambda: replay.deserialise(path))
+            for _ in range(args.repeat)
+        ]
+    return [{
+        'operation': operation,
+        'steps': args.replay_steps,
+        'bytes': size,
+        **stats(durations)
+    } for operation, durations in [('serialise', serialise),
+                                   ('deserialise', deserialise)]]
+
+def observation_data(radius: int, num_players: int) -> str:
+    """
+    An observation of the size the judge sends in tier 3
+    """
+    size = 2*radius + 1
+    lines = ['3 4 0 1'] + ['3 5'] * num_players
+    lines += [' '.join(['-1'] * size)] * size
+    return '\n'.join(lines) + '\n'
+
+def encode_frames(data: str, count: int, binary: bool) -> bytes:
+    """
+    ``count`` data frames as they would be sent by ``network.send_data``
+    """
+    a, b = socket.socketpair()
+    with a, b:
+        network.send_data(a, data, binary=binary)
+        frame = b.recv(1 << 20)
+    return frame * count
+
+def receive_durations(
+        frames: bytes, count: int,
+        receive: Callable[[socket.socket], Callable[[], object]]
+) -> list[float]:
+    """
+    Receive the ``count`` frames with the receiver made by ``receive``,
+    while a thread sends them
+    """
+    reader, writer = socket.socketpair()
+    with reader, writer:
+        sender = threading.Thread(target=writer.sendall, args=(frames,))
+        recv_one = receive(reader)
+        sender.start()
+        durations = [timed(recv_one) for _ in range(count)]
+        sender.join()
+    return durations
+
+def bench_network(args: argparse.Namespace) -> list[Record]:
+    """
+    Observations of the size of each radius: received with
+    ``network.recv_msg`` and with ``network.Connection``, and sent from the
+    judge to the bridge with a reply back (round trip), both with
+    ``network.Connection``
+    """
+    receivers: dict[str, Callable[[socket.socket], Callable[[], object]]] = {
+        'recv_msg': lambda sock: lambda: network.recv_msg(sock),
+        'Connection.recv_msg': lambda sock: network.Connection(sock).recv_msg,
+    }
+    records = []
+    for binary in [False, True]:
+        frame_format = network.FORMAT_BINARY if binary else network.FORMAT_JSON
+        for radius in args.radii:
+            data = observation_data(radius, args.players)
+            frames = encode_frames(data, args.ops, binary)
+            for name, receive in receivers.items():
+                records.append({
+                    'operation': name,
+                    'format': frame_format,
+                    'radius': radius,
+                    'bytes': len(data),
+                    **stats(receive_durations(frames, args.ops, receive))
+                })
+            a, b = socket.socketpair()
+            with a, b:
+                judge_end = network.Connection(a, binary=binary)
+                bridge_end = network.Connection(b, binary=binary)
+
+                def round_trip() -> None:
+                    judge_end.send_data(data)
+                    bridge_end.recv_msg()
+                    bridge_end.send_data('1 0')
+                    judge_end.recv_msg()
+
+                durations = [timed(round_trip) for _ in range(args.ops)]
+            records.append({
+                'operation': 'round_trip',
+                'format': frame_format,
+                'radius': radius,
+                'bytes': len(data),
+                **stats(durations)
+            })
+    return records
+
+def run_benchmarks(args: argparse.Namespace) -> list[Record]:
+    rng = np.random.default_rng(args.seed)
+    results: list[Record] = []
+
+    def add(benchmark: str, records: list[Record],
+            track: Optional[str] = None) -> None:
+        for record in records:
+            record = {'benchmark': benchmark, 'map': track, **record}
+            results.append(record)
+            params = ', '.join(
+                f'{k}: {v}' for k, v in record.items() if k not in [
+                    'benchmark', 'map', 'count', 'mean_us', 'median_us',
+                    'p95_us', 'min_us'
+                ])
+            print(f'{benchmark}' + (f' on {track}' if track else '')
+                  + (f' ({params})' if params else '')
+                  + f': mean {record["mean_us"]:.1f} us, '
+                  f'p95 {record["p95_us"]:.1f} us')
+
+    for path in args.maps:
+        track = os.path.basename(path)
+        circuit = grid_race_env.load_track_from_file(path)
+        circuit_type = type(circuit)
+        if 'load_track' in args.benchmarks:
+            add('load_track', bench_load_track(path, args), track)
+        if 'valid_line' in args.benchmarks:
+            add('valid_line', bench_valid_line(circuit_type(), rng, args),
+                track)
+        if 'move_player' in args.benchmarks:
+            add('move_player', bench_move_player(circuit_type(), rng, args),
+                track)
+        if 'observation' in args.benchmarks:
+            add('observation', bench_observation(circuit_type, rng, args),
+                track)
+        if 'replay' in args.benchmarks:
+            add('replay', bench_replay(circuit, rng, args), track)
+    if 'network' in args.benchmarks:
+        add('network', bench_network(args))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time the hot paths of the judge on every map.')
+    parser.add_argument(
+        '--maps',
+        nargs='+',
+        default=sorted(glob.glob(MAPS)),
+        help='Track files to run the benchmarks on. Default is the shipped '
+        'maps.')
+    parser.add_argument('--benchmarks',
+                        nargs='+',
+                        choices=BENCHMARKS,
+                        default=BENCHMARKS,
+                        help='Benchmarks to run. Default is all of them.')
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='benchmark.json',
+        help='Path to save the results to. Default is benchmark.json.')
+    parser.add_argument(
+        '--ops',
+        type=int,
+        default=2000,
+        help='Number of operations timed per line of sight, move, '
+        'observation and network measurement. Default is 2000.')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='Number of times the tracks are loaded and the replays are '
+        'saved and loaded. Default is 3.')
+    parser.add_argument(
+        '--radii',
+        type=int,
+        nargs='+',
+        default=[2, 4, 8, 16],
+        help='Visibility radii of the observations (and sizes of the '
+        'frames of the network benchmark). Default is 2 4 8 16.')
+    parser.add_argument('--players',
+                        type=int,
+                        default=4,
+                        help='Number of players (at most as many as the '
+                        'track has starting cells). Default is 4.')
+    parser.add_argument(
+        '--segment_length',
+        type=int,
+        default=8,
+        help='Longest distance along each axis between the ends of the '
+        'segments of the line of sight checks. Default is 8.')
+    parser.add_argument(
+        '--replay_steps',
+        type=int,
+        default=5000,
+        help='Number of steps of the synthetic replays. Default is 5000.')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Seed of the random positions, moves and replays. Default is '
+        '0.')
+    args = parser.parse_args()
+    results = run_benchmarks(args)
+    print(f'Saving benchmark results to {args.output}.')
+    with open(args.output, 'w') as f:
+        json.dump(
+            {
+                'python': sys.version,
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'parameters': {
+                    k: v for k, v in vars(args).items() if k != 'output'
+                },
+                'results': results
+            },
+            f,
+            indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import collections
 import enum
 import itertools
 import sys
@@ -102,23 +103,80 @@ class RandomPlayer(AiPlayer):
 # 1}}} #
 
 # Circuit {{{1 #
+class CircuitState(NamedTuple):
+    """
+    The mutable part of a ``Circuit``, see ``Circuit.snapshot``
+    """
+    positions: np.ndarray  # (number of players, 2)
+    velocities: np.ndarray  # (number of players, 2)
+    rng_state: dict  # state of the bit generator
+
 class Circuit:
 
+    #: side of the square buckets of the spatial hash of player positions
+    BUCKET_SIZE = 8
+
     def __init__(self, *, seed: Optional[int] = 1) -> None:
         self.players: list[Player] = []
+        # Spatial hash of the players on the track: position -> player, and
+        # bucket -> {player index: position} for range queries. Only
+        # ``_place_player`` should change the positions of the players.
+        self._player_at: dict[tuple[int, int], Player] = {}
+        self._buckets: dict[tuple[int, int], dict[int, tuple[int, int]]] = {}
+        #: counters of the line of sight checks, if they are counted (see
+        #: ``metrics.Metrics.counters``)
+        self.counters: Optional[collections.Counter[str]] = None
         self.track, self.start = self.initialise_track()
         self.track.flags.writeable = False
         # ``laps`` is not actually used anywhere
         # self.laps: int = params['laps']
         assert np.all(
             [self.track[s[0], s[1]] == CellType.START for s in self.start])
-        self._rng = np.random.default_rng(seed=seed)
+        # ``Player.pos`` and ``Player.vel`` are views of the rows of these, so
+        # that the state of all the players can be copied at once
+        self._positions = np.full((self.max_num_players, 2), -1)
+        self._velocities = np.zeros((self.max_num_players, 2), dtype=int)
+        self._rng: Optional[np.random.Generator] = np.random.default_rng(
+            seed=seed)
+        # creating a generator is expensive, clones create theirs from this
+        # state when they first need random numbers, see ``_random``
+        self._rng_state: Optional[dict] = None
 
     def get_player(self, pos) -> Optional[Player]:
-        for p in self.players:
-            if np.all(p.pos == pos):
-                return p
-        return None
+        return self._player_at.get((int(pos[0]), int(pos[1])))
+
+    def players_within(self, pos, radius: float) -> list[Player]:
+        """
+        Players at most ``radius`` (Euclidean distance) from ``pos``, ordered
+        by their index. Only the buckets overlapping the square around
+        ``pos`` are examined.
+        """
+        x, y = int(pos[0]), int(pos[1])
+        r = int(radius)
+        found = []
+        for bx in range((x-r) // self.BUCKET_SIZE,
+                        (x+r) // self.BUCKET_SIZE + 1):
+            for by in range((y-r) // self.BUCKET_SIZE,
+                            (y+r) // self.BUCKET_SIZE + 1):
+                for ind, (px, py) in self._buckets.get((bx, by), {}).items():
+                    if (px-x)**2 + (py-y)**2 <= radius**2:
+                        found.append(ind)
+        return [self.players[ind] for ind in sorted(found)]
+
+    def _place_player(self, player: Player, pos: Position) -> None:
+        """
+        Move ``player`` to ``pos``, keeping the spatial hash up to date
+        """
+        old = (int(player.pos[0]), int(player.pos[1]))
+        if self._player_at.get(old) is player:
+            del self._player_at[old]
+        old_bucket = (old[0] // self.BUCKET_SIZE, old[1] // self.BUCKET_SIZE)
+        self._buckets.get(old_bucket, {}).pop(player.ind, None)
+        player.pos[()] = pos
+        new = (int(pos[0]), int(pos[1]))
+        self._player_at[new] = player
+        new_bucket = (new[0] // self.BUCKET_SIZE, new[1] // self.BUCKET_SIZE)
+        self._buckets.setdefault(new_bucket, {})[player.ind] = new
 
     def move_player(self, player: int, how: Position | AiPlayer) -> None:
         if isinstance(how, AiPlayer):
@@ -159,7 +217,7 @@ class Circuit:
         if player_at_target is not None and player_at_target is not player:
             raise InvalidMove(
                 f'Player {player.ind} collided with {player_at_target}')
-        player.pos[()] = new_pos
+        self._place_player(player, new_pos)
         player.vel[()] = new_vel
         return delta
 
@@ -170,7 +228,7 @@ class Circuit:
         delta: ``Position``
             Randomly chosen delta values
         """
-        return self._rng.integers(-1, 2, size=2)
+        return self._random().integers(-1, 2, size=2)
 
     def _move_from_sand(self, player: Player) -> Position:
         deltas = np.mgrid[-1:2, -1:2].reshape(2, -1)
@@ -178,7 +236,7 @@ class Circuit:
         # Double argsort will tell us the rank
         # From the random website: https://www.statology.org/numpy-rank-array/
         ii = np.argsort(np.linalg.norm(new_vels, ord=2, axis=0)).argsort()
-        return self._rng.choice(deltas[:, ii < 3], axis=1)
+        return self._random().choice(deltas[:, ii < 3], axis=1)
 
     def stop_player(self, player: int) -> None:
         self.players[player].vel[()] = 0
@@ -194,14 +252,90 @@ class Circuit:
         assert self.max_num_players > len(self.players), \
             'Too many players added'
         ind = len(self.players)
-        self.players.append(Player(ind, np.array([-1, -1]), np.array([0, 0])))
+        self.players.append(
+            Player(ind, self._positions[ind], self._velocities[ind]))
 
     def reset_players(self):
+        self._player_at.clear()
+        self._buckets.clear()
         for s, p in zip(self.start, self.players):
-            p.pos[()] = s
+            self._place_player(p, s)
             p.vel[()] = [0, 0]
 
+    def snapshot(self) -> CircuitState:
+        """
+        The state of the players (and of the random number generator), for
+        ``restore``. The track is not part of it, it never changes.
+        """
+        num_players = len(self.players)
+        return CircuitState(self._positions[:num_players].copy(),
+                            self._velocities[:num_players].copy(),
+                            self._get_rng_state())
+
+    def restore(self, state: CircuitState) -> None:
+        """
+        Go back to the state of a ``snapshot`` of this circuit (or of one of
+        its clones)
+        """
+        assert len(state.positions) == len(self.players)
+        self._positions[:len(self.players)] = state.positions
+        self._velocities[:len(self.players)] = state.velocities
+        if self._rng is None:
+            self._rng_state = state.rng_state
+        else:
+            self._rng.bit_generator.state = state.rng_state
+        self._rebuild_spatial_hash()
+
+    def clone(self) -> 'Circuit':
+        """
+        An independent copy of the circuit, sharing the (immutable) track
+        """
+        # not ``copy.copy``, this is faster
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._positions = self._positions.copy()
+        clone._velocities = self._velocities.copy()
+        clone.players = [
+            Player(ind, pos, vel) for ind, pos, vel in zip(
+                range(len(self.players)), clone._positions, clone._velocities)
+        ]
+        clone._rng = None
+        clone._rng_state = self._get_rng_state()
+        clone._player_at = {
+            pos: clone.players[player.ind]
+            for pos, player in self._player_at.items()
+        }
+        clone._buckets = {
+            bucket: players.copy()
+            for bucket, players in self._buckets.items()
+        }
+        return clone
+
+    def _random(self) -> np.random.Generator:
+        if self._rng is None:
+            self._rng = np.random.default_rng()
+            self._rng.bit_generator.state = self._rng_state
+        return self._rng
+
+    def _get_rng_state(self) -> dict:
+        if self._rng is None:
+            return self._rng_state
+        return self._rng.bit_generator.state
+
+    def _rebuild_spatial_hash(self) -> None:
+        self._player_at.clear()
+        self._buckets.clear()
+        for player in self.players:
+            x, y = player.pos.tolist()
+            if x >= 0:  # has been placed on the track
+                self._player_at[x, y] = player
+                bucket = (x // self.BUCKET_SIZE, y // self.BUCKET_SIZE)
+                self._buckets.setdefault(bucket, {})[player.ind] = (x, y)
+
     def valid_line(self, pos1, pos2) -> bool:
+        counters = self.counters
+        if counters is not None:
+            counters['valid_line_calls'] += 1
         if (np.any(pos1 < 0) or np.any(pos2 < 0)
                 or np.any(pos1 >= self.track.shape)
                 or np.any(pos2 >= self.track.shape)):
@@ -219,6 +353,8 @@ class Circuit:
                 y = pos1[1] + i*slope*d
                 y_ceil = np.ceil(y).astype(int)
                 y_floor = np.floor(y).astype(int)
+                if counters is not None:
+                    counters['cells_checked'] += 1
                 if (not self.track[x, y_ceil].traversable()
                         and not self.track[x, y_floor].traversable()):
                     return False
@@ -232,6 +368,8 @@ class Circuit:
                 y = pos1[1] + i*d
                 x_ceil = np.ceil(x).astype(int)
                 x_floor = np.floor(x).astype(int)
+                if counters is not None:
+                    counters['cells_checked'] += 1
                 if (not self.track[x_ceil, y].traversable()
                         and not self.track[x_floor, y].traversable()):
                     return False
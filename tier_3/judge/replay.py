@@ -32,6 +32,13 @@ class PlayerStep:
     status: str = ''
     dx: Optional[int] = None
     dy: Optional[int] = None
+    #: the timing (in seconds) of the reply, see ``judge.ReplyTiming``: the
+    #: same reply times as the judge prints, and the transport time is the
+    #: reply time minus the compute time; ``None`` for the steps without a
+    #: reply (e.g., penalties)
+    reply_time: Optional[float] = None
+    compute_time: Optional[float] = None
+    transport_time: Optional[float] = None
 
     def __post_init__(self):
         if self.success:
@@ -0,0 +1,198 @@
+"""
+Resource usage of the bots, read from ``/proc`` (Linux only), see the
+``--resource_interval`` option of client_bridge.py; and the limits of the
+bots: the CPUs they run on, their niceness and their rlimits (see the
+``--cpus`` option and the next ones).
+
+The limits are set before the bot runs: the bridge starts the bots through
+this file (``python resources.py LIMITS -- COMMAND...``, see
+``limited_command``), which sets them on itself and then executes the bot;
+the zygote sets them in its children.
+
+This file is shared by the judge and the bridge, keep the copies identical.
+"""
+import os
+import sys
+import json
+
+try:
+    import resource
+except ImportError:
+    # not on Windows, the rlimits cannot be set there
+    resource = None  # type: ignore
+
+from typing import Any, NamedTuple, Optional
+
+#: unit of the CPU times in ``/proc/<pid>/stat``
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def parse_cpus(cpus: str) -> set[int]:
+    """
+    Parse a list of CPUs such as "0-3,6" (as taskset -c takes them), see
+    the ``--cpus`` options of the judge and of the bridge
+    """
+    result: set[int] = set()
+    for part in cpus.split(','):
+        first, _, last = part.partition('-')
+        result.update(range(int(first), int(last or first) + 1))
+    return result
+
+class Limits(NamedTuple):
+    #: CPUs to run on
+    cpus: Optional[set[int]] = None
+    #: niceness, see ``os.setpriority``
+    nice: Optional[int] = None
+    #: CPU time (in seconds) before the process gets SIGXCPU (RLIMIT_CPU)
+    cpu_time: Optional[int] = None
+    #: size of the address space in bytes (RLIMIT_AS)
+    memory: Optional[int] = None
+
+    def to_json(self) -> dict[str, Any]:
+        limits = self._asdict()
+        if self.cpus is not None:
+            limits['cpus'] = sorted(self.cpus)
+        return limits
+
+    @classmethod
+    def from_json(cls, limits: dict[str, Any]) -> 'Limits':
+        if limits.get('cpus') is not None:
+            limits = {**limits, 'cpus': set(limits['cpus'])}
+        return cls(**limits)
+
+#: exit status of the bots whose limits could not be set (as env(1) exits
+#: when it fails)
+LIMITS_FAILED = 125
+
+def _threads(pid: int) -> list[int]:
+    try:
+        return [int(tid) for tid in os.listdir(f'/proc/{pid}/task')]
+    except OSError:
+        return [pid]
+
+def apply_limits(pid: int, limits: Limits) -> None:
+    """
+    Apply ``limits`` to the running process ``pid``. The affinity and the
+    niceness are set for every thread (they are per thread on Linux), the
+    threads started later inherit them. Raises ``OSError`` if the limits
+    cannot be set.
+
+    The threads started meanwhile may be missed and the memory already
+    mapped is not limited: limit the bots before they run, see
+    ``limited_command``.
+    """
+    if limits.cpus is not None or limits.nice is not None:
+        for tid in _threads(pid):
+            if limits.cpus is not None:
+                os.sched_setaffinity(tid, limits.cpus)
+            if limits.nice is not None:
+                os.setpriority(os.PRIO_PROCESS, tid, limits.nice)
+    if resource is None and (limits.cpu_time is not None
+                             or limits.memory is not None):
+        raise OSError('Resource limits are not supported on this platform.')
+    if limits.cpu_time is not None:
+        # SIGKILL one second after SIGXCPU
+        resource.prlimit(pid, resource.RLIMIT_CPU,
+                         (limits.cpu_time, limits.cpu_time + 1))
+    if limits.memory is not None:
+        resource.prlimit(pid, resource.RLIMIT_AS,
+                         (limits.memory, limits.memory))
+
+def limited_command(command: list[str], limits: Limits) -> list[str]:
+    """
+    ``command``, started with ``limits`` set (``command`` itself if there
+    are none). If they cannot be set, it exits with ``LIMITS_FAILED``.
+    """
+    if limits == Limits():
+        return command
+    return [
+        sys.executable,
+        os.path.abspath(__file__),
+        json.dumps(limits.to_json()), '--', *command
+    ]
+
+class Usage(NamedTuple):
+    #: user and system CPU time, in seconds
+    cpu_time: float
+    #: resident set size and its peak, in bytes
+    rss: int
+    peak_rss: int
+
+def read_usage(pid: int) -> Optional[Usage]:
+    """
+    The usage of process ``pid`` (not of its children), ``None`` if it is
+    gone or there is no ``/proc``
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            status = f.read()
+    except OSError:
+        return None
+    # the fields after the command name (which may contain spaces), from the
+    # third one (the state); utime and stime are the 14th and the 15th
+    fields = stat[stat.rindex(b')') + 2:].split()
+    cpu_time = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    memory = {}
+    for line in status.splitlines():
+        if line.startswith((b'VmRSS:', b'VmHWM:')):
+            key, value, _ = line.split()
+            memory[key] = int(value) * 1024
+    # zombies have no memory
+    return Usage(cpu_time, memory.get(b'VmRSS:', 0), memory.get(b'VmHWM:', 0))
+
+class UsageTracker:
+    """
+    The usage of a bot over the match, summed over its processes if it is
+    restarted between the races
+    """
+
+    def __init__(self) -> None:
+        self.cpu_time = 0.
+        self.rss = 0
+        self.peak_rss = 0
+        self.samples = 0
+        self._pid: Optional[int] = None
+        # CPU time of the previous processes, and of the current one
+        self._previous_cpu_time = 0.
+        self._current_cpu_time = 0.
+
+    def sample(self, pid: int) -> bool:
+        """
+        Read the usage of the bot's current process ``pid``, returns whether
+        it could be read
+        """
+        usage = read_usage(pid)
+        if usage is None:
+            return False
+        if pid != self._pid:
+            self._previous_cpu_time += self._current_cpu_time
+            self._pid = pid
+        self._current_cpu_time = usage.cpu_time
+        self.cpu_time = self._previous_cpu_time + usage.cpu_time
+        if usage.rss:
+            self.rss = usage.rss
+        self.peak_rss = max(self.peak_rss, usage.peak_rss)
+        self.samples += 1
+        return True
+
+    def report(self) -> dict[str, Any]:
+        return {
+            'cpu_time': self.cpu_time,
+            'rss': self.rss,
+            'peak_rss': self.peak_rss
+        }
+
+def main():
+    # see ``limited_command``
+    limits, separator, *command = sys.argv[1:]
+    assert separator == '--' and command, 'Usage: LIMITS -- COMMAND...'
+    try:
+        apply_limits(os.getpid(), Limits.from_json(json.loads(limits)))
+    except OSError as e:
+        print(f'Failed to limit the bot: {e}', file=sys.stderr)
+        sys.exit(LIMITS_FAILED)
+    os.execvp(command[0], command)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import itertools
-from pprint import pprint
+import time
+from pprint import pformat
 import numpy as np
 import grid_race_env
 import judge
@@ -10,6 +11,12 @@ from typing import Optional, Callable
 class GridRaceEnv(judge.EnvironmentBase):
 
     INVALID_ACTION_PENALTY = 5
+    #: capability of bots that want only the newly visible cells, see
+    #: ``observation``
+    DELTA_CAPABILITY = 'delta'
+    #: capability of bots that want only the players within the visibility
+    #: radius, see ``observation``
+    VISIBLE_PLAYERS_CAPABILITY = 'visible_players'
 
     def __init__(self,
                  num_players: int,
@@ -21,23 +28,65 @@ class GridRaceEnv(judge.EnvironmentBase):
         self.visibility_radius = visibility_radius
         self.circuit = circuit
         self._player_names = None
+        self._delta_players: set[int] = set()
+        self._visible_players_only: set[int] = set()
         for _ in range(num_players):
             self.circuit.add_new_player()
+        to_int = np.vectorize(lambda c: c.value)
+        self._track_int = to_int(self.circuit.track)
+        # shared by the replays of all races, they are only serialised
+        self._replay_track = self._track_int.tolist()
+        # walls around the track, so that windows never leave the array
+        self._padded_track = np.pad(
+            self._track_int,
+            visibility_radius,
+            constant_values=grid_race_env.CellType.WALL.value)
+        offsets = np.arange(-visibility_radius, visibility_radius + 1)
+        self._window_visible = (offsets[:, np.newaxis]**2
+                                + offsets[np.newaxis, :]**2
+                                <= visibility_radius**2)
+
+    def set_capabilities(self, capabilities: list[frozenset[str]]) -> None:
+        self._delta_players = {
+            p for p, c in enumerate(capabilities)
+            if self.DELTA_CAPABILITY in c
+        }
+        self._visible_players_only = {
+            p for p, c in enumerate(capabilities)
+            if self.VISIBLE_PLAYERS_CAPABILITY in c
+        }
+
+    def initial_observation(self, player: int, observation: str) -> str:
+        """
+        The capabilities granted to ``player`` are listed after the numbers
+        of the first line, so that its bot knows which observations it gets
+        (judges that do not grant them send the numbers only)
+        """
+        granted = [
+            capability for capability, players in [
+                (self.DELTA_CAPABILITY, self._delta_players),
+                (self.VISIBLE_PLAYERS_CAPABILITY, self._visible_players_only),
+            ] if player in players
+        ]
+        return ' '.join([observation, *granted])
 
     def reset(self, player_names: Optional[list[str]] = None) -> str:
         self._player_names = player_names
         self.circuit.reset_players()
+        self.circuit.counters = (self.metrics.counters
+                                 if self.metrics is not None else None)
         # score for not finishing is max turns + 1
         self.scores = [self.max_turns + 1] * self.num_players
         self.turns = 0
         self.penalties = [None for _ in range(self.num_players)]
         # extra player signalling end of turn
         self.players_iterator = itertools.cycle(range(self.num_players + 1))
-        to_int = np.vectorize(lambda c: c.value)
-        track_int = to_int(self.circuit.track)
+        # cells already sent to the players receiving delta observations
+        self._seen = np.zeros((self.num_players, *self.circuit.shape),
+                              dtype=bool)
         self.replay = replay.Replay(
             env_info=replay.EnvInfo(
-                track=track_int.tolist(),
+                track=self._replay_track,
                 num_players=self.num_players,
                 player_names=self._player_names),
             states=[],
@@ -54,8 +103,20 @@ class GridRaceEnv(judge.EnvironmentBase):
         """
         Saves a step, and immediately saves the resulting state as well.
         """
+        tick = time.perf_counter()
         self.replay.steps.append(step)
         self.replay.states.append(self._save_state())
+        if self.metrics is not None:
+            self.metrics.record('replay', step.player_ind,
+                                time.perf_counter() - tick)
+
+    def _reply_timing(self) -> dict[str, Optional[float]]:
+        """
+        The timing of the current player's reply, for its ``PlayerStep``
+        """
+        if self.reply_timing is None:
+            return {}
+        return self.reply_timing._asdict()
 
     def _save_state(self) -> replay.State:
         players = [
@@ -81,7 +142,8 @@ class GridRaceEnv(judge.EnvironmentBase):
                 if next_player == self.num_players:
                     self.turns += 1
                     if self.turns >= self.max_turns:
-                        print(f'Reached max turn limit ({self.turns}).')
+                        print(f'{self.log_prefix}Reached max turn limit '
+                              f'({self.turns}).')
                         return None
                     # skip the sentinel player indicating turn's end
                     continue
@@ -121,34 +183,71 @@ class GridRaceEnv(judge.EnvironmentBase):
 
         Can be a multiline string, in which case lines should be separarated by
         "\n"s. The final newline will be appended.
+
+        Players with the ``DELTA_CAPABILITY`` get the cells that became visible
+        since their previous observations instead of the whole window, see
+        ``_delta_map``.
+
+        Players with the ``VISIBLE_PLAYERS_CAPABILITY`` get the number of
+        players within the visibility radius (including themselves), then
+        "index x y" for each of them, instead of the positions of all players.
         """
         current_player_obj = self.circuit.players[current_player]
-        local_map = np.zeros(
-            (2 * self.visibility_radius + 1, 2 * self.visibility_radius + 1),
-            dtype=int)
-        for r in range(2 * self.visibility_radius + 1):
-            for c in range(2 * self.visibility_radius + 1):
-                x = current_player_obj.pos[0] + r - self.visibility_radius
-                y = current_player_obj.pos[1] + c - self.visibility_radius
-                if (np.linalg.norm(
-                        np.array([x, y]) - current_player_obj.pos, ord=2)
-                        > self.visibility_radius):
-                    local_map[r, c] = grid_race_env.CellType.NOT_VISIBLE.value
-                elif (not (0 <= x < self.circuit.shape[0])
-                      or not (0 <= y < self.circuit.shape[1])):
-                    local_map[r, c] = grid_race_env.CellType.WALL.value
-                else:
-                    local_map[r, c] = self.circuit.track[x, y].value
-        # TODO check this
-        local_map_str = '\n'.join(
-            ' '.join(map(str, line)) for line in local_map)
-        player_pos = [f'{p.pos[0]} {p.pos[1]}' for p in self.circuit.players]
+        if current_player in self._delta_players:
+            local_map_str = self._delta_map(current_player)
+        else:
+            x, y = current_player_obj.pos
+            size = 2*self.visibility_radius + 1
+            local_map = self._padded_track[x:x + size, y:y + size].copy()
+            local_map[~self._window_visible] = (
+                grid_race_env.CellType.NOT_VISIBLE.value)
+            local_map_str = '\n'.join(
+                ' '.join(map(str, line)) for line in local_map.tolist())
+        if current_player in self._visible_players_only:
+            visible = self.circuit.players_within(current_player_obj.pos,
+                                                  self.visibility_radius)
+            player_pos = [str(len(visible))] + [
+                f'{p.ind} {p.pos[0]} {p.pos[1]}' for p in visible
+            ]
+        else:
+            player_pos = [
+                f'{p.pos[0]} {p.pos[1]}' for p in self.circuit.players
+            ]
         current_player_info = (
             f'{current_player_obj.pos[0]} {current_player_obj.pos[1]} '
             f'{current_player_obj.vel[0]} {current_player_obj.vel[1]}')
         return (current_player_info + '\n' + '\n'.join(player_pos) + '\n'
                 + local_map_str)
 
+    def _delta_map(self, player: int) -> str:
+        """
+        Cells of the track that became visible for ``player`` since its
+        previous observations: the number of runs, then one line per run of
+        consecutive cells in a row, "x y v1 v2 ..." where "x y" is the first
+        cell of the run. Cells outside the track are never sent.
+        """
+        pos = self.circuit.players[player].pos
+        r = self.visibility_radius
+        height, width = self.circuit.shape
+        x0, x1 = max(pos[0] - r, 0), min(pos[0] + r + 1, height)
+        y0, y1 = max(pos[1] - r, 0), min(pos[1] + r + 1, width)
+        visible = self._window_visible[x0 - pos[0] + r:x1 - pos[0] + r,
+                                       y0 - pos[1] + r:y1 - pos[1] + r]
+        seen = self._seen[player, x0:x1, y0:y1]
+        new = visible & ~seen
+        seen |= new  # a view, so this updates ``self._seen``
+        runs = []
+        for i in np.flatnonzero(new.any(axis=1)):
+            # a run starts where the row switches to new, and ends where it
+            # switches back
+            edges = np.flatnonzero(
+                np.diff(np.concatenate(([0], new[i], [0])).astype(np.int8)))
+            values = self._track_int[x0 + i, y0:y1]
+            for start, end in zip(edges[::2], edges[1::2]):
+                runs.append(f'{x0 + i} {y0 + start} '
+                            + ' '.join(map(str, values[start:end].tolist())))
+        return '\n'.join([str(len(runs))] + runs)
+
     def read_player_input(
             self, read_line: Callable[[], str]) -> Optional[judge.PlayerInput]:
         """
@@ -188,15 +287,16 @@ class GridRaceEnv(judge.EnvironmentBase):
         else:
             player_name = current_player
         if not disqualified:
-            print(f'Yoohoo! Player {player_name} sent something naughty! '
-                  'I will pretend it didn\'t happen, but they may be '
-                  'disqualified in the future.')
+            print(f'{self.log_prefix}Yoohoo! Player {player_name} sent '
+                  'something naughty! I will pretend it didn\'t happen, but '
+                  'they may be disqualified in the future.')
         self._save_step(
             replay.PlayerStep(
                 current_player,
                 status='Disqualified'
                 if disqualified else 'Invalid input or timeout.',
-                success=False))
+                success=False,
+                **self._reply_timing()))
 
     def step(self, current_player: int,
              player_input: judge.PlayerInput) -> None:
@@ -210,7 +310,11 @@ class GridRaceEnv(judge.EnvironmentBase):
                                                    np.array([dx, dy]))
             dx, dy = final_delta
             player_step = replay.PlayerStep(
-                current_player, success=True, dx=dx, dy=dy)
+                current_player,
+                success=True,
+                dx=dx,
+                dy=dy,
+                **self._reply_timing())
         except grid_race_env.InvalidMove:
             # Penalty and set velocity to 0
             self.penalties[current_player] = self.INVALID_ACTION_PENALTY
@@ -218,7 +322,8 @@ class GridRaceEnv(judge.EnvironmentBase):
             player_step = replay.PlayerStep(
                 current_player,
                 success=False,
-                status=f'Invalid move: ({dx}, {dy}).')
+                status=f'Invalid move: ({dx}, {dy}).',
+                **self._reply_timing())
         if self.circuit.player_won(current_player):
             self.scores[current_player] = self.turns
         self._save_step(player_step)
@@ -233,22 +338,57 @@ class GridRaceEnv(judge.EnvironmentBase):
     def num_players(self):
         return self._num_players
 
-def run_judge():
-    app = judge.App('Grid Race Tier 3')
-    options = app.options
-    circuit = grid_race_env.load_track_from_file(options['track_file'])
-    env = GridRaceEnv(options['num_players'], options['visibility_radius'],
-                      circuit, options['max_turns'])
-    scores = app.run_environment(env, print_replay_times=True)
+def create_environment(options: dict,
+                       circuit: grid_race_env.Circuit) -> GridRaceEnv:
+    return GridRaceEnv(options['num_players'], options['visibility_radius'],
+                       circuit, options['max_turns'])
+
+def report_results(app: judge.App,
+                   env: GridRaceEnv,
+                   scores: list[int | float],
+                   match_id: Optional[str] = None,
+                   prefix: str = '') -> None:
+    """
+    ``prefix`` the printed scores, e.g., with ``judge.log_prefix``
+    """
     if env.player_names:
-        print('Final scores:')
-        pprint(dict(zip(env.player_names, scores)), sort_dicts=False)
+        print(prefix + 'Final scores:\n' + '\n'.join(
+            prefix + line for line in pformat(
+                dict(zip(env.player_names, scores)),
+                sort_dicts=False).splitlines()))
     else:
-        print('Final scores:', scores)
+        print(f'{prefix}Final scores:', scores)
     if app.create_replay:
-        with app.replay_file() as f:
+        with app.replay_file(match_id) as f:
             replay.serialise(env.replay, f)
-    app.write_output(scores)
+    app.write_output(scores, match_id)
+
+def run_judge():
+    app = judge.App('Grid Race Tier 3')
+    options = app.options
+    if app.serve:
+        circuit = grid_race_env.load_track_from_file(options['track_file'])
+        # Every match gets its own ``Circuit`` (players are mutable), but the
+        # loaded track is shared between them
+        def match_finished(match_id: str, runner: judge.EnvironmentRunner,
+                           scores: list[int | float]) -> None:
+            app.print_reply_times(runner, True)
+            report_results(app, runner.env, scores, match_id,
+                           judge.log_prefix(match_id))
+
+        app.serve_environments(
+            lambda: create_environment(options, type(circuit)()),
+            match_finished)
+        return
+    # Loading the track and the precomputations of the environment overlap
+    # with waiting for the players to connect
+    env = judge.prepare_in_background(lambda: create_environment(
+        options, grid_race_env.load_track_from_file(options['track_file'])))
+    app.run_environment(
+        env,
+        print_replay_times=True,
+        race_finished=lambda race_id, scores: report_results(
+            app, env.result(), scores, race_id))
 
 if __name__ == "__main__":
     run_judge()
@@ -40,12 +40,22 @@ class Screen:
     FONT_SIZE = 30
     FONT_COLOUR = pygame.Color(255, 255, 255)
     BACKGROUND_COLOUR = pygame.Color('black')
+    #: the strip chart of the reply times of the steps, under the track
+    LATENCY_CHART_HEIGHT = 60
+    LATENCY_CHART_COLOUR = pygame.Color(40, 40, 40)
+    #: height of the marks above the slow replies
+    SLOW_MARK_HEIGHT = 5
+    SLOW_REPLY_COLOUR = pygame.Color('red')
+    #: by default, the slowest 5% of the replies are highlighted
+    SLOW_REPLY_QUANTILE = 0.95
 
     def __init__(self,
                  env_info: replay.EnvInfo,
                  cell_size: int,
                  visibility_radius: Optional[int],
-                 should_draw_fog: bool = True):
+                 should_draw_fog: bool = True,
+                 steps: Optional[list[replay.PlayerStep]] = None,
+                 slow_reply_time: Optional[float] = None):
         track_width = len(env_info.track[0])
         track_height = len(env_info.track)
         self.track_cell_size = cell_size
@@ -57,6 +67,11 @@ class Screen:
             + track_height * self.track_cell_size  # track
             + 2 * self.FONT_SIZE  # status lines
         )
+        self.steps = steps or []
+        self.has_reply_times = any(
+            s.reply_time is not None for s in self.steps)
+        if self.has_reply_times:
+            height += self.MARGIN + self.LATENCY_CHART_HEIGHT
         self.screen = pygame.display.set_mode((width, height),
                                               flags=pygame.RESIZABLE)
         self.font = pygame.font.SysFont('', self.FONT_SIZE)
@@ -66,6 +81,8 @@ class Screen:
         else:
             self.player_names = [str(i) for i in range(env_info.num_players)]
         self._draw_track_first(env_info)
+        if self.has_reply_times:
+            self._draw_latency_chart_first(slow_reply_time)
         self.should_draw_fog = should_draw_fog
         self.visibility_radius = visibility_radius
         self.env_info = env_info
@@ -145,6 +162,60 @@ class Screen:
 
         self.track_surface.blit(grid_surface, (0, 0))
 
+    def _draw_latency_chart_first(self,
+                                  slow_reply_time: Optional[float]) -> None:
+        """
+        One bar per step, as high as its reply time (in the colour of the
+        player), the replies slower than ``slow_reply_time`` are marked
+        above their bars
+        """
+        width = self.track_surface.get_width()
+        height = self.LATENCY_CHART_HEIGHT
+        self.latency_surface = pygame.Surface((width, height))
+        self.latency_surface.fill(self.LATENCY_CHART_COLOUR)
+        reply_times = sorted(
+            s.reply_time for s in self.steps if s.reply_time is not None)
+        self.max_reply_time = reply_times[-1]
+        if slow_reply_time is None:
+            slow_reply_time = reply_times[int(self.SLOW_REPLY_QUANTILE
+                                              * (len(reply_times) - 1))]
+        bar_area = height - self.SLOW_MARK_HEIGHT
+        for i, step in enumerate(self.steps):
+            if step.reply_time is None:
+                continue
+            left = self._chart_x(i)
+            bar_width = max(self._chart_x(i + 1) - left, 1)
+            bar_height = max(
+                round(step.reply_time / self.max_reply_time * bar_area), 1)
+            pygame.draw.rect(
+                self.latency_surface, self.PLAYER_COLOURS[step.player_ind],
+                pygame.Rect(left, height - bar_height, bar_width, bar_height))
+            if step.reply_time > slow_reply_time:
+                pygame.draw.rect(
+                    self.latency_surface, self.SLOW_REPLY_COLOUR,
+                    pygame.Rect(left, 0, bar_width, self.SLOW_MARK_HEIGHT))
+
+    def _chart_x(self, step_ind: int) -> int:
+        return round(step_ind * self.track_surface.get_width()
+                     / len(self.steps))
+
+    def draw_latency_chart(self, step_ind: Optional[int]) -> None:
+        """
+        Draw the latency chart, with a cursor on the bar of the last step
+        (``step_ind``) and the longest reply time
+        """
+        y = (4 * self.MARGIN + self.track_height + 2 * self.FONT_SIZE)
+        self.screen.blit(self.latency_surface, (self.MARGIN, y))
+        if step_ind is not None:
+            x = self.MARGIN + self._chart_x(step_ind)
+            pygame.draw.line(self.screen, self.FONT_COLOUR, (x, y),
+                             (x, y + self.LATENCY_CHART_HEIGHT - 1))
+        label = self.font.render(f'max: {self.max_reply_time * 1000:.1f} ms',
+                                 True, self.FONT_COLOUR)
+        self.screen.blit(
+            label, (self.MARGIN + self.latency_surface.get_width()
+                    - label.get_width(), y + self.SLOW_MARK_HEIGHT))
+
     def draw_fog(self, player: replay.PlayerState) -> None:
         height = len(self.env_info.track)
         width = len(self.env_info.track[0])
@@ -259,6 +330,8 @@ class Screen:
             else:
                 step_text = (
                     f'last move: dx: {last_step.dx} dy: {last_step.dy}')
+            if last_step.reply_time is not None:
+                step_text += f' (reply: {last_step.reply_time * 1000:.1f} ms)'
             player_legend = self.font.render(
                 f'Player {self.player_names[last_step.player_ind]}: ', True,
                 self.PLAYER_COLOURS[last_step.player_ind],
@@ -275,7 +348,8 @@ class Screen:
                  last_state: Optional[replay.State],
                  last_step: Optional[replay.PlayerStep],
                  next_player: Optional[replay.PlayerState],
-                 max_t: Optional[str | int] = None) -> None:
+                 max_t: Optional[str | int] = None,
+                 step_ind: Optional[int] = None) -> None:
         self.screen.fill(self.BACKGROUND_COLOUR)
         self.draw_track()
         if self.should_draw_fog and next_player:
@@ -290,16 +364,22 @@ class Screen:
         else:
             turn = str(state.turn)
         self.print_info(turn, last_step)
+        if self.has_reply_times:
+            self.draw_latency_chart(step_ind)
 
-def app(history: replay.Replay, cell_size: int,
-        visibility_radius: Optional[int]):
+def app(history: replay.Replay,
+        cell_size: int,
+        visibility_radius: Optional[int],
+        slow_reply_time: Optional[float] = None):
     pygame.init()
     pygame.display.set_caption('Grid race')
     screen = Screen(
         history.env_info,
         cell_size,
         visibility_radius,
-        should_draw_fog=visibility_radius is not None)
+        should_draw_fog=visibility_radius is not None,
+        steps=history.steps,
+        slow_reply_time=slow_reply_time)
     clock = pygame.time.Clock()
     running = True
     t = 0
@@ -344,7 +424,7 @@ def app(history: replay.Replay, cell_size: int,
             next_player = None
 
         screen.draw_all(history.states[t], last_state, last_step, next_player,
-                        max_turns)
+                        max_turns, t - 1 if t > 0 else None)
 
         pygame.display.flip()
         clock.tick(60)
@@ -364,6 +444,12 @@ def parse_args() -> argparse.Namespace:
         help='Size (in pixels) of the cells in the visualisation.')
     parser.add_argument(
         '--visibility_radius', type=int, help='Visibility radius (optional).')
+    parser.add_argument(
+        '--slow_reply_time',
+        type=float,
+        help='Replies slower than this (in seconds) are highlighted in the '
+        'latency chart (optional, the slowest 5%% of the replies by '
+        'default).')
     return parser.parse_args()
 
 def main():
@@ -371,7 +457,7 @@ def main():
     history = replay.deserialise(args.replay_file, allow_extra_keys=True)
     assert history.version >= 1, (
         f'Replay file version ({history.version}) is too old.')
-    app(history, args.cell_size, args.visibility_radius)
+    app(history, args.cell_size, args.visibility_radius, args.slow_reply_time)
 
 if __name__ == "__main__":
     main()